@@ -0,0 +1,60 @@
+# Generated by Django 5.2.8 on 2026-10-19 13:31
+
+import django.db.models.functions.text
+from django.db import migrations, models
+from django.db.models.functions import Lower
+
+
+def resolve_case_duplicates(apps, schema_editor):
+    """
+    Accounts whose email or username differ only in case would stop the
+    constraints below from being created. For each email, the account that
+    can log in (active, verified, most recently used, then oldest) keeps it;
+    the others get "<local>+duplicate-<id>@<domain>" so they can still be
+    found and merged by hand. Later usernames get "-<id>" appended.
+    """
+    User = apps.get_model("account", "User")
+    users = User.objects.annotate(email_ci=Lower("email"), username_ci=Lower("username"))
+
+    duplicates = (
+        users.values("email_ci").annotate(n=models.Count("id")).filter(n__gt=1).values_list("email_ci", flat=True)
+    )
+    for email in list(duplicates):
+        accounts = users.filter(email_ci=email).order_by(
+            "-is_active", "-is_verified", models.F("last_login").desc(nulls_last=True), "id",
+        )
+        for user in accounts[1:]:
+            local, _, domain = user.email.partition("@")
+            user.email = f"{local}+duplicate-{user.id}@{domain}".lower()
+            user.save(update_fields=["email"])
+
+    email_users = users.filter(registration_method="email", username__isnull=False)
+    duplicates = (
+        email_users.values("username_ci").annotate(n=models.Count("id")).filter(n__gt=1)
+        .values_list("username_ci", flat=True)
+    )
+    for username in list(duplicates):
+        for user in email_users.filter(username_ci=username).order_by("id")[1:]:
+            suffix = f"-{user.id}"
+            user.username = user.username[:50 - len(suffix)] + suffix
+            user.save(update_fields=["username"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account', '0001_initial'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.RunPython(resolve_case_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='user',
+            constraint=models.UniqueConstraint(django.db.models.functions.text.Lower('email'), name='account_user_email_ci_uniq'),
+        ),
+        migrations.AddConstraint(
+            model_name='user',
+            constraint=models.UniqueConstraint(django.db.models.functions.text.Lower('username'), condition=models.Q(('registration_method', 'email')), name='account_user_username_ci_uniq'),
+        ),
+    ]
@@ -1,5 +1,7 @@
 from django.contrib.auth.models import AbstractUser, BaseUserManager
 from django.db import models
+from django.db.models import Q
+from django.db.models.functions import Lower
 from django.utils.translation import gettext_lazy as _
 
 
@@ -41,6 +43,10 @@ class UserManager(BaseUserManager):
 
         return self._create_user(email, password, **extra_fields)
 
+    def get_by_natural_key(self, email):
+        """Case-insensitive email lookup, served by the lower(email) unique index."""
+        return self.alias(email_ci=Lower("email")).get(email_ci=email.lower())
+
 REGISTRATION_CHOICES = [
     ('email', 'Email'),
     ('google', 'Google')
@@ -57,6 +63,18 @@ class User(AbstractUser):
 
     registration_method = models.CharField(max_length=20, choices=REGISTRATION_CHOICES, default='email')
 
+    class Meta(AbstractUser.Meta):
+        constraints = [
+            # registration relies on these instead of probing with exists() first
+            models.UniqueConstraint(Lower("email"), name="account_user_email_ci_uniq"),
+            # google accounts take the first name as username, so only email sign-ups are unique
+            models.UniqueConstraint(
+                Lower("username"),
+                condition=Q(registration_method="email"),
+                name="account_user_username_ci_uniq",
+            ),
+        ]
+
 
     # Custom user manager
     objects = UserManager() #Connects this User model to your custom UserManagerere.
\ No newline at end of file
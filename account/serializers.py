@@ -7,6 +7,7 @@ from utils.jwt_token import token_generator
 from django.core.exceptions import ValidationError as DjangoValidationError
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 from rest_framework import exceptions
+from django.db import IntegrityError, transaction
 
 
 User = get_user_model()
@@ -40,21 +41,25 @@ class RegisterSerializer(serializers.ModelSerializer):
         email = validated_attrs.get("email").lower()
         username = validated_attrs.get("username")
 
-        user = User.objects.filter(email=email).first()
-
-        if user:
+        # The case-insensitive unique constraints on email/username do the
+        # duplicate checks, so the happy path is a single INSERT
+        try:
+            with transaction.atomic():
+                user = User.objects.create_user(
+                    username=username,
+                    email=email,
+                    password=validated_attrs["password"],
+                )
+        except IntegrityError:
+            # Which constraint failed isn't portable across backends' error
+            # text; if nobody has the email, it was the username
+            try:
+                user = User.objects.get_by_natural_key(email)
+            except User.DoesNotExist:
+                raise serializers.ValidationError({"error": "Username already taken"})
             if not user.is_active:
                 raise serializers.ValidationError({"error": "Your account is inactive"})
-            else:
-                raise serializers.ValidationError({"error": "Email already registered"})
-        if User.objects.filter(username=username).exists():
-            raise serializers.ValidationError({"error": "Username already taken"})
-
-        user = User.objects.create_user(
-            username=username,
-            email=email,
-            password=validated_attrs["password"],
-        )
+            raise serializers.ValidationError({"error": "Email already registered"})
 
         # Generate a jwt token for confirm email
         token = token_generator(user)
@@ -88,7 +93,7 @@ class ResendEmailVerificationSerializer(serializers.Serializer):
     def validate(self, attrs):
         email = attrs.get("email")
         try:
-            user = User.objects.get(email=email)
+            user = User.objects.get_by_natural_key(email)
         except User.DoesNotExist:
             raise serializers.ValidationError({"error": "User does not exist!"})
         if user.is_verified:
@@ -145,22 +150,20 @@ class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
             data = super().validate(attrs)
 
         except exceptions.AuthenticationFailed as auth_exc:
-            # identify the username/email field
-            username_field = getattr(User, "USERNAME_FIELD", "username")
-            identifier = attrs.get(username_field) or attrs.get("username") or attrs.get("email")
-
-            if identifier:
-                user = User.objects.filter(**{username_field: identifier}).first()
-                if user:
-                    # more specific messages
-                    if not user.is_active and not getattr(user, "is_verified", True):
-                        raise exceptions.AuthenticationFailed("User not verified")
-                    if not user.is_active:
-                        raise exceptions.AuthenticationFailed("User not verified")
-                    if not getattr(user, "is_verified", True):
-                        raise exceptions.AuthenticationFailed("User not verified")
-                    if user.registration_method == "google":
-                        raise exceptions.AuthenticationFailed("User Logged In Through Email")
+            # EmailBackend leaves the user it loaded on the request, so the
+            # more specific messages below cost no extra query
+            request = self.context.get("request")
+            user = getattr(request, "auth_candidate", None)
+            if user:
+                # more specific messages
+                if not user.is_active and not getattr(user, "is_verified", True):
+                    raise exceptions.AuthenticationFailed("User not verified")
+                if not user.is_active:
+                    raise exceptions.AuthenticationFailed("User not verified")
+                if not getattr(user, "is_verified", True):
+                    raise exceptions.AuthenticationFailed("User not verified")
+                if user.registration_method == "google":
+                    raise exceptions.AuthenticationFailed("User Logged In Through Email")
             # couldn't clarify: re-raise original (invalid credentials)
             raise auth_exc
 
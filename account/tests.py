@@ -1,3 +1,187 @@
-from django.test import TestCase
+import logging
+import uuid
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.test import TestCase, override_settings
+from rest_framework_simplejwt.token_blacklist.models import OutstandingToken
+
+from funiture import benchmark
+from utils.jwt_token import token_generator
+from utils.query_budget import QueryBudgetMixin
+
+User = get_user_model()
+
+PASSWORD = "Budget-pass-2024"
+
+# Most queries each endpoint may run, however many users and tokens exist
+QUERY_BUDGETS = {
+    "GET /api/accounts/api/auth/me": 1,
+    "POST /api/accounts/register": 4,
+    "GET /api/accounts/confirm_email/<token>": 2,
+    "POST /api/accounts/resend_confirm_email": 2,
+    "POST /api/accounts/reset_password": 2,
+    "POST /api/accounts/set_password/<token>": 2,
+    "POST /api/accounts/logout": 7,
+    "POST /api/accounts/google_login": 6,
+    "POST /api/accounts/jwt/token": 2,
+    "POST /api/accounts/jwt/token/refresh": 2,
+    "POST /api/accounts/jwt/token/verify": 1,
+    "POST /api/accounts/jwt/token/blacklist": 7,
+}
+
+
+@override_settings(PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"])
+class AccountQueryBudgetTests(QueryBudgetMixin, TestCase):
+    """Every account view with 5 and 500 other users, and as many tokens issued: no N+1"""
+
+    def setUp(self):
+        # sign-up and confirmation issue tokens to inactive users on purpose
+        logging.getLogger("rest_framework_simplejwt").setLevel(logging.ERROR)
+        self.enterContext(benchmark.offline())
+
+    def assertBudget(self, endpoint, prepare):
+        return self.assertQueryBudget(QUERY_BUDGETS[endpoint], prepare, endpoint)
+
+    def make_user(self, n, **fields):
+        """A user, plus n other users and n refresh tokens already issued to this one"""
+        password = make_password(PASSWORD)
+        User.objects.bulk_create(
+            User(email=f"{uuid.uuid4().hex[:12]}@example.com", password=password, is_active=True, is_verified=True)
+            for _ in range(n)
+        )
+        fields = {"is_active": True, "is_verified": True, **fields}
+        user = User.objects.create(email=f"{uuid.uuid4().hex[:12]}@example.com", password=password, **fields)
+        tokens = [token_generator(user) for _ in range(n)]
+        return user, tokens[-1] if tokens else token_generator(user)
+
+    def post(self, path, data=None):
+        return self.client.post(path, data or {}, content_type="application/json")
+
+    def test_me(self):
+        def prepare(n):
+            user, tokens = self.make_user(n)
+            self.client.cookies["access_token"] = tokens["access"]
+            return lambda: self.client.get("/api/accounts/api/auth/me")
+        self.assertBudget("GET /api/accounts/api/auth/me", prepare)
+
+    def test_register(self):
+        def prepare(n):
+            self.make_user(n)
+            email = f"{uuid.uuid4().hex[:12]}@example.com"
+            return lambda: self.post("/api/accounts/register", {
+                "username": email.split("@")[0], "email": email, "password": PASSWORD, "confirm_password": PASSWORD,
+            })
+        self.assertBudget("POST /api/accounts/register", prepare)
+
+    def test_confirm_email(self):
+        def prepare(n):
+            _, tokens = self.make_user(n, is_active=False, is_verified=False)
+            return lambda: self.client.get(f"/api/accounts/confirm_email/{tokens['access']}")
+        self.assertBudget("GET /api/accounts/confirm_email/<token>", prepare)
+
+    def test_resend_confirm_email(self):
+        def prepare(n):
+            user, _ = self.make_user(n, is_active=False, is_verified=False)
+            return lambda: self.post("/api/accounts/resend_confirm_email", {"email": user.email})
+        self.assertBudget("POST /api/accounts/resend_confirm_email", prepare)
+
+    def test_reset_password(self):
+        def prepare(n):
+            user, _ = self.make_user(n)
+            return lambda: self.post("/api/accounts/reset_password", {"email": user.email})
+        self.assertBudget("POST /api/accounts/reset_password", prepare)
+
+    def test_set_password(self):
+        def prepare(n):
+            _, tokens = self.make_user(n)
+            return lambda: self.post(f"/api/accounts/set_password/{tokens['access']}", {
+                "new_password": PASSWORD + "!", "confirm_new_password": PASSWORD + "!",
+            })
+        self.assertBudget("POST /api/accounts/set_password/<token>", prepare)
+
+    def test_logout(self):
+        def prepare(n):
+            _, tokens = self.make_user(n)
+            # the previous round's logout emptied the cookies; a browser would drop them
+            self.client.cookies.clear()
+            self.client.cookies["refresh_token"] = tokens["refresh"]
+            return lambda: self.post("/api/accounts/logout")
+        self.assertBudget("POST /api/accounts/logout", prepare)
+
+    def test_google_login(self):
+        def prepare(n):
+            self.make_user(n)
+            return lambda: self.post("/api/accounts/google_login", {"token": uuid.uuid4().hex[:12]})
+        self.assertBudget("POST /api/accounts/google_login", prepare)
+
+    def test_token(self):
+        def prepare(n):
+            user, _ = self.make_user(n)
+            return lambda: self.post("/api/accounts/jwt/token", {"email": user.email, "password": PASSWORD})
+        self.assertBudget("POST /api/accounts/jwt/token", prepare)
+
+    def test_token_refresh(self):
+        def prepare(n):
+            _, tokens = self.make_user(n)
+            self.client.cookies["refresh_token"] = tokens["refresh"]
+            return lambda: self.post("/api/accounts/jwt/token/refresh")
+        self.assertBudget("POST /api/accounts/jwt/token/refresh", prepare)
+
+    def test_token_verify(self):
+        def prepare(n):
+            _, tokens = self.make_user(n)
+            return lambda: self.post("/api/accounts/jwt/token/verify", {"token": tokens["access"]})
+        self.assertBudget("POST /api/accounts/jwt/token/verify", prepare)
+
+    def test_token_blacklist(self):
+        def prepare(n):
+            _, tokens = self.make_user(n)
+            return lambda: self.post("/api/accounts/jwt/token/blacklist", {"refresh": tokens["refresh"]})
+        self.assertBudget("POST /api/accounts/jwt/token/blacklist", prepare)
+        self.assertTrue(OutstandingToken.objects.filter(blacklistedtoken__isnull=False).exists())
+
+
+@override_settings(PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"])
+class RegistrationTests(TestCase):
+    """Emails and usernames are unique regardless of case"""
+
+    def setUp(self):
+        logging.getLogger("rest_framework_simplejwt").setLevel(logging.ERROR)
+        self.enterContext(benchmark.offline())
+
+    def register(self, email, username):
+        return self.client.post("/api/accounts/register", {
+            "username": username, "email": email, "password": PASSWORD, "confirm_password": PASSWORD,
+        }, content_type="application/json")
+
+    def test_duplicate_email(self):
+        self.assertEqual(self.register("taken@example.com", "first").status_code, 201)
+        User.objects.filter(email="taken@example.com").update(is_active=True)
+        response = self.register("Taken@Example.com", "second")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {"error": "Email already registered"})
+
+    def test_duplicate_username(self):
+        self.assertEqual(self.register("one@example.com", "Shared").status_code, 201)
+        response = self.register("two@example.com", "shared")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {"error": "Username already taken"})
+        self.assertFalse(User.objects.filter(email="two@example.com").exists())
+
+    def test_inactive_user(self):
+        self.assertEqual(self.register("pending@example.com", "pending").status_code, 201)
+        response = self.register("pending@example.com", "pending2")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {"error": "Your account is inactive"})
+
+    def test_login_ignores_email_case(self):
+        User.objects.create_user(
+            email="mixed@example.com", username="mixed", password=PASSWORD, is_active=True, is_verified=True,
+        )
+        response = self.client.post(
+            "/api/accounts/jwt/token", {"email": "MIXED@Example.com", "password": PASSWORD},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["user"]["email"], "mixed@example.com")
@@ -14,6 +14,7 @@ from utils.jwt_token import token_decoder
 
 from utils.email import EmailThread
 from utils.jwt_token import token_generator
+from core import metrics
 from .serializers import (
     RegisterSerializer,
     ResendEmailVerificationSerializer,
@@ -109,7 +110,7 @@ class ResetPasswordAPIView(APIView):
         if serializer.is_valid():
             email = serializer.validated_data["email"]
             try:
-                user: User = User.objects.get(email=email)
+                user: User = User.objects.get_by_natural_key(email)
                 
                 if not user.is_verified:
                     return Response(
@@ -298,10 +299,11 @@ class GoogleAuth(APIView):
         try:
             # Call Google userinfo endpoint with access_token
             userinfo_url = "https://www.googleapis.com/oauth2/v3/userinfo"
-            response = requests.get(
-                userinfo_url,
-                headers={"Authorization": f"Bearer {access_token}"}
-            )
+            with metrics.external_call("google"):
+                response = requests.get(
+                    userinfo_url,
+                    headers={"Authorization": f"Bearer {access_token}"}
+                )
 
             if response.status_code != 200:
                 return Response({"error": "Invalid Google access token", "status": False},
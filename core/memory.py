@@ -0,0 +1,259 @@
+"""
+Worker memory: RSS sampling, tracemalloc snapshots and a recycling ceiling.
+
+Each gunicorn worker runs a Sampler thread (started from gunicorn.conf.py)
+that every MEMORY_SAMPLE_INTERVAL seconds writes its RSS and thread count to
+MEMORY_DIR/worker_<pid>.json, keeping the last MEMORY_HISTORY samples, so
+whichever worker answers api/memory or /metrics reports all of them.
+
+Snapshots are taken by every worker at once: request_snapshot() leaves a
+marker that each sampler picks up on its next tick, dumping a tracemalloc
+snapshot to MEMORY_DIR/snapshot_<pid>_<label>.pickle. tracemalloc starts
+with a worker's first snapshot (or at boot with MEMORY_TRACEMALLOC), so
+growth shows up in diff() between two later snapshots of the same worker.
+
+gunicorn's post_request hook retires a worker whose RSS is over
+MEMORY_CEILING_MB once its current request is done; the master forks a
+fresh one.
+"""
+import glob
+import json
+import logging
+import mmap
+import os
+import re
+import resource
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import deque
+
+from django.conf import settings
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+SNAPSHOT_KEYS = ("lineno", "filename", "traceback")
+
+_LABEL = re.compile(r"^\d{8}T\d{9}-[0-9a-f]{6}$")
+_SNAPSHOT = re.compile(r"snapshot_(\d+)_(.+)\.pickle$")
+_history = deque()
+_history_pid = None
+_lock = threading.Lock()
+
+
+def directory():
+    return getattr(settings, "MEMORY_DIR", "memory")
+
+
+def rss_bytes():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * mmap.PAGESIZE
+    except OSError:
+        # not Linux: the peak is the best the stdlib offers
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def over_ceiling():
+    ceiling = getattr(settings, "MEMORY_CEILING_MB", 0)
+    return bool(ceiling) and rss_bytes() > ceiling * MB
+
+
+def _write_json(path, data):
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+
+def sample():
+    """Record this process's RSS now; returns the bytes"""
+    global _history, _history_pid
+    rss = rss_bytes()
+    with _lock:
+        if _history_pid != os.getpid():
+            # a forked worker starts its own history
+            _history = deque(maxlen=getattr(settings, "MEMORY_HISTORY", 120))
+            _history_pid = os.getpid()
+        _history.append((round(time.time(), 1), rss))
+        samples = list(_history)
+    os.makedirs(directory(), exist_ok=True)
+    _write_json(os.path.join(directory(), f"worker_{os.getpid()}.json"), {
+        "pid": os.getpid(),
+        "rss_bytes": rss,
+        "threads": threading.active_count(),
+        "tracemalloc": tracemalloc.is_tracing(),
+        "samples": samples,
+    })
+    return rss
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def workers():
+    """The latest sample of every live worker; files left by dead ones are removed"""
+    found = []
+    for path in sorted(glob.glob(os.path.join(directory(), "worker_*.json"))):
+        try:
+            with open(path) as f:
+                worker = json.load(f)
+        except (FileNotFoundError, ValueError):
+            continue
+        if not _alive(worker["pid"]):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            continue
+        found.append(worker)
+    return found
+
+
+def _collect():
+    live = workers()
+    yield ("worker_resident_memory_bytes", "gauge", "Resident memory of each worker at its last sample.",
+           [({"pid": worker["pid"]}, worker["rss_bytes"]) for worker in live])
+    yield ("worker_threads", "gauge", "Threads alive in each worker at its last sample.",
+           [({"pid": worker["pid"]}, worker["threads"]) for worker in live])
+
+
+metrics.collectors.append(_collect)
+
+
+# tracemalloc snapshots
+
+def _marker():
+    return os.path.join(directory(), "snapshot.request")
+
+
+def requested_label():
+    try:
+        with open(_marker()) as f:
+            return json.load(f)["label"]
+    except (FileNotFoundError, ValueError, KeyError):
+        return None
+
+
+def request_snapshot():
+    """Ask every worker for a snapshot on its sampler's next tick; returns the snapshot label"""
+    now = time.time()
+    label = f"{time.strftime('%Y%m%dT%H%M%S', time.gmtime(now))}{int(now * 1000) % 1000:03d}-{uuid.uuid4().hex[:6]}"
+    os.makedirs(directory(), exist_ok=True)
+    _write_json(_marker(), {"label": label})
+    return label
+
+
+def take_snapshot(label):
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(getattr(settings, "MEMORY_TRACEMALLOC_FRAMES", 10))
+    snapshot = tracemalloc.take_snapshot().filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+        tracemalloc.Filter(False, "<unknown>"),
+    ))
+    os.makedirs(directory(), exist_ok=True)
+    snapshot.dump(os.path.join(directory(), f"snapshot_{os.getpid()}_{label}.pickle"))
+
+
+def list_snapshots():
+    snapshots = []
+    for path in glob.glob(os.path.join(directory(), "snapshot_*.pickle")):
+        match = _SNAPSHOT.search(os.path.basename(path))
+        if match:
+            snapshots.append({"pid": int(match[1]), "label": match[2], "bytes": os.path.getsize(path)})
+    return sorted(snapshots, key=lambda snapshot: (snapshot["label"], snapshot["pid"]))
+
+
+def _load(pid, label):
+    if not _LABEL.match(label):
+        return None
+    path = os.path.join(directory(), f"snapshot_{int(pid)}_{label}.pickle")
+    return tracemalloc.Snapshot.load(path) if os.path.exists(path) else None
+
+
+def _site(frame):
+    base = str(settings.BASE_DIR) + os.sep
+    filename = frame.filename[len(base):] if frame.filename.startswith(base) else frame.filename
+    return f"{filename}:{frame.lineno}" if frame.lineno else filename
+
+
+def diff(pid, before, after, key="lineno", limit=25):
+    """
+    Allocation sites of one worker that grew most between two snapshots, or
+    None if either snapshot doesn't exist.
+    """
+    old, new = _load(pid, before), _load(pid, after)
+    if old is None or new is None:
+        return None
+    stats = new.compare_to(old, key)
+    return [
+        {
+            # tracebacks run from the oldest frame to the allocation
+            "site": " -> ".join(map(_site, stat.traceback)) if key == "traceback" else _site(stat.traceback[0]),
+            "size_diff": stat.size_diff,
+            "size": stat.size,
+            "count_diff": stat.count_diff,
+            "count": stat.count,
+        }
+        for stat in stats[:limit]
+    ]
+
+
+class Sampler(threading.Thread):
+    """Samples RSS every MEMORY_SAMPLE_INTERVAL seconds and answers snapshot requests"""
+
+    def __init__(self):
+        super().__init__(daemon=True, name="memory-sampler")
+        self.interval = getattr(settings, "MEMORY_SAMPLE_INTERVAL", 30)
+
+    def run(self):
+        while True:
+            try:
+                tick()
+            except Exception:
+                logger.exception("Memory sampler failed")
+            time.sleep(self.interval)
+
+
+_answered = {}  # pid -> last snapshot label taken
+
+
+def tick():
+    """One sampler round: record RSS and take a snapshot if a new one was asked for"""
+    sample()
+    label = requested_label()
+    with _lock:
+        if label is None or _answered.get(os.getpid()) == label:
+            return
+        _answered[os.getpid()] = label
+    take_snapshot(label)
+
+
+_sampler_pid = None
+
+
+def start_sampler():
+    """Start this process's sampler once; earlier snapshot requests are not answered"""
+    global _sampler_pid
+    with _lock:
+        if _sampler_pid == os.getpid():
+            return
+        _sampler_pid = os.getpid()
+    if getattr(settings, "MEMORY_TRACEMALLOC", False) and not tracemalloc.is_tracing():
+        tracemalloc.start(getattr(settings, "MEMORY_TRACEMALLOC_FRAMES", 10))
+    _answered[os.getpid()] = requested_label()
+    Sampler().start()
@@ -0,0 +1,296 @@
+"""
+Prometheus metrics, without prometheus_client.
+
+Counters and histograms are kept in a per-process store. With METRICS_DIR
+set (a directory shared by every gunicorn worker and emptied when the server
+starts, see gunicorn.conf.py) each process keeps its samples in its own mmap'd
+file there, updated in place on every observation, and /metrics reads and
+sums every file, so whichever worker answers the scrape reports the whole
+server, including workers that have since exited. Without METRICS_DIR the
+samples stay in memory (runserver, tests).
+
+Only counters and histograms exist, since both can be summed across processes.
+"""
+import glob
+import json
+import math
+import mmap
+import os
+import struct
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+
+from . import tracing
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+FILE_PATTERN = "metrics_*.db"
+
+
+class MemoryStore:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, key, amount):
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def items(self):
+        with self._lock:
+            return list(self._values.items())
+
+
+def _records(buffer):
+    """(key, value, value offset) for each record in a store file's bytes"""
+    used = struct.unpack_from("I", buffer, 0)[0]
+    position = 8
+    while position < used:
+        length = struct.unpack_from("I", buffer, position)[0]
+        key = bytes(buffer[position + 4:position + 4 + length]).decode()
+        position += 4 + length
+        position += -position % 8
+        yield key, struct.unpack_from("d", buffer, position)[0], position
+        position += 8
+
+
+class FileStore:
+    """
+    key -> float64 in an mmap'd file: an 8 byte header holding the bytes in
+    use, then [key length][key][padding][value] records, only ever appended.
+    The header is written after the record, so a reader in another process
+    never sees half of one.
+    """
+
+    INITIAL_SIZE = 1 << 20
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = open(path, "a+b")
+        if os.fstat(self._file.fileno()).st_size < 8:
+            self._file.truncate(self.INITIAL_SIZE)
+        self._size = os.fstat(self._file.fileno()).st_size
+        self._map = mmap.mmap(self._file.fileno(), self._size)
+        self._used = max(struct.unpack_from("I", self._map, 0)[0], 8)
+        self._offsets = {key: offset for key, _, offset in _records(self._map)}
+
+    def inc(self, key, amount):
+        with self._lock:
+            offset = self._offsets.get(key)
+            if offset is None:
+                offset = self._append(key)
+            struct.pack_into("d", self._map, offset, struct.unpack_from("d", self._map, offset)[0] + amount)
+
+    def _append(self, key):
+        data = key.encode()
+        offset = self._used + 4 + len(data)
+        offset += -offset % 8
+        if offset + 8 > self._size:
+            self._grow(offset + 8)
+        struct.pack_into(f"I{len(data)}s", self._map, self._used, len(data), data)
+        struct.pack_into("d", self._map, offset, 0.0)
+        self._used = offset + 8
+        struct.pack_into("I", self._map, 0, self._used)
+        self._offsets[key] = offset
+        return offset
+
+    def _grow(self, needed):
+        size = self._size
+        while size < needed:
+            size *= 2
+        self._map.close()
+        self._file.truncate(size)
+        self._map = mmap.mmap(self._file.fileno(), size)
+        self._size = size
+
+    def items(self):
+        with self._lock:
+            return [(key, value) for key, value, _ in _records(self._map)]
+
+
+_store = None
+_store_pid = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """This process's store; a forked worker opens its own file"""
+    global _store, _store_pid
+    if _store_pid != os.getpid():
+        with _store_lock:
+            if _store_pid != os.getpid():
+                directory = getattr(settings, "METRICS_DIR", "")
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                    _store = FileStore(os.path.join(directory, f"metrics_{os.getpid()}.db"))
+                else:
+                    _store = MemoryStore()
+                _store_pid = os.getpid()
+    return _store
+
+
+def _key(name, labels):
+    return json.dumps([name, sorted(labels.items())])
+
+
+# metric types
+
+_families = {}  # name -> metric
+
+
+class Counter:
+    type = "counter"
+
+    def __init__(self, name, documentation):
+        self.name = name
+        self.documentation = documentation
+        _families[name] = self
+
+    def inc(self, amount=1, **labels):
+        get_store().inc(_key(self.name, labels), amount)
+
+
+class Histogram:
+    """Buckets are stored per bucket and made cumulative when rendered"""
+    type = "histogram"
+
+    def __init__(self, name, documentation, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets)
+        _families[name] = self
+
+    def observe(self, value, **labels):
+        store = get_store()
+        bound = next((bound for bound in self.buckets if value <= bound), math.inf)
+        store.inc(_key(f"{self.name}_bucket", {**labels, "le": _number(bound)}), 1)
+        store.inc(_key(f"{self.name}_count", labels), 1)
+        store.inc(_key(f"{self.name}_sum", labels), value)
+
+    def lines(self, samples):
+        groups = {}
+        for sample, labels, value in samples:
+            labels = dict(labels)
+            le = labels.pop("le", None)
+            group = groups.setdefault(tuple(sorted(labels.items())), {"buckets": {}, "sum": 0.0, "count": 0.0})
+            if sample.endswith("_bucket"):
+                group["buckets"][le] = group["buckets"].get(le, 0.0) + value
+            else:
+                group[sample.rsplit("_", 1)[1]] += value
+        for labels, group in sorted(groups.items()):
+            labels = dict(labels)
+            cumulative = 0.0
+            for bound in (*self.buckets, math.inf):
+                cumulative += group["buckets"].get(_number(bound), 0.0)
+                yield f"{self.name}_bucket{_labels({**labels, 'le': _number(bound)})} {_number(cumulative)}"
+            yield f"{self.name}_sum{_labels(labels)} {_number(group['sum'])}"
+            yield f"{self.name}_count{_labels(labels)} {_number(group['count'])}"
+
+
+def _number(value):
+    if value == math.inf:
+        return "+Inf"
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in sorted(labels.items())) + "}"
+
+
+def samples(directory=None):
+    """Summed (key, value) across every process sharing `directory` (METRICS_DIR by default)"""
+    directory = directory if directory is not None else getattr(settings, "METRICS_DIR", "")
+    if not directory:
+        return get_store().items()
+    totals = {}
+    for path in glob.glob(os.path.join(directory, FILE_PATTERN)):
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            continue
+        if len(data) < 8:
+            continue
+        for key, value, _ in _records(data):
+            totals[key] = totals.get(key, 0.0) + value
+    return totals.items()
+
+
+# functions yielding (name, type, help, [(labels, value)]) for values read
+# at scrape time rather than counted, e.g. per-worker memory (core/memory.py)
+collectors = []
+
+
+def render(directory=None):
+    """Everything in the Prometheus text exposition format"""
+    families = {}
+    for key, value in samples(directory):
+        sample, labels = json.loads(key)
+        name = sample if sample in _families else sample.rsplit("_", 1)[0]
+        if name in _families:
+            families.setdefault(name, []).append((sample, labels, value))
+
+    lines = []
+    for name in sorted(families):
+        metric = _families[name]
+        lines.append(f"# HELP {name} {metric.documentation}")
+        lines.append(f"# TYPE {name} {metric.type}")
+        if isinstance(metric, Histogram):
+            lines.extend(metric.lines(families[name]))
+        else:
+            lines.extend(
+                f"{sample}{_labels(dict(labels))} {_number(value)}"
+                for sample, labels, value in sorted(families[name])
+            )
+    for collect in collectors:
+        for name, kind, documentation, values in collect():
+            if values:
+                lines.append(f"# HELP {name} {documentation}")
+                lines.append(f"# TYPE {name} {kind}")
+                lines.extend(f"{name}{_labels(labels)} {_number(value)}" for labels, value in values)
+    return "\n".join(lines) + "\n"
+
+
+# what we measure
+
+REQUEST_LATENCY = Histogram("http_request_duration_seconds", "Request latency by URL name, method and status.")
+REQUEST_DB_TIME = Histogram("http_request_db_seconds", "Time spent in database queries per request.")
+REQUEST_QUERIES = Histogram(
+    "http_request_queries", "Database queries per request.", buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89, 144, 500),
+)
+EXTERNAL_LATENCY = Histogram(
+    "external_call_duration_seconds", "Latency of calls to Paystack, Google and Resend.",
+)
+CACHE_LOOKUPS = Counter("cache_lookups_total", "Cache lookups by cache and result (hit or miss).")
+
+
+def record_request(view, method, status, seconds, db_seconds, queries):
+    REQUEST_LATENCY.observe(seconds, view=view, method=method, status=str(status))
+    REQUEST_DB_TIME.observe(db_seconds, view=view)
+    REQUEST_QUERIES.observe(queries, view=view)
+
+
+@contextmanager
+def external_call(service):
+    """Time (and trace) a call to an outside service; outcome is "error" if it raised"""
+    started = time.perf_counter()
+    outcome = "error"
+    try:
+        with tracing.span(f"external.{service}"):
+            yield
+        outcome = "ok"
+    finally:
+        EXTERNAL_LATENCY.observe(time.perf_counter() - started, service=service, outcome=outcome)
+
+
+def cache_lookup(cache, hit):
+    CACHE_LOOKUPS.inc(cache=cache, result="hit" if hit else "miss")
@@ -0,0 +1,292 @@
+import json
+import logging
+import random
+import re
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.exceptions import InvalidToken
+
+from account.authentication import CookieJWTAuthentication
+
+from . import metrics, profiling, tracing
+
+logger = logging.getLogger("core.sql")
+
+_IN_LIST = re.compile(r"\((?:%s, )+%s\)")
+_LITERAL = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+
+
+def fingerprint(sql):
+    """SQL with literals and IN-list lengths folded, so one loop's queries group together"""
+    return _LITERAL.sub("?", _IN_LIST.sub("(%s, ...)", sql))
+
+
+class QueryRecorder:
+    """execute_wrapper that counts and times queries by their SQL template"""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.templates = {}  # raw sql -> [count, seconds]
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.count += 1
+            self.seconds += elapsed
+            entry = self.templates.get(sql)
+            if entry is None:
+                self.templates[sql] = [1, elapsed]
+            else:
+                entry[0] += 1
+                entry[1] += elapsed
+
+    def repeated(self):
+        """[(fingerprint, count, seconds)] for SQL run more than once, most frequent first"""
+        groups = {}
+        # fingerprinting happens once per distinct statement, not per query
+        for sql, (count, seconds) in self.templates.items():
+            group = groups.setdefault(fingerprint(sql), [0, 0.0])
+            group[0] += count
+            group[1] += seconds
+        return sorted(
+            ((sql, count, seconds) for sql, (count, seconds) in groups.items() if count > 1),
+            key=lambda item: -item[1],
+        )
+
+
+class QueryProfilingMiddleware:
+    """
+    For a sampled share of requests (QUERY_PROFILING_SAMPLE_RATE) record the
+    query count, DB time and repeated SQL, flag templates run at least
+    QUERY_PROFILING_N_PLUS_ONE times as N+1 suspects, and report it all in a
+    Server-Timing header and one JSON log line on the "core.sql" logger.
+    Unsampled requests pay for a single random() call.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.sample_rate = getattr(settings, "QUERY_PROFILING_SAMPLE_RATE", 0.0)
+        self.threshold = getattr(settings, "QUERY_PROFILING_N_PLUS_ONE", 5)
+
+    def __call__(self, request):
+        if not self.sample_rate or random.random() >= self.sample_rate:
+            return self.get_response(request)
+
+        recorder = QueryRecorder()
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(recorder))
+            response = self.get_response(request)
+        total = time.perf_counter() - started
+
+        repeated = recorder.repeated()
+        suspects = [(sql, count, seconds) for sql, count, seconds in repeated if count >= self.threshold]
+        timing = (
+            f'db;dur={recorder.seconds * 1000:.1f};desc="{recorder.count} queries", '
+            f"app;dur={(total - recorder.seconds) * 1000:.1f}"
+        )
+        response["Server-Timing"] = f"{response['Server-Timing']}, {timing}" if response.has_header("Server-Timing") else timing
+
+        logger.log(logging.WARNING if suspects else logging.INFO, json.dumps({
+            "event": "sql_profile",
+            "method": request.method,
+            "path": request.path,
+            "status": response.status_code,
+            "queries": recorder.count,
+            "db_ms": round(recorder.seconds * 1000, 2),
+            "total_ms": round(total * 1000, 2),
+            "duplicates": sum(count - 1 for _, count, _ in repeated),
+            "n_plus_one": [
+                {"sql": sql[:500], "count": count, "ms": round(seconds * 1000, 2)}
+                for sql, count, seconds in suspects
+            ],
+        }))
+        return response
+
+
+class QueryTimer:
+    """execute_wrapper that only counts and times queries"""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.seconds += time.perf_counter() - started
+
+
+class MetricsMiddleware:
+    """
+    Records every request's latency, DB time and query count for /metrics,
+    labelled by URL name rather than path so product ids and tokens don't
+    each become a series.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timer = QueryTimer()
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(timer))
+            response = self.get_response(request)
+        match = request.resolver_match
+        metrics.record_request(
+            view=(match.url_name or match.view_name) if match else "<unmatched>",
+            method=request.method,
+            status=response.status_code,
+            seconds=time.perf_counter() - started,
+            db_seconds=timer.seconds,
+            queries=timer.count,
+        )
+        return response
+
+
+class TracingMiddleware:
+    """
+    Traces TRACING_SAMPLE_RATE of requests (core/tracing.py). With
+    TRACING_SLOW_MS set every request is traced and kept if it took at
+    least that long, which costs the span bookkeeping on every request.
+    Kept traces get an X-Trace-Id header.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.sample_rate = getattr(settings, "TRACING_SAMPLE_RATE", 0.0)
+        self.slow_ms = getattr(settings, "TRACING_SLOW_MS", 0)
+
+    def __call__(self, request):
+        sampled = bool(self.sample_rate) and random.random() < self.sample_rate
+        if not sampled and not self.slow_ms:
+            return self.get_response(request)
+
+        root = tracing.start_trace("request", sampled, method=request.method, path=request.path)
+        with tracing.activate(root), ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(self.trace_query))
+            response = self.get_response(request)
+
+        match = request.resolver_match
+        root.attributes.update(view=(match.url_name or match.view_name) if match else None, status=response.status_code)
+        if tracing.end_trace(root, self.slow_ms):
+            response["X-Trace-Id"] = root.trace.id
+        return response
+
+    @staticmethod
+    def trace_query(execute, sql, params, many, context):
+        with tracing.span("db.query", sql=sql[:500], many=many, alias=context["connection"].alias):
+            return execute(sql, params, many, context)
+
+    def process_template_response(self, request, response):
+        # DRF renders after the view returns; time that too
+        parent = tracing.current()
+        if parent is not None:
+            render = parent.child("render")
+            response.add_post_render_callback(lambda response: render.finish())
+        return response
+
+
+class ProfilingMiddleware:
+    """
+    Runs a request under cProfile (core/profiling.py) when a staff user
+    sends "X-Profile: 1" (the response then names the profile in
+    X-Profile-Id) or PROFILING_SAMPLE_RATE picks it. Only the header costs
+    anything extra: one user lookup to check it comes from staff.
+    """
+
+    header = "X-Profile"
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.sample_rate = getattr(settings, "PROFILING_SAMPLE_RATE", 0.0)
+
+    def __call__(self, request):
+        if request.headers.get(self.header) and self.is_staff(request):
+            trigger = "header"
+        elif self.sample_rate and random.random() < self.sample_rate:
+            trigger = "sample"
+        else:
+            return self.get_response(request)
+
+        started = time.perf_counter()
+        with profiling.profile() as profiler:
+            response = self.get_response(request)
+        if profiler is None:
+            return response
+
+        match = request.resolver_match
+        profile_id = profiling.save(
+            profiler,
+            view=(match.url_name or match.view_name) if match else None,
+            method=request.method,
+            path=request.path,
+            status=response.status_code,
+            duration_ms=round((time.perf_counter() - started) * 1000, 2),
+            trigger=trigger,
+        )
+        if trigger == "header":
+            response["X-Profile-Id"] = profile_id
+        return response
+
+    @staticmethod
+    def is_staff(request):
+        try:
+            authenticated = CookieJWTAuthentication().authenticate(request)
+        except (InvalidToken, AuthenticationFailed):
+            return False
+        return bool(authenticated and authenticated[0].is_staff)
+
+
+class SlowQueryMiddleware:
+    """
+    Hands queries that take SLOW_QUERY_MS or longer to the slow-query log
+    (funiture/slow_queries.py) with the view and the code that ran them.
+    Other queries only pay for the timing.
+    """
+
+    def __init__(self, get_response):
+        # funiture.slow_queries imports fingerprint() from here
+        from funiture import slow_queries
+
+        self.get_response = get_response
+        self.log = slow_queries
+        self.threshold = getattr(settings, "SLOW_QUERY_MS", 0) / 1000
+
+    def __call__(self, request):
+        if not self.threshold:
+            return self.get_response(request)
+
+        def timed(execute, sql, params, many, context):
+            started = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                elapsed = time.perf_counter() - started
+                if elapsed >= self.threshold:
+                    match = request.resolver_match
+                    self.log.record(
+                        sql, params, elapsed, alias=context["connection"].alias,
+                        view=(match.url_name or match.view_name) if match else None,
+                        location=self.log.code_location(), many=many,
+                    )
+
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(timed))
+            return self.get_response(request)
@@ -0,0 +1,132 @@
+"""
+CPU profiles of live requests, taken with cProfile.
+
+ProfilingMiddleware profiles a request when a staff user sends
+"X-Profile: 1" or PROFILING_SAMPLE_RATE picks it. save() stores the profile
+under PROFILING_DIR as <id>.prof (pstats format, for pstats or snakeviz)
+next to <id>.json describing the request, keeping the newest
+PROFILING_MAX_FILES. merged() combines every profile of one endpoint, so a
+frame that is hot across many samples stands out from one slow request.
+"""
+import cProfile
+import glob
+import json
+import os
+import pstats
+import re
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from django.conf import settings
+
+SORTS = {"cumulative": "cumulative", "own": "tottime", "calls": "ncalls"}
+
+_ID = re.compile(r"^\d{8}T\d{9}-[0-9a-f]{8}$")
+# cProfile can't run two profilers at once (3.12+); a busy process skips
+_running = threading.Lock()
+
+
+def directory():
+    return getattr(settings, "PROFILING_DIR", "profiles")
+
+
+@contextmanager
+def profile():
+    """A running cProfile.Profile for the block, or None if this process is already profiling"""
+    if not _running.acquire(blocking=False):
+        yield None
+        return
+    try:
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield profiler
+        finally:
+            profiler.disable()
+    finally:
+        _running.release()
+
+
+def save(profiler, **meta):
+    """Write the profile and its description; returns the profile id"""
+    os.makedirs(directory(), exist_ok=True)
+    now = time.time()
+    profile_id = f"{time.strftime('%Y%m%dT%H%M%S', time.gmtime(now))}{int(now * 1000) % 1000:03d}-{uuid.uuid4().hex[:8]}"
+    profiler.dump_stats(os.path.join(directory(), f"{profile_id}.prof"))
+    with open(os.path.join(directory(), f"{profile_id}.json"), "w") as f:
+        json.dump({"id": profile_id, "at": time.time(), **meta}, f)
+    _prune()
+    return profile_id
+
+
+def _prune():
+    keep = getattr(settings, "PROFILING_MAX_FILES", 500)
+    # ids start with the time, so name order is age order
+    for path in sorted(glob.glob(os.path.join(directory(), "*.json")))[:-keep]:
+        for stale in (path, path[:-len(".json")] + ".prof"):
+            try:
+                os.remove(stale)
+            except FileNotFoundError:
+                pass
+
+
+def list_profiles(view=None):
+    """Descriptions of the stored profiles, newest first"""
+    profiles = []
+    for path in sorted(glob.glob(os.path.join(directory(), "*.json")), reverse=True):
+        try:
+            with open(path) as f:
+                meta = json.load(f)
+        except (FileNotFoundError, ValueError):
+            continue  # pruned or half written
+        if view is None or meta.get("view") == view:
+            profiles.append(meta)
+    return profiles
+
+
+def profile_path(profile_id):
+    """The .prof file for an id, or None; ids are checked so they can't name other files"""
+    if not _ID.match(profile_id):
+        return None
+    path = os.path.join(directory(), f"{profile_id}.prof")
+    return path if os.path.exists(path) else None
+
+
+def merged(view):
+    """pstats.Stats of every stored profile of `view`, or None if there are none"""
+    paths = [path for path in map(profile_path, (meta["id"] for meta in list_profiles(view))) if path]
+    return pstats.Stats(*paths) if paths else None
+
+
+def merged_bytes(stats):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "merged.prof")
+        stats.dump_stats(path)
+        with open(path, "rb") as f:
+            return f.read()
+
+
+def _location(filename, line, name):
+    base = str(settings.BASE_DIR) + os.sep
+    if filename.startswith(base):
+        filename = filename[len(base):]
+    return f"{filename}:{line}({name})" if line else f"{filename}({name})"
+
+
+def hot_functions(stats, sort="cumulative", limit=30):
+    """The top `limit` functions of a pstats.Stats, as dicts"""
+    stats.sort_stats(SORTS[sort])
+    rows = []
+    for function in stats.fcn_list[:limit]:
+        primitive_calls, calls, own, cumulative, _ = stats.stats[function]
+        rows.append({
+            "function": _location(*function),
+            "calls": calls,
+            "primitive_calls": primitive_calls,
+            "own_seconds": round(own, 6),
+            "cumulative_seconds": round(cumulative, 6),
+        })
+    return rows
@@ -60,6 +60,11 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.MetricsMiddleware',
+    'core.middleware.TracingMiddleware',
+    'core.middleware.QueryProfilingMiddleware',
+    'core.middleware.ProfilingMiddleware',
+    'core.middleware.SlowQueryMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
@@ -154,6 +159,98 @@ MEDIA_ROOT = BASE_DIR/'media'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Cache
+# Point CACHE_BACKEND/CACHE_LOCATION at a shared cache (redis, memcached) in
+# production so every gunicorn worker sees the same entries
+
+CACHES = {
+    "default": {
+        "BACKEND": config("CACHE_BACKEND", default="django.core.cache.backends.locmem.LocMemCache"),
+        "LOCATION": config("CACHE_LOCATION", default="funiture"),
+    }
+}
+
+# Recently viewed products are kept in the cache and written to the DB in batches
+RECENTLY_VIEWED_FLUSH_INTERVAL = config("RECENTLY_VIEWED_FLUSH_INTERVAL", default=30, cast=int)
+RECENTLY_VIEWED_FLUSH_BATCH = config("RECENTLY_VIEWED_FLUSH_BATCH", default=500, cast=int)
+
+# Lower bounds (NGN) of the price buckets offered as catalog facets
+FACET_PRICE_BUCKETS = [0, 50000, 100000, 200000, 500000]
+
+# Popularity ranking: demand older than a half-life counts half as much
+POPULARITY_HALF_LIFE_DAYS = 14
+POPULARITY_WEIGHTS = {"order": 5.0, "wishlist": 3.0, "view": 1.0}
+
+RECOMMENDATIONS_TOP_K = 12
+SIMILAR_PRODUCTS_TOP_K = 12
+SIMILAR_PRODUCTS_MAX_TERMS = 5000
+
+# Cloudinary transformations stored per image at save time (funiture/image_variants.py)
+IMAGE_VARIANTS = {
+    "thumbnail": {"width": 150, "height": 150, "crop": "fill", "gravity": "auto"},
+    "card": {"width": 480, "height": 480, "crop": "fill", "gravity": "auto"},
+    "detail": {"width": 1200, "crop": "limit"},
+}
+IMAGE_SRCSET_WIDTHS = [320, 640, 960, 1280, 1920]
+IMAGE_SRCSET_FORMATS = ["webp", "avif"]
+
+# admin image uploads run in the background (funiture/image_uploads.py); "fake" stays offline
+IMAGE_UPLOADER = config("IMAGE_UPLOADER", default="cloudinary")
+IMAGE_UPLOAD_WORKERS = 4
+
+# share of requests whose SQL is profiled (core/middleware.py); 0 turns it off
+QUERY_PROFILING_SAMPLE_RATE = config("QUERY_PROFILING_SAMPLE_RATE", default=0.0, cast=float)
+# the same SQL this many times in one request is reported as an N+1
+QUERY_PROFILING_N_PLUS_ONE = 5
+
+# Prometheus metrics at /metrics (core/metrics.py). Under gunicorn set
+# METRICS_DIR to a directory the workers share so a scrape sums all of them;
+# METRICS_TOKEN, if set, is the bearer token the scraper must send
+METRICS_DIR = config("METRICS_DIR", default="")
+METRICS_TOKEN = config("METRICS_TOKEN", default="")
+
+# Request tracing (core/tracing.py): the share of requests traced and, if
+# set, a duration in ms past which any request's trace is kept as well
+TRACING_SAMPLE_RATE = config("TRACING_SAMPLE_RATE", default=0.0, cast=float)
+TRACING_SLOW_MS = config("TRACING_SLOW_MS", default=0, cast=float)
+TRACING_DIR = config("TRACING_DIR", default=str(BASE_DIR / "traces"))
+TRACING_MAX_BYTES = 10 * 1024 * 1024
+TRACING_BACKUP_COUNT = 5
+
+# CPU profiles (core/profiling.py): staff can ask with an "X-Profile: 1"
+# header; this share of all requests is profiled as well
+PROFILING_SAMPLE_RATE = config("PROFILING_SAMPLE_RATE", default=0.0, cast=float)
+PROFILING_DIR = config("PROFILING_DIR", default=str(BASE_DIR / "profiles"))
+PROFILING_MAX_FILES = 500
+
+# Worker memory (core/memory.py). MEMORY_DIR is shared by the workers like
+# METRICS_DIR; a worker past MEMORY_CEILING_MB of RSS is replaced after its
+# current request (0 turns that off). MEMORY_TRACEMALLOC traces allocations
+# from boot instead of from the first snapshot, at some CPU cost
+MEMORY_DIR = config("MEMORY_DIR", default=str(BASE_DIR / "memory"))
+MEMORY_SAMPLE_INTERVAL = config("MEMORY_SAMPLE_INTERVAL", default=30, cast=int)
+MEMORY_HISTORY = 120
+MEMORY_CEILING_MB = config("MEMORY_CEILING_MB", default=0, cast=int)
+MEMORY_TRACEMALLOC = config("MEMORY_TRACEMALLOC", default=False, cast=bool)
+MEMORY_TRACEMALLOC_FRAMES = 10
+
+# Queries slower than this (ms) go to the slow-query log with their plan
+# (funiture/slow_queries.py); 0 turns it off
+SLOW_QUERY_MS = config("SLOW_QUERY_MS", default=200, cast=float)
+SLOW_QUERY_FLUSH_INTERVAL = 30
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "handlers": {
+        "console": {"class": "logging.StreamHandler"},
+    },
+    "loggers": {
+        "core": {"handlers": ["console"], "level": "INFO", "propagate": False},
+        "funiture": {"handlers": ["console"], "level": "INFO", "propagate": False},
+    },
+}
+
 CORS_ALLOW_CREDENTIALS = True
 
 
@@ -166,6 +263,9 @@ CORS_ALLOWED_ORIGINS = [
 
 AUTH_USER_MODEL = "account.User"
 
+# Case-insensitive email login; keeps the loaded user around for failure messages
+AUTHENTICATION_BACKENDS = ["account.backends.EmailBackend"]
+
 # JWT Configs
 SIMPLE_JWT = {
     "ACCESS_TOKEN_LIFETIME": timedelta(minutes=10),
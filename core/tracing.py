@@ -0,0 +1,161 @@
+"""
+Request tracing, without a tracing library.
+
+A traced request is a tree of spans: the request itself, then a child for
+every SQL query, outbound call (metrics.external_call), the response render
+and any EmailThread the request starts, which carries the trace into its
+thread. The current span lives in a contextvar, so span() nests under
+whatever is running and does nothing when the request isn't traced.
+
+Spans are written to TRACING_DIR/traces_<pid>.jsonl, one per line, in files
+rotated at TRACING_MAX_BYTES. A trace's spans are held back until its request
+ends, so a trace that isn't kept (see TracingMiddleware) never costs a write.
+`manage.py show_trace` puts a trace back together.
+"""
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from logging.handlers import RotatingFileHandler
+
+from django.conf import settings
+
+_current = contextvars.ContextVar("tracing_span", default=None)
+
+
+class Trace:
+    def __init__(self, sampled):
+        self.id = uuid.uuid4().hex
+        self.sampled = sampled
+        self.keep = None  # decided when the root span ends
+        self.pending = []
+        self.lock = threading.Lock()
+
+
+class Span:
+    def __init__(self, trace, name, parent=None, **attributes):
+        self.trace = trace
+        self.name = name
+        self.id = uuid.uuid4().hex[:16]
+        self.parent_id = parent.id if parent else None
+        self.attributes = attributes
+        self.start = time.time()
+        self.duration = None
+        self.error = None
+        self._started = time.perf_counter()
+
+    def child(self, name, **attributes):
+        return Span(self.trace, name, self, **attributes)
+
+    def finish(self):
+        self.duration = time.perf_counter() - self._started
+        with self.trace.lock:
+            if self.trace.keep is None:
+                self.trace.pending.append(self)
+                return
+        if self.trace.keep:
+            export([self])
+
+    def as_dict(self):
+        return {
+            "trace_id": self.trace.id,
+            "span_id": self.id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": self.start,
+            "duration_ms": round(self.duration * 1000, 3),
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+
+def current():
+    return _current.get()
+
+
+def start_trace(name, sampled=True, **attributes):
+    return Span(Trace(sampled), name, **attributes)
+
+
+def end_trace(root, slow_ms=0):
+    """Finish the root span and keep the trace if it was sampled or took slow_ms or more"""
+    root.finish()
+    trace = root.trace
+    keep = trace.sampled or bool(slow_ms and root.duration * 1000 >= slow_ms)
+    with trace.lock:
+        trace.keep = keep
+        pending, trace.pending = trace.pending, []
+    if keep:
+        export(pending)
+    return keep
+
+
+@contextmanager
+def activate(span):
+    """Make `span` the parent of spans opened inside the block"""
+    token = _current.set(span)
+    try:
+        yield span
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def span(name, **attributes):
+    """A child of the current span for the duration of the block; a no-op outside a trace"""
+    parent = _current.get()
+    if parent is None:
+        yield None
+        return
+    child = parent.child(name, **attributes)
+    token = _current.set(child)
+    try:
+        yield child
+    except BaseException as exc:
+        child.error = repr(exc)
+        raise
+    finally:
+        _current.reset(token)
+        child.finish()
+
+
+# export
+
+_logger = logging.getLogger("core.tracing.spans")
+_logger.propagate = False
+_logger.setLevel(logging.INFO)
+_exporter = None  # (pid, directory)
+_exporter_lock = threading.Lock()
+
+
+def _ensure_exporter():
+    global _exporter
+    directory = getattr(settings, "TRACING_DIR", "traces")
+    if _exporter != (os.getpid(), directory):
+        with _exporter_lock:
+            if _exporter != (os.getpid(), directory):
+                # a forked worker gets its own file instead of sharing the parent's rotation
+                for handler in list(_logger.handlers):
+                    _logger.removeHandler(handler)
+                    handler.close()
+                os.makedirs(directory, exist_ok=True)
+                handler = RotatingFileHandler(
+                    os.path.join(directory, f"traces_{os.getpid()}.jsonl"),
+                    maxBytes=getattr(settings, "TRACING_MAX_BYTES", 10 * 1024 * 1024),
+                    backupCount=getattr(settings, "TRACING_BACKUP_COUNT", 5),
+                    delay=True,
+                )
+                handler.setFormatter(logging.Formatter("%(message)s"))
+                _logger.addHandler(handler)
+                _exporter = (os.getpid(), directory)
+
+
+def export(spans):
+    if not spans:
+        return
+    _ensure_exporter()
+    _logger.info("\n".join(json.dumps(span.as_dict(), default=str) for span in spans))
@@ -19,10 +19,21 @@ from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
 
+from .views import (metrics_view, ProfileListView, ProfileDownloadView, ProfileAggregateView, MemoryView,
+                    MemorySnapshotView, MemoryDiffView, SlowQueryReportView)
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include("funiture.urls")),
     path("api/accounts/", include('account.urls')),
+    path("metrics", metrics_view, name="metrics"),
+    path("api/profiles", ProfileListView.as_view(), name="profile_list"),
+    path("api/profiles/aggregate", ProfileAggregateView.as_view(), name="profile_aggregate"),
+    path("api/profiles/<str:profile_id>", ProfileDownloadView.as_view(), name="profile_download"),
+    path("api/memory", MemoryView.as_view(), name="memory"),
+    path("api/memory/snapshots", MemorySnapshotView.as_view(), name="memory_snapshots"),
+    path("api/memory/snapshots/diff", MemoryDiffView.as_view(), name="memory_diff"),
+    path("api/slow_queries", SlowQueryReportView.as_view(), name="slow_queries"),
 ]
 
 
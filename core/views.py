@@ -0,0 +1,148 @@
+import hmac
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, HttpResponseForbidden
+from rest_framework import permissions, status
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from funiture import slow_queries
+
+from . import memory, metrics, profiling
+
+
+def metrics_view(request):
+    """Prometheus scrape endpoint; with METRICS_TOKEN set it wants "Authorization: Bearer <token>" """
+    token = getattr(settings, "METRICS_TOKEN", "")
+    if token and not hmac.compare_digest(request.headers.get("Authorization", ""), f"Bearer {token}"):
+        return HttpResponseForbidden()
+    return HttpResponse(metrics.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+class ProfileListView(APIView):
+    """Stored request profiles, newest first; ?view=<url name> narrows to one endpoint"""
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        return Response({"results": profiling.list_profiles(request.query_params.get("view"))})
+
+
+class ProfileDownloadView(APIView):
+    """One profile as a .prof file (python -m pstats, snakeviz)"""
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request, profile_id):
+        path = profiling.profile_path(profile_id)
+        if path is None:
+            return Response({"error": "Profile not found"}, status=status.HTTP_404_NOT_FOUND)
+        return FileResponse(
+            open(path, "rb"), as_attachment=True, filename=f"{profile_id}.prof", content_type="application/octet-stream",
+        )
+
+
+class ProfileAggregateView(APIView):
+    """
+    Every profile of one endpoint merged: ?view=<url name>&sort=cumulative|own|calls&limit=30.
+    ?download=1 returns the merged .prof instead.
+    """
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        view = request.query_params.get("view")
+        sort = request.query_params.get("sort", "cumulative")
+        if not view:
+            return Response({"error": "view is required"}, status=status.HTTP_400_BAD_REQUEST)
+        if sort not in profiling.SORTS:
+            return Response({"error": f"sort must be one of {', '.join(profiling.SORTS)}"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        try:
+            limit = min(int(request.query_params.get("limit", 30)), 200)
+        except ValueError:
+            return Response({"error": "limit must be a number"}, status=status.HTTP_400_BAD_REQUEST)
+
+        stats = profiling.merged(view)
+        if stats is None:
+            return Response({"error": "No profiles for this view"}, status=status.HTTP_404_NOT_FOUND)
+        if request.query_params.get("download"):
+            response = HttpResponse(profiling.merged_bytes(stats), content_type="application/octet-stream")
+            response["Content-Disposition"] = f'attachment; filename="{view}.prof"'
+            return response
+        return Response({
+            "view": view,
+            "profiles": len(profiling.list_profiles(view)),
+            "total_seconds": round(stats.total_tt, 6),
+            "functions": profiling.hot_functions(stats, sort, limit),
+        })
+
+
+class MemoryView(APIView):
+    """Latest RSS, thread count and recent samples of every worker"""
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        memory.sample()
+        return Response({
+            "ceiling_mb": getattr(settings, "MEMORY_CEILING_MB", 0),
+            "workers": [
+                {**worker, "rss_mb": round(worker["rss_bytes"] / memory.MB, 1)} for worker in memory.workers()
+            ],
+        })
+
+
+class MemorySnapshotView(APIView):
+    """
+    GET lists tracemalloc snapshots. POST asks every worker for one: this
+    worker takes it now, the others on their sampler's next tick.
+    """
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        return Response({"results": memory.list_snapshots()})
+
+    def post(self, request):
+        label = memory.request_snapshot()
+        memory.tick()
+        return Response({
+            "label": label,
+            "workers": len(memory.workers()),
+            "ready_within_seconds": getattr(settings, "MEMORY_SAMPLE_INTERVAL", 30),
+        }, status=status.HTTP_202_ACCEPTED)
+
+
+class MemoryDiffView(APIView):
+    """Allocation sites that grew most in one worker: ?pid=&before=<label>&after=<label>&key=lineno&limit=25"""
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        params = request.query_params
+        key = params.get("key", "lineno")
+        if key not in memory.SNAPSHOT_KEYS:
+            return Response({"error": f"key must be one of {', '.join(memory.SNAPSHOT_KEYS)}"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        try:
+            pid = int(params["pid"])
+            limit = min(int(params.get("limit", 25)), 200)
+            before, after = params["before"], params["after"]
+        except (KeyError, ValueError):
+            return Response({"error": "pid, before and after are required"}, status=status.HTTP_400_BAD_REQUEST)
+
+        sites = memory.diff(pid, before, after, key, limit)
+        if sites is None:
+            return Response({"error": "Snapshot not found"}, status=status.HTTP_404_NOT_FOUND)
+        return Response({"pid": pid, "before": before, "after": after, "results": sites})
+
+
+class SlowQueryReportView(APIView):
+    """Slow-query log, worst first: ?order=total_ms|max_ms|count&limit=20"""
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        order = request.query_params.get("order", "total_ms")
+        if order not in slow_queries.ORDERS:
+            return Response({"error": f"order must be one of {', '.join(slow_queries.ORDERS)}"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        try:
+            limit = min(int(request.query_params.get("limit", 20)), 200)
+        except ValueError:
+            return Response({"error": "limit must be a number"}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({"results": [slow_queries.as_dict(row) for row in slow_queries.report(limit, order)]})
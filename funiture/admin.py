@@ -1,16 +1,229 @@
+from django import forms
 from django.contrib import admin
-from .models import Product,InputEmail,  Order, OrderItem,  RecentlyViewed, Address, Category, Cart, CartItem, WishList, ProductImage
+from django.core.files.uploadedfile import UploadedFile
+from django.db.models import Count, Q
+from utils.paginator import EstimatedCountPaginator
+from . import image_uploads
+from .models import (Product,InputEmail,  Order, OrderItem,  RecentlyViewed, Address, Category, Cart, CartItem, WishList, ProductImage,
+                     PendingUpload, SlowQuery)
 
 
 # Register your models here.
 
+class BigTableAdmin(admin.ModelAdmin):
+    """
+    Changelists for tables that keep growing: estimated counts on PostgreSQL,
+    no second full count, and FK widgets that don't render every product.
+    Subclasses list the joins their list_display / __str__ need in
+    list_select_related.
+    """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    list_per_page = 50
+
+
+class ProductImageInline(admin.TabularInline):
+    model = ProductImage
+    extra = 0
+    # new gallery images come in through ProductAdminForm.gallery_uploads
+    fields = readonly_fields = ("image",)
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+
+class PendingUploadInline(admin.TabularInline):
+    model = PendingUpload
+    extra = 0
+    fields = readonly_fields = ("path", "main", "status", "error", "created_at")
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+
+class MultipleFileInput(forms.ClearableFileInput):
+    allow_multiple_selected = True
+
+
+class MultipleImageField(forms.ImageField):
+    widget = MultipleFileInput
+
+    def clean(self, data, initial=None):
+        files = data if isinstance(data, (list, tuple)) else [data] if data else []
+        return [super(MultipleImageField, self).clean(file, initial) for file in files]
+
+
+class ProductAdminForm(forms.ModelForm):
+    gallery_uploads = MultipleImageField(required=False, help_text="Uploaded in the background after saving")
+
+    class Meta:
+        model = Product
+        fields = "__all__"
+
+
 class ProductAdmin(admin.ModelAdmin):
-    list_display = ("name", "price", "featured")
+    form = ProductAdminForm
+    list_display = ("name", "price", "stock", "featured", "is_popular", "image_status")
+    list_filter = ("featured", "is_popular")
+    search_fields = ("name", "slug")
+    autocomplete_fields = ("categories",)
+    inlines = [ProductImageInline, PendingUploadInline]
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        # only the changelist shows image_status; the change/delete views and
+        # the product autocomplete of other admins stay plain lookups
+        match = request.resolver_match
+        if match is None or not (match.url_name or "").endswith("_changelist"):
+            return queryset
+        return queryset.annotate(
+            uploads_pending=Count("pending_uploads", filter=Q(
+                pending_uploads__status__in=[PendingUpload.PENDING, PendingUpload.UPLOADING],
+            )),
+            uploads_failed=Count("pending_uploads", filter=Q(pending_uploads__status=PendingUpload.FAILED)),
+        )
+
+    @admin.display(description="Images")
+    def image_status(self, obj):
+        if obj.uploads_failed:
+            return f"{obj.uploads_failed} failed"
+        if obj.uploads_pending:
+            return f"{obj.uploads_pending} uploading"
+        return "ready"
+
+    def save_model(self, request, obj, form, change):
+        # an UploadedFile here would be sent to Cloudinary inside this request;
+        # keep the current image and let the background queue swap it in
+        image = form.cleaned_data.get("image")
+        main = image if isinstance(image, UploadedFile) else None
+        if main is not None:
+            obj.image = form.initial.get("image") if change else ""
+        super().save_model(request, obj, form, change)
+        image_uploads.enqueue(obj, main=main, gallery=form.cleaned_data.get("gallery_uploads") or (), new=not change)
 admin.site.register(Product, ProductAdmin)
 
 class CategoryAdmin(admin.ModelAdmin):
     list_display = ("name", "slug")
+    search_fields = ("name",)
 admin.site.register(Category, CategoryAdmin)
 
-admin.site.register({Order, InputEmail, OrderItem, Cart, CartItem, WishList, ProductImage, Address, RecentlyViewed})
 
+class OrderItemInline(admin.TabularInline):
+    model = OrderItem
+    extra = 0
+    raw_id_fields = ("product",)
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related("product")
+
+
+class OrderAdmin(BigTableAdmin):
+    list_display = ("paystack_checkout_id", "customer_email", "amount", "currency", "status", "created_at")
+    # served by the status/created_at indexes on Order
+    list_filter = ("status", ("created_at", admin.DateFieldListFilter))
+    search_fields = ("=paystack_checkout_id", "=customer_email")
+    inlines = [OrderItemInline]
+admin.site.register(Order, OrderAdmin)
+
+
+class OrderItemAdmin(BigTableAdmin):
+    list_display = ("order", "product", "quantity")
+    list_select_related = ("order", "product")
+    list_filter = ("order__status",)
+    search_fields = ("=order__paystack_checkout_id",)
+    raw_id_fields = ("order",)
+    autocomplete_fields = ("product",)
+admin.site.register(OrderItem, OrderItemAdmin)
+
+
+class CartItemInline(admin.TabularInline):
+    model = CartItem
+    extra = 0
+    raw_id_fields = ("product",)
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related("product")
+
+
+class CartAdmin(BigTableAdmin):
+    list_display = ("cart_code", "created_at", "updated_at")
+    search_fields = ("=cart_code",)
+    inlines = [CartItemInline]
+admin.site.register(Cart, CartAdmin)
+
+
+class CartItemAdmin(BigTableAdmin):
+    list_display = ("cart", "product", "quantity")
+    list_select_related = ("cart", "product")
+    raw_id_fields = ("cart",)
+    autocomplete_fields = ("product",)
+admin.site.register(CartItem, CartItemAdmin)
+
+
+class WishListAdmin(BigTableAdmin):
+    list_display = ("user", "product", "created")
+    list_select_related = ("user", "product")
+    autocomplete_fields = ("user", "product")
+admin.site.register(WishList, WishListAdmin)
+
+
+class RecentlyViewedAdmin(BigTableAdmin):
+    list_display = ("user", "product", "viewed_at")
+    list_select_related = ("user", "product")
+    autocomplete_fields = ("user", "product")
+admin.site.register(RecentlyViewed, RecentlyViewedAdmin)
+
+
+class AddressAdmin(BigTableAdmin):
+    list_display = ("first_name", "last_name", "user", "city", "region")
+    list_select_related = ("user",)
+    search_fields = ("last_name", "=user__email")
+    autocomplete_fields = ("user",)
+admin.site.register(Address, AddressAdmin)
+
+
+class ProductImageAdmin(admin.ModelAdmin):
+    list_display = ("product", "image")
+    list_select_related = ("product",)
+    autocomplete_fields = ("product",)
+admin.site.register(ProductImage, ProductImageAdmin)
+
+
+@admin.action(description="Retry selected failed uploads")
+def retry_uploads(modeladmin, request, queryset):
+    count = image_uploads.retry(queryset.filter(status=PendingUpload.FAILED))
+    modeladmin.message_user(request, f"{count} uploads queued again")
+
+
+class PendingUploadAdmin(admin.ModelAdmin):
+    list_display = ("path", "product", "main", "status", "error", "created_at")
+    list_filter = ("status",)
+    list_select_related = ("product",)
+    raw_id_fields = ("product",)
+    actions = [retry_uploads]
+admin.site.register(PendingUpload, PendingUploadAdmin)
+
+
+class InputEmailAdmin(BigTableAdmin):
+    list_display = ("email", "created_at")
+    search_fields = ("email",)
+admin.site.register(InputEmail, InputEmailAdmin)
+
+
+class SlowQueryAdmin(admin.ModelAdmin):
+    """Written by funiture/slow_queries.py; read-only here"""
+    list_display = ("fingerprint_short", "count", "total_ms", "max_ms", "last_seen")
+    ordering = ("-total_ms",)
+    search_fields = ("fingerprint",)
+    readonly_fields = [field.name for field in SlowQuery._meta.fields]
+
+    @admin.display(description="fingerprint")
+    def fingerprint_short(self, obj):
+        return obj.fingerprint[:120]
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+admin.site.register(SlowQuery, SlowQueryAdmin)
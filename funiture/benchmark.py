@@ -0,0 +1,593 @@
+"""
+Endpoint load benchmark.
+
+seed() fills the database with a catalogue, customers, carts, wishlists,
+orders and everything derived from them (sales rollups, recommendations,
+similar products, popularity, recently viewed). scenarios() builds one list of
+requests per route in funiture/urls.py and account/urls.py; every request
+gets its own inputs (fresh carts, tokens, emails) so write endpoints do real
+work each time. run() sends them through Django's WSGI handler, a route at a
+time from a thread pool, and reports throughput, p50/p95/p99 latency and
+queries per request for each route.
+
+Nothing leaves the machine: offline() swaps in local stand-ins for Paystack,
+Google's userinfo endpoint and Resend, and uses the fake Cloudinary uploader.
+compare() checks a run against a saved baseline.
+"""
+import hashlib
+import hmac
+import io
+import json
+import random
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager
+from datetime import timedelta
+from unittest import mock
+from urllib.parse import urlencode
+
+import resend
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management import call_command
+from django.core.signals import got_request_exception
+from django.db import connections
+from django.test.utils import override_settings
+from django.urls import URLResolver, get_resolver
+from django.utils import timezone
+
+from account import views as account_views
+from core.middleware import QueryRecorder
+from utils.jwt_token import token_generator
+
+from . import image_variants, popularity, recently_viewed, recommendations, similarity
+from . import views as funiture_views
+from .facets import catalog_index
+from .models import (Address, Cart, CartItem, Category, Order, OrderItem, Product, ProductImage, WishList)
+
+User = get_user_model()
+
+PASSWORD = "Benchmark-pass-2024"
+ROUTE_MODULES = ("funiture.urls", "account.urls")
+
+MATERIALS = ["Oak", "Walnut", "Teak", "Pine", "Rattan", "Velvet", "Linen", "Leather", "Marble", "Steel"]
+STYLES = ["Nordic", "Classic", "Modern", "Rustic", "Mid-century", "Industrial", "Coastal", "Minimal"]
+KINDS = ["Chair", "Sofa", "Table", "Bed", "Wardrobe", "Desk", "Bookshelf", "Stool", "Ottoman", "Dresser",
+         "Armchair", "Sideboard"]
+ROOMS = ["Living Room", "Bedroom", "Dining", "Office", "Outdoor", "Kids", "Storage", "Lighting"]
+
+
+# offline stand-ins
+
+class FakeResponse:
+    def __init__(self, status_code, payload):
+        self.status_code = status_code
+        self.payload = payload
+        self.text = json.dumps(payload)
+
+    def json(self):
+        return self.payload
+
+
+class FakeServices:
+    """
+    Paystack checkout, Google userinfo and Resend, answered locally after
+    `latency` seconds (to stand in for the network round trip).
+    """
+
+    def __init__(self, latency=0):
+        self.latency = latency
+        self.calls = {"paystack": 0, "google": 0, "resend": 0}
+
+    def _call(self, name):
+        self.calls[name] += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def paystack_checkout(self, payload):
+        self._call("paystack")
+        return True, f"https://checkout.paystack.test/{payload['reference']}"
+
+    def google_get(self, url, headers=None, **kwargs):
+        self._call("google")
+        token = (headers or {}).get("Authorization", "").removeprefix("Bearer ").strip()
+        if not token:
+            return FakeResponse(401, {"error": "invalid_token"})
+        return FakeResponse(200, {
+            "email": f"{token}@gmail.test", "given_name": "Google", "family_name": token, "picture": "",
+        })
+
+    def resend_send(self, params):
+        self._call("resend")
+        return {"id": uuid.uuid4().hex}
+
+
+@contextmanager
+def offline(services=None):
+    services = services or FakeServices()
+    with ExitStack() as stack:
+        stack.enter_context(mock.patch.object(funiture_views, "checkout", services.paystack_checkout))
+        stack.enter_context(mock.patch.object(account_views, "requests", mock.Mock(get=services.google_get)))
+        stack.enter_context(mock.patch.object(resend.Emails, "send", services.resend_send))
+        stack.enter_context(override_settings(IMAGE_UPLOADER="fake"))
+        yield services
+
+
+# data
+
+class Dataset:
+    """Ids of what seed() created, for scenarios() to pick from"""
+
+    def __init__(self):
+        self.categories = []
+        self.products = []  # (id, slug)
+        self.users = []
+        self.unverified = []
+        self.admin = None
+        self.carts = []
+
+
+def seed(products=1000, users=200, orders=2000, carts=100, rng=None):
+    rng = rng or random.Random(0)
+    data = Dataset()
+
+    data.categories = Category.objects.bulk_create(
+        Category(name=f"{style} {room}", slug=f"{style}-{room}".lower().replace(" ", "-"))
+        for style in STYLES for room in ROOMS
+    )
+    rows = []
+    for i in range(products):
+        material, style, kind = rng.choice(MATERIALS), rng.choice(STYLES), rng.choice(KINDS)
+        image = f"image/upload/v1/products/{kind.lower()}_{i}.jpg"
+        rows.append(Product(
+            name=f"{style} {material} {kind} {i}", slug=f"{style}-{material}-{kind}-{i}".lower(),
+            description=(
+                f"A {style.lower()} {kind.lower()} in {material.lower()}, built to last. "
+                f"Pairs well with other {style.lower()} pieces. " * rng.randint(1, 4)
+            ),
+            price=f"{rng.randint(15, 900) * 1000 + 99}.00", stock=rng.randint(0, 50),
+            featured=rng.random() < 0.1, fabric=rng.choice([None, "Linen", "Velvet", "Leather", "Cotton"]),
+            dimension=f"{rng.randint(40, 220)}x{rng.randint(40, 120)}cm", height=rng.randint(40, 200),
+            image=image, image_variants=image_variants.build(image),
+        ))
+    created = Product.objects.bulk_create(rows, batch_size=500)
+    data.products = [(product.pk, product.slug) for product in created]
+    product_ids = [pk for pk, _ in data.products]
+    Product.categories.through.objects.bulk_create(
+        (
+            Product.categories.through(product_id=pk, category_id=category.pk)
+            for pk in product_ids
+            for category in rng.sample(data.categories, rng.randint(1, 3))
+        ),
+        batch_size=1000,
+    )
+    gallery = [
+        (product.pk, f"image/upload/v1/products/gallery_{product.pk}_{n}.jpg") for product in created for n in range(3)
+    ]
+    ProductImage.objects.bulk_create(
+        (ProductImage(product_id=pk, image=image, image_variants=image_variants.build(image)) for pk, image in gallery),
+        batch_size=1000,
+    )
+
+    # one hash for everyone; hashing per user would dominate seeding
+    password = make_password(PASSWORD)
+    data.users = User.objects.bulk_create(
+        User(email=f"customer{i}@example.com", username=f"customer{i}", password=password,
+             is_active=True, is_verified=True)
+        for i in range(users)
+    )
+    data.unverified = User.objects.bulk_create(
+        User(email=f"pending{i}@example.com", username=f"pending{i}", password=password, is_active=False)
+        for i in range(max(users // 10, 1))
+    )
+    data.admin = User.objects.create(
+        email="admin@example.com", username="admin", password=password,
+        is_active=True, is_verified=True, is_staff=True, is_superuser=True,
+    )
+
+    WishList.objects.bulk_create(
+        (
+            WishList(user=user, product_id=pk)
+            for user in data.users for pk in rng.sample(product_ids, min(rng.randint(0, 20), len(product_ids)))
+        ),
+        batch_size=1000,
+    )
+    Address.objects.bulk_create(
+        Address(user=user, first_name="Ada", last_name=f"Customer{n}", phone_number="08000000000",
+                delivery_address=f"{n + 1} Marina Road", region="Lagos", city="Lagos")
+        for user in data.users for n in range(rng.randint(1, 3))
+    )
+    data.carts = Cart.objects.bulk_create(Cart() for _ in range(carts))
+    CartItem.objects.bulk_create(
+        CartItem(cart=cart, product_id=pk, quantity=rng.randint(1, 3))
+        for cart in data.carts for pk in rng.sample(product_ids, min(rng.randint(1, 8), len(product_ids)))
+    )
+
+    now = timezone.now()
+    created_orders = Order.objects.bulk_create(
+        (
+            Order(paystack_checkout_id=f"seed_{i}", amount="0.00", currency="NGN",
+                  customer_email=rng.choice(data.users).email, status="Paid")
+            for i in range(orders)
+        ),
+        batch_size=1000,
+    )
+    for order in created_orders:
+        order.created_at = now - timedelta(days=rng.randint(0, 180), minutes=rng.randint(0, 1440))
+    Order.objects.bulk_update(created_orders, ["created_at"], batch_size=500)
+    ordered = {}
+    items = []
+    for order in created_orders:
+        for pk in rng.sample(product_ids, min(rng.randint(1, 5), len(product_ids))):
+            quantity = rng.randint(1, 3)
+            items.append(OrderItem(order=order, product_id=pk, quantity=quantity))
+            ordered[pk] = ordered.get(pk, 0) + quantity
+    OrderItem.objects.bulk_create(items, batch_size=1000)
+
+    # derived data, as the live code paths would have left it
+    call_command("backfill_sales", stdout=io.StringIO())
+    popularity.record("order", ordered)
+    recommendations.rebuild()
+    similarity.rebuild()
+    for user in data.users:
+        for pk in rng.sample(product_ids, min(10, len(product_ids))):
+            recently_viewed.record_view(user.pk, pk)
+    recently_viewed.flush()
+    catalog_index.invalidate()
+    return data
+
+
+# requests
+
+class Call:
+    def __init__(self, route, method, path, data=None, query=None, cookies=None, headers=None, raw=None):
+        self.route = route
+        self.method = method
+        self.path = path
+        self.body = raw if raw is not None else (json.dumps(data).encode() if data is not None else b"")
+        self.query = urlencode(query or {})
+        self.cookies = cookies or {}
+        self.headers = headers or {}
+
+    def environ(self):
+        environ = {
+            "REQUEST_METHOD": self.method,
+            "SCRIPT_NAME": "",
+            "PATH_INFO": self.path,
+            "QUERY_STRING": self.query,
+            "SERVER_NAME": "testserver",
+            "SERVER_PORT": "80",
+            "SERVER_PROTOCOL": "HTTP/1.1",
+            "HTTP_HOST": "testserver",
+            "CONTENT_TYPE": "application/json",
+            "CONTENT_LENGTH": str(len(self.body)),
+            "wsgi.version": (1, 0),
+            "wsgi.url_scheme": "http",
+            "wsgi.input": io.BytesIO(self.body),
+            "wsgi.errors": sys.stderr,
+            "wsgi.multithread": True,
+            "wsgi.multiprocess": False,
+            "wsgi.run_once": False,
+        }
+        if self.cookies:
+            environ["HTTP_COOKIE"] = "; ".join(f"{name}={value}" for name, value in self.cookies.items())
+        for name, value in self.headers.items():
+            environ[f"HTTP_{name.upper().replace('-', '_')}"] = value
+        return environ
+
+
+def routes():
+    """Every route of funiture/urls.py and account/urls.py, as "api/products/<slug:slug>" """
+    found = []
+    for resolver in get_resolver().url_patterns:
+        if isinstance(resolver, URLResolver) and getattr(resolver.urlconf_module, "__name__", "") in ROUTE_MODULES:
+            found.extend(f"{resolver.pattern}{pattern.pattern}" for pattern in resolver.url_patterns)
+    return found
+
+
+def scenarios(data, rng=None):
+    """
+    {"METHOD route": factory(i) -> Call}. Factories run before the clock
+    starts and may create the rows a request consumes (carts, tokens, users).
+    """
+    rng = rng or random.Random(1)
+    product_ids = [pk for pk, _ in data.products]
+    slugs = [slug for _, slug in data.products]
+    users, unverified, carts = data.users, data.unverified, data.carts
+    by_id = {user.pk: user for user in users}
+    wished = list(WishList.objects.order_by("id").values_list("user_id", "product_id")[:1000])
+    access = {}
+
+    def auth(user):
+        if user.pk not in access:
+            access[user.pk] = token_generator(user)["access"]
+        return {"access_token": access[user.pk]}
+
+    def user(i):
+        return users[i % len(users)]
+
+    def customer(i):
+        return auth(user(i))
+
+    def filled_cart():
+        cart = Cart.objects.create()
+        CartItem.objects.bulk_create(
+            CartItem(cart=cart, product_id=pk, quantity=rng.randint(1, 3)) for pk in rng.sample(product_ids, 3)
+        )
+        return cart
+
+    def webhook(i):
+        cart = filled_cart()
+        body = json.dumps({"event": "charge.success", "data": {
+            "id": f"bench_{uuid.uuid4().hex}", "amount": 5000000, "currency": "NGN",
+            "customer": {"email": user(i).email}, "metadata": {"cart_code": str(cart.cart_code)},
+        }}).encode()
+        signature = hmac.new(settings.PAYSTACK_SECRET_KEY.encode(), body, hashlib.sha512).hexdigest()
+        return Call("api/webhook/paystack/", "POST", "/api/webhook/paystack/", raw=body,
+                    headers={"X-Paystack-Signature": signature})
+
+    def checkout(i):
+        return Call("api/create_paystack_checkout_session", "POST", "/api/create_paystack_checkout_session",
+                    {"shipping_method": "standard"},
+                    cookies={**customer(i), "cart_code": filled_cart().cart_code})
+
+    def address_delete(i):
+        address = Address.objects.create(user=user(i), first_name="Temp", last_name="Address",
+                                         delivery_address="1 Temp Street", region="Lagos", city="Ikeja")
+        return Call("api/address", "DELETE", "/api/address", {"address_id": address.pk}, cookies=customer(i))
+
+    def address_put(i):
+        address = Address.objects.filter(user=user(i)).first()
+        return Call("api/address", "PUT", "/api/address", {
+            "address_id": address.pk, "first_name": "Ada", "last_name": "Updated", "phone_number": "08011111111",
+            "delivery_address": "2 Marina Road", "region": "Lagos", "city": "Lagos",
+        }, cookies=customer(i))
+
+    def pending_user(i):
+        return User.objects.create(email=f"confirm{uuid.uuid4().hex[:12]}@example.com", is_active=False)
+
+    def refresh_token(i):
+        return token_generator(user(i))["refresh"]
+
+    return {
+        # funiture/urls.py
+        "POST api/getemail": lambda i: Call(
+            "api/getemail", "POST", "/api/getemail", {"email": f"lead{uuid.uuid4().hex[:12]}@example.com"}),
+        "GET api/cart": lambda i: Call(
+            "api/cart", "GET", "/api/cart", cookies={"cart_code": carts[i % len(carts)].cart_code}),
+        "GET api/recent": lambda i: Call("api/recent", "GET", "/api/recent", cookies=customer(i)),
+        "POST api/recent": lambda i: Call(
+            "api/recent", "POST", "/api/recent", {"product_id": rng.choice(product_ids)}, cookies=customer(i)),
+        "GET api/profile": lambda i: Call("api/profile", "GET", "/api/profile", cookies=customer(i)),
+        "GET api/bootstrap": lambda i: Call(
+            "api/bootstrap", "GET", "/api/bootstrap",
+            cookies={**customer(i), "cart_code": carts[i % len(carts)].cart_code}),
+        "GET api/getwishlist": lambda i: Call("api/getwishlist", "GET", "/api/getwishlist", cookies=customer(i)),
+        "GET api/wishlistdetail": lambda i: Call(
+            "api/wishlistdetail", "GET", "/api/wishlistdetail", query={"product_id": wished[i % len(wished)][1]},
+            cookies=auth(by_id[wished[i % len(wished)][0]])),
+        "GET api/wishlist_membership": lambda i: Call(
+            "api/wishlist_membership", "GET", "/api/wishlist_membership",
+            query={"product_ids": ",".join(map(str, rng.sample(product_ids, min(24, len(product_ids)))))},
+            cookies=customer(i)),
+        "GET api/product_list": lambda i: Call("api/product_list", "GET", "/api/product_list"),
+        "POST api/get_product_list": lambda i: Call(
+            "api/get_product_list", "POST", "/api/get_product_list",
+            {"ids": rng.sample(product_ids, min(12, len(product_ids)))}),
+        "GET api/products/<slug:slug>": lambda i: Call(
+            "api/products/<slug:slug>", "GET", f"/api/products/{rng.choice(slugs)}"),
+        "GET api/products/<slug:slug>/also_bought": lambda i: Call(
+            "api/products/<slug:slug>/also_bought", "GET", f"/api/products/{rng.choice(slugs)}/also_bought"),
+        "GET api/products/<slug:slug>/similar": lambda i: Call(
+            "api/products/<slug:slug>/similar", "GET", f"/api/products/{rng.choice(slugs)}/similar"),
+        "GET api/catalog": lambda i: Call(
+            "api/catalog", "GET", "/api/catalog",
+            query={"category": rng.choice(data.categories).pk, "in_stock": "true"}),
+        "GET api/popular": lambda i: Call("api/popular", "GET", "/api/popular", query={"limit": 20}),
+        "GET api/category_list": lambda i: Call("api/category_list", "GET", "/api/category_list"),
+        "POST api/add_to_cart": lambda i: Call(
+            "api/add_to_cart", "POST", "/api/add_to_cart", {"product_id": rng.choice(product_ids)},
+            cookies={"cart_code": uuid.uuid4()}),
+        "PUT api/update_cartitem": lambda i: Call(
+            "api/update_cartitem", "PUT", "/api/update_cartitem",
+            {"product_id": rng.choice(product_ids), "quantity": 2}, cookies={"cart_code": filled_cart().cart_code}),
+        "DELETE api/update_cartitem": lambda i: Call(
+            "api/update_cartitem", "DELETE", "/api/update_cartitem",
+            {"product_id": (cart := filled_cart()).cartitems.values_list("product_id", flat=True).first()},
+            cookies={"cart_code": cart.cart_code}),
+        "POST api/add_to_wishlist": lambda i: Call(
+            "api/add_to_wishlist", "POST", "/api/add_to_wishlist",
+            {"product_id": rng.sample(product_ids, 3)}, cookies=customer(i)),
+        "GET api/address": lambda i: Call("api/address", "GET", "/api/address", cookies=customer(i)),
+        "POST api/address": lambda i: Call("api/address", "POST", "/api/address", {
+            "first_name": "Ada", "last_name": "New", "phone_number": "08022222222",
+            "delivery_address": "3 Broad Street", "region": "Lagos", "city": "Lagos",
+        }, cookies=customer(i)),
+        "PUT api/address": address_put,
+        "DELETE api/address": address_delete,
+        "GET api/search": lambda i: Call(
+            "api/search", "GET", "/api/search", query={"query": rng.choice(MATERIALS + KINDS).lower()}),
+        "POST api/create_paystack_checkout_session": checkout,
+        "POST api/webhook/paystack/": webhook,
+        "GET api/orderitem": lambda i: Call("api/orderitem", "GET", "/api/orderitem", cookies=customer(i)),
+        "GET api/analytics/sales": lambda i: Call(
+            "api/analytics/sales", "GET", "/api/analytics/sales",
+            query={"start": (timezone.localdate() - timedelta(days=90)).isoformat()}, cookies=auth(data.admin)),
+        "GET api/analytics/products": lambda i: Call(
+            "api/analytics/products", "GET", "/api/analytics/products", cookies=auth(data.admin)),
+        "GET api/analytics/categories": lambda i: Call(
+            "api/analytics/categories", "GET", "/api/analytics/categories", cookies=auth(data.admin)),
+
+        # account/urls.py
+        "GET api/accounts/api/auth/me": lambda i: Call(
+            "api/accounts/api/auth/me", "GET", "/api/accounts/api/auth/me", cookies=customer(i)),
+        "POST api/accounts/register": lambda i: Call(
+            "api/accounts/register", "POST", "/api/accounts/register", {
+                "username": f"new{uuid.uuid4().hex[:10]}", "email": f"new{uuid.uuid4().hex[:12]}@example.com",
+                "password": PASSWORD, "confirm_password": PASSWORD,
+            }),
+        "GET api/accounts/confirm_email/<str:token>": lambda i: Call(
+            "api/accounts/confirm_email/<str:token>", "GET",
+            f"/api/accounts/confirm_email/{token_generator(pending_user(i))['access']}"),
+        "POST api/accounts/resend_confirm_email": lambda i: Call(
+            "api/accounts/resend_confirm_email", "POST", "/api/accounts/resend_confirm_email",
+            {"email": unverified[i % len(unverified)].email}),
+        "POST api/accounts/reset_password": lambda i: Call(
+            "api/accounts/reset_password", "POST", "/api/accounts/reset_password", {"email": user(i).email}),
+        "POST api/accounts/set_password/<str:token>": lambda i: Call(
+            "api/accounts/set_password/<str:token>", "POST",
+            f"/api/accounts/set_password/{customer(i)['access_token']}",
+            {"new_password": PASSWORD, "confirm_new_password": PASSWORD}),
+        "POST api/accounts/logout": lambda i: Call(
+            "api/accounts/logout", "POST", "/api/accounts/logout", cookies={"refresh_token": refresh_token(i)}),
+        "POST api/accounts/google_login": lambda i: Call(
+            "api/accounts/google_login", "POST", "/api/accounts/google_login",
+            {"token": f"google-user-{i % len(users)}"}),
+        "POST api/accounts/jwt/token": lambda i: Call(
+            "api/accounts/jwt/token", "POST", "/api/accounts/jwt/token",
+            {"email": user(i).email, "password": PASSWORD}),
+        "POST api/accounts/jwt/token/refresh": lambda i: Call(
+            "api/accounts/jwt/token/refresh", "POST", "/api/accounts/jwt/token/refresh",
+            cookies={"refresh_token": refresh_token(i)}),
+        "POST api/accounts/jwt/token/verify": lambda i: Call(
+            "api/accounts/jwt/token/verify", "POST", "/api/accounts/jwt/token/verify",
+            {"token": customer(i)["access_token"]}),
+        "POST api/accounts/jwt/token/blacklist": lambda i: Call(
+            "api/accounts/jwt/token/blacklist", "POST", "/api/accounts/jwt/token/blacklist",
+            {"refresh": refresh_token(i)}),
+    }
+
+
+def uncovered(factories):
+    """Routes nothing in scenarios() exercises"""
+    covered = {name.split(" ", 1)[1] for name in factories}
+    return [route for route in routes() if route not in covered]
+
+
+# running
+
+_current = threading.local()
+
+
+def _record_exception(sender, request=None, **kwargs):
+    exc = sys.exc_info()[1]
+    if exc is not None and getattr(_current, "failures", None) is not None:
+        _current.failures.append(f"{type(exc).__name__}: {exc}")
+
+
+def _send(app, call):
+    recorder = QueryRecorder()
+    status = []
+    _current.failures = []
+
+    def start_response(status_line, headers, exc_info=None):
+        status.append(int(status_line.split(" ", 1)[0]))
+
+    started = time.perf_counter()
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(recorder))
+        response = app(call.environ(), start_response)
+        try:
+            for _ in response:
+                pass
+        finally:
+            # fires request_finished, as a WSGI server would
+            response.close()
+    return (f"{call.method} {call.route}", status[0], time.perf_counter() - started, recorder.count,
+            _current.failures)
+
+
+def percentile(ordered, fraction):
+    """Nearest-rank percentile of a sorted list"""
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, max(0, round(fraction * len(ordered) + 0.5) - 1))]
+
+
+def summarize(samples, seconds):
+    latencies = sorted(elapsed for _, elapsed, _, _ in samples)
+    queries = [count for _, _, count, _ in samples]
+    statuses = {}
+    for status, _, _, _ in samples:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    failures = {}
+    for _, _, _, messages in samples:
+        for message in messages:
+            failures[message] = failures.get(message, 0) + 1
+    return {
+        "requests": len(samples),
+        "errors": sum(1 for status, _, _, _ in samples if status >= 400),
+        "statuses": statuses,
+        # the exceptions behind 5xx responses, most frequent first
+        "failures": dict(sorted(failures.items(), key=lambda item: -item[1])[:5]),
+        "throughput_rps": round(len(samples) / seconds, 1) if seconds else 0.0,
+        "mean_ms": round(sum(latencies) / len(latencies) * 1000, 2) if latencies else 0.0,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+        "queries_per_request": round(sum(queries) / len(queries), 2) if queries else 0.0,
+        "max_queries": max(queries, default=0),
+    }
+
+
+def run(calls, concurrency=8):
+    """
+    Send the calls through the WSGI app, one route at a time, each route's
+    calls `concurrency` at a time; returns the report compare() reads.
+    """
+    by_route = {}
+    for call in calls:
+        by_route.setdefault(f"{call.method} {call.route}", []).append(call)
+
+    app = WSGIHandler()
+    report = {"routes": {}}
+    everything, total_seconds = [], 0.0
+    got_request_exception.connect(_record_exception)
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="bench") as pool:
+            for name in sorted(by_route):
+                started = time.perf_counter()
+                samples = [sample for _, *sample in pool.map(lambda call: _send(app, call), by_route[name])]
+                seconds = time.perf_counter() - started
+                report["routes"][name] = summarize(samples, seconds)
+                everything.extend(samples)
+                total_seconds += seconds
+    finally:
+        got_request_exception.disconnect(_record_exception)
+    report["total"] = summarize(everything, total_seconds)
+    return report
+
+
+def compare(report, baseline, tolerance=0.5, min_ms=5.0, query_slack=0.5):
+    """
+    Regressions of `report` against `baseline`, as readable lines; [] if none.
+    Queries per request are a mean that moves a little with cache hits from
+    run to run, so they count once they rise by more than `query_slack`;
+    latency has to be worse by `tolerance` and by `min_ms` to ride out
+    run-to-run noise.
+    """
+    regressions = []
+    for name, base in baseline.get("routes", {}).items():
+        current = report["routes"].get(name)
+        if current is None:
+            regressions.append(f"{name}: missing from this run")
+            continue
+        if current["queries_per_request"] > base["queries_per_request"] + query_slack:
+            regressions.append(
+                f"{name}: {current['queries_per_request']} queries/request, baseline {base['queries_per_request']}"
+            )
+        for key in ("p50_ms", "p95_ms"):
+            if current[key] > base[key] * (1 + tolerance) and current[key] - base[key] > min_ms:
+                regressions.append(f"{name}: {key} {current[key]}, baseline {base[key]}")
+        if current["errors"] / current["requests"] > base["errors"] / max(base["requests"], 1):
+            regressions.append(f"{name}: {current['errors']} errors in {current['requests']} requests")
+    base_total = baseline.get("total", {}).get("throughput_rps")
+    if base_total and report["total"]["throughput_rps"] < base_total * (1 - tolerance):
+        regressions.append(f"throughput {report['total']['throughput_rps']} req/s, baseline {base_total}")
+    return regressions
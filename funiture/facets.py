@@ -0,0 +1,200 @@
+"""
+Facet index for catalog filtering.
+
+Every (facet, value) pair maps to a bitmap of product ids held in a Python
+int, so filtering is a handful of ANDs/ORs and a facet count is a popcount.
+The index is built from two queries on first use and then kept current by the
+product signals in signals.py; other worker processes notice a change through
+a version token in the cache and rebuild lazily. Reads, rebuilds and updates
+all happen under one lock, and invalidate() only marks the index stale, so a
+request never sees it half built or torn down.
+"""
+import threading
+import uuid
+from bisect import bisect_right
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+
+from core import metrics
+
+from .models import Product
+
+FACETS = ("category", "price", "featured", "is_popular", "fabric", "in_stock")
+PRICE_BUCKETS = getattr(settings, "FACET_PRICE_BUCKETS", [0, 50000, 100000, 200000, 500000])
+VERSION_KEY = "facets:version"
+
+
+def price_bucket(price):
+    bounds = PRICE_BUCKETS
+    i = max(bisect_right(bounds, Decimal(str(price))) - 1, 0)
+    return f"{bounds[i]}+" if i == len(bounds) - 1 else f"{bounds[i]}-{bounds[i + 1]}"
+
+
+def _bool(value):
+    return "true" if value else "false"
+
+
+def bitmap_ids(bitmap):
+    """Set bits of `bitmap` as a list of ids, lowest first"""
+    bits = bin(bitmap)[:1:-1]
+    ids = []
+    i = bits.find("1")
+    while i != -1:
+        ids.append(i)
+        i = bits.find("1", i + 1)
+    return ids
+
+
+class FacetIndex:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.bitmaps = {facet: {} for facet in FACETS}  # {facet: {value: bitmap}}
+        self.values = {}     # product id -> {facet: set of values}, to undo on change
+        self.prices = []     # sorted (price, id) for arbitrary price ranges
+        self.all = 0
+        self.version = None  # None until built, and again once invalidated
+
+    # building
+
+    def _entry(self, price, featured, is_popular, fabric, stock, categories):
+        return {
+            "category": {str(c) for c in categories},
+            "price": {price_bucket(price)},
+            "featured": {_bool(featured)},
+            "is_popular": {_bool(is_popular)},
+            "fabric": {fabric.strip()} if fabric and fabric.strip() else set(),
+            "in_stock": {_bool(stock and stock > 0)},
+        }
+
+    def build(self):
+        with self._lock:
+            # take the token before reading, so a change made while we read
+            # leaves us behind the cache's token and the next read rebuilds
+            cache.add(VERSION_KEY, uuid.uuid4().hex, None)
+            version = cache.get(VERSION_KEY)
+
+            categories = {}
+            for product_id, category_id in Product.categories.through.objects.values_list("product_id", "category_id"):
+                categories.setdefault(product_id, []).append(category_id)
+
+            bitmaps = {facet: {} for facet in FACETS}
+            values, prices, everything = {}, [], 0
+            for product_id, price, featured, is_popular, fabric, stock in Product.objects.values_list(
+                "id", "price", "featured", "is_popular", "fabric", "stock"
+            ):
+                entry = self._entry(price, featured, is_popular, fabric, stock, categories.get(product_id, ()))
+                bit = 1 << product_id
+                for facet, facet_values in entry.items():
+                    for value in facet_values:
+                        bitmaps[facet][value] = bitmaps[facet].get(value, 0) | bit
+                values[product_id] = entry
+                prices.append((Decimal(str(price)), product_id))
+                everything |= bit
+            prices.sort()
+
+            self.bitmaps, self.values, self.prices, self.all = bitmaps, values, prices, everything
+            self.version = version
+
+    def ensure_current(self):
+        with self._lock:
+            current = self.version is not None and cache.get(VERSION_KEY) == self.version
+            metrics.cache_lookup("facets", current)
+            if not current:
+                self.build()
+
+    def invalidate(self):
+        """Force every process to rebuild, e.g. after a queryset.update()"""
+        with self._lock:
+            cache.set(VERSION_KEY, uuid.uuid4().hex, None)
+            # the bitmaps stay in place; a stale version makes the next read rebuild
+            self.version = None
+
+    # incremental maintenance, called from signals.py
+
+    def _apply(self, product_id, entry, price):
+        bit = 1 << product_id
+        with self._lock:
+            if self.version is None or cache.get(VERSION_KEY) != self.version:
+                # not built here yet, or we missed another process's change:
+                # everyone rebuilds on their next read instead
+                self.invalidate()
+                return
+            for facet, facet_values in self.values.pop(product_id, {}).items():
+                for value in facet_values:
+                    self.bitmaps[facet][value] &= ~bit
+            self.prices = [item for item in self.prices if item[1] != product_id]
+            self.all &= ~bit
+            if entry is not None:
+                for facet, facet_values in entry.items():
+                    for value in facet_values:
+                        self.bitmaps[facet][value] = self.bitmaps[facet].get(value, 0) | bit
+                self.values[product_id] = entry
+                self.prices.insert(bisect_right(self.prices, (price, product_id)), (price, product_id))
+                self.all |= bit
+            self.version = uuid.uuid4().hex
+            cache.set(VERSION_KEY, self.version, None)
+
+    def update_product(self, product, category_ids=None):
+        if category_ids is None:
+            previous = self.values.get(product.pk, {}).get("category", set())
+            category_ids = [int(c) for c in previous]
+        entry = self._entry(
+            product.price, product.featured, product.is_popular,
+            product.fabric, product.stock, category_ids,
+        )
+        self._apply(product.pk, entry, Decimal(str(product.price)))
+
+    def remove_product(self, product_id):
+        self._apply(product_id, None, None)
+
+    # querying
+
+    def _price_range(self, price_min, price_max):
+        low = bisect_right(self.prices, (price_min, -1)) if price_min is not None else 0
+        high = bisect_right(self.prices, (price_max, float("inf"))) if price_max is not None else len(self.prices)
+        bitmap = 0
+        for _, product_id in self.prices[low:high]:
+            bitmap |= 1 << product_id
+        return bitmap
+
+    def search(self, selected, price_min=None, price_max=None):
+        """
+        selected: {facet: [values]} - OR within a facet, AND across facets.
+        Returns (matching product ids, {facet: {value: count}}) where each
+        facet's counts ignore that facet's own selection.
+        """
+        with self._lock:
+            self.ensure_current()
+            bitmaps = self.bitmaps
+            base = self.all
+            if price_min is not None or price_max is not None:
+                base &= self._price_range(price_min, price_max)
+
+            masks = {}
+            for facet, wanted in selected.items():
+                mask = 0
+                for value in wanted:
+                    mask |= bitmaps[facet].get(value, 0)
+                masks[facet] = mask
+
+            result = base
+            for mask in masks.values():
+                result &= mask
+
+            counts = {}
+            for facet in FACETS:
+                scope = base
+                for other, mask in masks.items():
+                    if other != facet:
+                        scope &= mask
+                counts[facet] = {
+                    value: count
+                    for value, bitmap in bitmaps[facet].items()
+                    if (count := (bitmap & scope).bit_count())
+                }
+        return bitmap_ids(result), counts
+
+
+catalog_index = FacetIndex()
@@ -0,0 +1,219 @@
+"""
+values()-based fast path for the hot read endpoints.
+
+A FastSerializer is compiled once from an existing ModelSerializer: every
+field is resolved to a values() lookup plus a converter up front, nested
+serializers on foreign keys are flattened into the same row, and nested
+many=True serializers become one extra query per level. Output is the same
+dicts, in the same key order, that the ModelSerializer would produce; the
+parity tests in funiture/tests.py compare the rendered JSON byte for byte.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils import timezone
+from django.utils.encoding import is_protected_type
+from rest_framework import ISO_8601, serializers
+from rest_framework.settings import api_settings
+
+from .serializers import CartSerializer, OrderItemSerializer, ProductListSerializer
+
+# Field types whose to_representation is a plain cast for the values the DB returns
+_CASTS = {
+    serializers.IntegerField: int,
+    serializers.CharField: str,
+    serializers.SlugField: str,
+    serializers.EmailField: str,
+    serializers.BooleanField: bool,
+    serializers.UUIDField: str,
+    serializers.ReadOnlyField: None,
+}
+
+
+def _model_field_converter(model_field):
+    # mirrors ModelField.to_representation -> model_field.value_to_string(obj)
+    def convert(value):
+        if is_protected_type(value):
+            return value
+        return model_field.get_prep_value(value)
+    return convert
+
+
+def _decimal_converter(field):
+    # DB decimals already carry the field's scale, so DRF's quantize is a no-op
+    slow = field.to_representation
+    coerce = getattr(field, "coerce_to_string", api_settings.COERCE_DECIMAL_TO_STRING)
+    if not coerce or field.localize or field.normalize_output or field.decimal_places is None:
+        return slow
+    exponent = -field.decimal_places
+
+    def convert(value):
+        if type(value) is Decimal and value.as_tuple().exponent == exponent:
+            return f"{value:f}"
+        return slow(value)
+    return convert
+
+
+def _is_iso_datetime(field):
+    output_format = getattr(field, "format", api_settings.DATETIME_FORMAT)
+    return (
+        type(field) is serializers.DateTimeField
+        and settings.USE_TZ
+        and not hasattr(field, "timezone")
+        and output_format is not None
+        and output_format.lower() == ISO_8601
+    )
+
+
+class _Level:
+    """Everything read by one values() query: a model plus its output shape"""
+
+    def __init__(self, model):
+        self.model = model
+        self.columns = []
+        self.children = []  # (_Level, its shape, link lookup on the child, parent pk lookup)
+
+    def add_column(self, lookup):
+        if lookup not in self.columns:
+            self.columns.append(lookup)
+        return lookup
+
+
+class FastSerializer:
+    """
+    FastSerializer(CartSerializer, methods={...}).serialize(queryset)
+
+    `methods` replaces SerializerMethodFields; keys are dotted output paths,
+    values are (lookups, func) where func(row, data) gets the raw values()
+    row of the query the field lives in (lookups are relative to that model
+    and fetched into the row) and the dict built so far.
+    """
+
+    def __init__(self, serializer_class, methods=None):
+        self.methods = methods or {}
+        self.level = _Level(serializer_class.Meta.model)
+        self.shape = self._compile(serializer_class(), self.level, prefix="", path="")
+
+    def _compile(self, serializer, level, prefix, path):
+        model = serializer.Meta.model
+        shape = []
+        for name, field in serializer.fields.items():
+            if field.write_only:
+                continue
+            dotted = f"{path}{name}"
+
+            if isinstance(field, serializers.SerializerMethodField):
+                if dotted not in self.methods:
+                    raise ImproperlyConfigured(f"FastSerializer needs a method for {dotted!r}")
+                lookups, func = self.methods[dotted]
+                for lookup in lookups:
+                    level.add_column(lookup)
+                shape.append((name, "method", func))
+
+            elif isinstance(field, serializers.ListSerializer):
+                child_level, link, parent_pk = self._compile_many(field, model, level, prefix)
+                child_shape = self._compile(field.child, child_level, "", f"{dotted}.")
+                level.children.append((child_level, child_shape, link, parent_pk))
+                shape.append((name, "many", (child_level, parent_pk)))
+
+            elif isinstance(field, serializers.BaseSerializer):
+                nested_prefix = f"{prefix}{field.source}__"
+                nested_pk = level.add_column(f"{nested_prefix}{field.Meta.model._meta.pk.name}")
+                nested_shape = self._compile(field, level, nested_prefix, f"{dotted}.")
+                shape.append((name, "nested", (nested_pk, nested_shape)))
+
+            elif _is_iso_datetime(field):
+                lookup = level.add_column(f"{prefix}{field.source}")
+                shape.append((name, "datetime", (lookup, field.to_representation)))
+
+            else:
+                lookup = level.add_column(f"{prefix}{field.source}")
+                shape.append((name, "column", (lookup, self._converter(field))))
+        return shape
+
+    def _compile_many(self, field, model, level, prefix):
+        relation = model._meta.get_field(field.source)
+        if relation.many_to_many and relation.concrete:
+            link = relation.related_query_name()
+        elif relation.one_to_many or relation.many_to_many:
+            link = relation.field.name
+        else:
+            raise ImproperlyConfigured(f"FastSerializer cannot follow {field.source!r}")
+        child_level = _Level(relation.related_model)
+        child_level.add_column(link)
+        parent_pk = level.add_column(f"{prefix}{model._meta.pk.name}")
+        return child_level, link, parent_pk
+
+    def _converter(self, field):
+        if isinstance(field, serializers.ModelField):
+            return _model_field_converter(field.model_field)
+        if type(field) is serializers.DecimalField:
+            return _decimal_converter(field)
+        for field_class, cast in _CASTS.items():
+            if type(field) is field_class:
+                return cast
+        # decimals, datetimes etc. keep DRF's own formatting
+        return field.to_representation
+
+    def serialize(self, queryset):
+        """Serialize a queryset of the root model; returns a list of dicts"""
+        rows = list(queryset.prefetch_related(None).values(*self.level.columns))
+        # resolved once per call instead of once per datetime value
+        tz = timezone.get_current_timezone()
+        return self._build_level(self.level, self.shape, rows, tz)
+
+    def _fetch(self, level, link, parent_ids):
+        rows = level.model._default_manager.filter(**{f"{link}__in": parent_ids}).values(*level.columns)
+        return list(rows)
+
+    def _build_level(self, level, shape, rows, tz):
+        many = {}
+        for child_level, child_shape, link, parent_pk in level.children:
+            parent_ids = {row[parent_pk] for row in rows if row[parent_pk] is not None}
+            grouped = defaultdict(list)
+            if parent_ids:
+                child_rows = self._fetch(child_level, link, parent_ids)
+                for row, data in zip(child_rows, self._build_level(child_level, child_shape, child_rows, tz)):
+                    grouped[row[link]].append(data)
+            many[id(child_level)] = grouped
+        return [self._build(shape, row, many, tz) for row in rows]
+
+    def _build(self, shape, row, many, tz):
+        data = {}
+        for name, kind, arg in shape:
+            if kind == "column":
+                lookup, convert = arg
+                value = row[lookup]
+                data[name] = value if value is None or convert is None else convert(value)
+            elif kind == "datetime":
+                lookup, slow = arg
+                value = row[lookup]
+                if value is None or value.tzinfo is None:
+                    data[name] = None if value is None else slow(value)
+                else:
+                    value = value.astimezone(tz).isoformat()
+                    data[name] = value[:-6] + "Z" if value.endswith("+00:00") else value
+            elif kind == "nested":
+                pk, nested_shape = arg
+                data[name] = None if row[pk] is None else self._build(nested_shape, row, many, tz)
+            elif kind == "many":
+                child_level, parent_pk = arg
+                data[name] = many[id(child_level)].get(row[parent_pk], [])
+            else:
+                data[name] = arg(row, data)
+        return data
+
+
+product_list_serializer = FastSerializer(ProductListSerializer)
+
+cart_serializer = FastSerializer(CartSerializer, methods={
+    "cartitems.sub_total": (
+        ("product__price", "quantity"),
+        lambda row, data: row["product__price"] * row["quantity"],
+    ),
+    "cart_total": ((), lambda row, data: sum(item["sub_total"] for item in data["cartitems"])),
+})
+
+order_item_serializer = FastSerializer(OrderItemSerializer)
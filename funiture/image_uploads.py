@@ -0,0 +1,192 @@
+"""
+Background image uploads.
+
+Saving a product in the admin no longer uploads to Cloudinary inside the
+request: enqueue() writes the files to local storage, records a PendingUpload
+row per file and returns. After commit a background job uploads the product's
+files concurrently through a bounded pool, swaps the final reference into
+Product.image, creates the gallery rows in one bulk_create and deletes the
+local copies. Each run first claims its rows (pending -> uploading) in one
+UPDATE and only uploads what it claimed, so a retry or the management command
+running alongside the queue never uploads a file twice. Failures stay as
+PendingUpload rows with status "failed" for the admin to retry;
+process_pending_uploads re-drives anything left behind by a restart.
+"""
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import connections, transaction
+from django.utils import timezone
+
+from . import image_variants
+from .models import PendingUpload, Product, ProductImage
+
+PENDING_DIR = "pending_uploads"
+WORKERS = getattr(settings, "IMAGE_UPLOAD_WORKERS", 4)
+
+
+class CloudinaryUploader:
+    """Uploads a local path, URL or file; returns the value a CloudinaryField stores"""
+
+    def __init__(self, folder="products"):
+        self.folder = folder
+
+    def upload(self, source):
+        from cloudinary import uploader
+        return uploader.upload_resource(source, folder=self.folder).get_prep_value()
+
+
+class FakeUploader:
+    """Offline stand-in for tests and dry runs: no network, deterministic ids"""
+
+    def __init__(self, folder="products", delay=0):
+        self.folder = folder
+        self.delay = delay
+        self.uploaded = []
+
+    def upload(self, source):
+        if self.delay:
+            time.sleep(self.delay)
+        name = getattr(source, "name", source)
+        self.uploaded.append(name)
+        stem, ext = os.path.splitext(os.path.basename(name.split("?")[0]))
+        return f"image/upload/v1/{self.folder}/{stem}{ext or '.jpg'}"
+
+
+def get_uploader():
+    """IMAGE_UPLOADER = "fake" keeps everything offline (tests, local development)"""
+    if getattr(settings, "IMAGE_UPLOADER", "cloudinary") == "fake":
+        return FakeUploader()
+    return CloudinaryUploader()
+
+
+class UploadQueue:
+    def __init__(self, workers=WORKERS):
+        self.workers = workers
+        self._lock = threading.Lock()
+        self._jobs = None     # one job per save, so a big gallery doesn't hold up others
+        self._uploads = None  # the actual uploads, bounded
+        self._futures = []
+
+    def _pools(self):
+        with self._lock:
+            if self._jobs is None:
+                self._jobs = ThreadPoolExecutor(max_workers=2, thread_name_prefix="image-jobs")
+                self._uploads = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="image-uploads")
+            return self._jobs, self._uploads
+
+    def submit(self, upload_ids):
+        jobs, _ = self._pools()
+        future = jobs.submit(self._run, list(upload_ids))
+        with self._lock:
+            self._futures = [f for f in self._futures if not f.done()] + [future]
+        return future
+
+    def wait(self, timeout=None):
+        """Block until every submitted job has finished (tests, management commands)"""
+        with self._lock:
+            futures = list(self._futures)
+        for future in futures:
+            future.result(timeout)
+
+    def _run(self, upload_ids):
+        try:
+            process(upload_ids, self._pools()[1])
+        finally:
+            # this thread's own DB connection
+            connections.close_all()
+
+
+upload_queue = UploadQueue()
+
+
+def stash(file):
+    """Save an uploaded file locally; returns its storage name"""
+    name = f"{PENDING_DIR}/{uuid.uuid4().hex}{os.path.splitext(file.name)[1].lower()}"
+    return default_storage.save(name, file)
+
+
+def enqueue(product, main=None, gallery=(), new=False):
+    """
+    Queue `main` (the new Product.image) and `gallery` files for upload once
+    the current transaction commits. A new product's main image also goes
+    into its gallery, as create_product_image_on_create does for direct saves.
+    """
+    rows = []
+    if main is not None:
+        rows.append(PendingUpload(product=product, path=stash(main), main=True, add_to_gallery=new))
+    rows.extend(PendingUpload(product=product, path=stash(file)) for file in gallery)
+    if not rows:
+        return []
+    rows = PendingUpload.objects.bulk_create(rows)
+    ids = [row.pk for row in rows]
+    transaction.on_commit(lambda: upload_queue.submit(ids))
+    return rows
+
+
+def _upload_one(uploader, pending):
+    try:
+        with default_storage.open(pending.path, "rb") as f:
+            return uploader.upload(f)
+    except Exception as e:
+        return e
+
+
+def claim(upload_ids):
+    """Mark whichever of upload_ids are still pending as ours; returns them"""
+    token = uuid.uuid4()
+    claimed = PendingUpload.objects.filter(id__in=upload_ids, status=PendingUpload.PENDING).update(
+        status=PendingUpload.UPLOADING, claim=token, claimed_at=timezone.now(),
+    )
+    if not claimed:
+        return []
+    return list(PendingUpload.objects.filter(claim=token).order_by("id"))
+
+
+def process(upload_ids, pool=None):
+    """Upload the given pending files and apply the results; returns (done, failed)"""
+    uploads = claim(upload_ids)
+    if not uploads:
+        return 0, 0
+    uploader = get_uploader()
+    if pool is None:
+        results = [_upload_one(uploader, pending) for pending in uploads]
+    else:
+        results = list(pool.map(lambda pending: _upload_one(uploader, pending), uploads))
+
+    done = [(pending, value) for pending, value in zip(uploads, results) if isinstance(value, str)]
+    failed = [(pending, error) for pending, error in zip(uploads, results) if not isinstance(error, str)]
+
+    with transaction.atomic():
+        for pending, value in done:
+            if pending.main:
+                Product.objects.filter(pk=pending.product_id).update(
+                    image=value, image_variants=image_variants.build(value),
+                )
+        ProductImage.objects.bulk_create([
+            ProductImage(product_id=pending.product_id, image=value, image_variants=image_variants.build(value))
+            for pending, value in done
+            if pending.add_to_gallery
+        ])
+        PendingUpload.objects.filter(id__in=[pending.pk for pending, _ in done]).delete()
+        for pending, error in failed:
+            PendingUpload.objects.filter(pk=pending.pk).update(
+                status=PendingUpload.FAILED, claim=None, error=str(error)[:255],
+            )
+
+    for pending, _ in done:
+        default_storage.delete(pending.path)
+    return len(done), len(failed)
+
+
+def retry(queryset):
+    """Put failed uploads back in the queue"""
+    ids = list(queryset.values_list("id", flat=True))
+    PendingUpload.objects.filter(id__in=ids, status=PendingUpload.FAILED).update(status=PendingUpload.PENDING, error="")
+    transaction.on_commit(lambda: upload_queue.submit(ids))
+    return len(ids)
@@ -0,0 +1,67 @@
+"""
+Responsive image variants.
+
+Cloudinary transformation URLs for Product.image and ProductImage.image are
+built once, when the image is saved, and stored in image_variants:
+
+    {"thumbnail": url, "card": url, "detail": url,
+     "srcset": {"webp": "url 320w, url 640w, ...", "avif": "..."}}
+
+so serializers pass them through instead of building URLs per row per request.
+Named variants use f_auto/q_auto and let Cloudinary pick WebP or AVIF per
+browser; the srcset strings are per format for <picture><source type=...>.
+The variants and widths are IMAGE_VARIANTS, IMAGE_SRCSET_WIDTHS and
+IMAGE_SRCSET_FORMATS in settings.py; refresh_image_variants rebuilds every row
+after they change.
+"""
+from cloudinary import CloudinaryResource
+from cloudinary.models import CloudinaryField
+from django.conf import settings
+from django.core.files import File
+
+# only used to parse stored values like "image/upload/v123/folder/name.jpg"
+_field = CloudinaryField("image")
+
+
+def _resource(image):
+    if not image or isinstance(image, File):
+        return None
+    resource = image if isinstance(image, CloudinaryResource) else _field.to_python(image)
+    return resource if resource is not None and resource.public_id else None
+
+
+def public_id(image):
+    """The Cloudinary public id of a CloudinaryField value; None while there is nothing uploaded yet"""
+    resource = _resource(image)
+    return resource.public_id if resource else None
+
+
+def build(image):
+    """Variant URLs for a CloudinaryField value; {} while there is nothing uploaded yet"""
+    resource = _resource(image)
+    if resource is None:
+        return {}
+
+    def url(transformation, fetch_format="auto"):
+        return resource.build_url(
+            transformation=[transformation], fetch_format=fetch_format, quality="auto", secure=True,
+        )
+
+    variants = {name: url(transformation) for name, transformation in settings.IMAGE_VARIANTS.items()}
+    widths = settings.IMAGE_SRCSET_WIDTHS
+    variants["srcset"] = {
+        fmt: ", ".join(f"{url({'width': width, 'crop': 'limit'}, fmt)} {width}w" for width in widths)
+        for fmt in settings.IMAGE_SRCSET_FORMATS
+    }
+    return variants
+
+
+def refresh(instance):
+    """
+    After a save: store variants for an image that only became a Cloudinary
+    reference during the save (an upload). One UPDATE, and only then.
+    """
+    variants = build(instance.image)
+    if variants != instance.image_variants:
+        instance.image_variants = variants
+        type(instance).objects.filter(pk=instance.pk).update(image_variants=variants)
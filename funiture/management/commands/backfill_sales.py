@@ -0,0 +1,66 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from funiture import sales
+from funiture.models import DailyCategorySales, DailyProductSales, DailySales, OrderItem
+
+
+class Command(BaseCommand):
+    help = "Rebuild the daily sales rollups from every paid order (priced at current product prices)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=5000)
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        started = time.perf_counter()
+        categories = sales.product_categories()
+        rollups = ({}, {}, {})
+
+        # lines arrive grouped by order; memory only grows with days x products
+        lines = (
+            OrderItem.objects
+            .filter(order__status="Paid")
+            .order_by("order_id")
+            .values_list("order_id", "order__created_at", "product_id", "quantity", "product__price")
+        )
+        current, date, order_lines, seen = None, None, [], 0
+        for order_id, created_at, product_id, quantity, price in lines.iterator(chunk_size=batch_size):
+            if order_id != current:
+                if order_lines:
+                    sales.add_order(rollups, date, order_lines, categories)
+                current, date, order_lines = order_id, sales.sale_date(created_at), []
+            order_lines.append((product_id, quantity, price))
+            seen += 1
+        if order_lines:
+            sales.add_order(rollups, date, order_lines, categories)
+
+        by_day, by_product, by_category = rollups
+        with transaction.atomic():
+            DailySales.objects.all().delete()
+            DailyProductSales.objects.all().delete()
+            DailyCategorySales.objects.all().delete()
+            DailySales.objects.bulk_create(
+                (DailySales(date=day, orders=o, units=u, revenue=r) for day, (o, u, r) in by_day.items()),
+                batch_size=batch_size,
+            )
+            DailyProductSales.objects.bulk_create(
+                (
+                    DailyProductSales(date=day, product_id=product_id, orders=o, units=u, revenue=r)
+                    for (day, product_id), (o, u, r) in by_product.items()
+                ),
+                batch_size=batch_size,
+            )
+            DailyCategorySales.objects.bulk_create(
+                (
+                    DailyCategorySales(date=day, category_id=category_id, orders=o, units=u, revenue=r)
+                    for (day, category_id), (o, u, r) in by_category.items()
+                ),
+                batch_size=batch_size,
+            )
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Rolled up {seen} order lines into {len(by_day)} days in {time.perf_counter() - started:.1f}s"
+        ))
@@ -0,0 +1,122 @@
+import json
+import logging
+import os
+import platform
+import random
+import tempfile
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from funiture import benchmark, recently_viewed, slow_queries
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a throwaway database and load every API route through the WSGI app, offline; "
+        "reports throughput, latency percentiles and queries per request"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--products", type=int, default=1000)
+        parser.add_argument("--users", type=int, default=200)
+        parser.add_argument("--orders", type=int, default=2000)
+        parser.add_argument("--requests", type=int, default=50, help="requests per route and method")
+        parser.add_argument("--concurrency", type=int, default=8)
+        parser.add_argument("--external-latency", type=float, default=0,
+                            help="milliseconds the Paystack/Google/Resend stand-ins take to answer")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--output", help="write the results to this JSON file")
+        parser.add_argument("--baseline", help="fail if the run regresses against this JSON file")
+        parser.add_argument("--tolerance", type=float, default=0.5,
+                            help="allowed slowdown before a latency or throughput change counts (0.5 = 50%%)")
+        parser.add_argument("--min-ms", type=float, default=5,
+                            help="latency changes smaller than this many milliseconds never count")
+        parser.add_argument("--query-slack", type=float, default=0.5,
+                            help="rise in mean queries per request that doesn't count yet")
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options["baseline"]:
+            with open(options["baseline"]) as f:
+                baseline = json.load(f)
+
+        old_name = connection.settings_dict["NAME"]
+        old_test, old_options = dict(connection.settings_dict["TEST"]), dict(connection.settings_dict["OPTIONS"])
+        if connection.vendor == "sqlite":
+            # worker threads need a file database: the shared in-memory one locks
+            # whole tables; WAL and immediate transactions let writers queue, and
+            # the long timeout covers sign-ups hashing passwords inside theirs
+            connection.settings_dict["TEST"]["NAME"] = os.path.join(tempfile.mkdtemp(), "benchmark.sqlite3")
+            connection.settings_dict["OPTIONS"].update(
+                transaction_mode="IMMEDIATE", init_command="PRAGMA journal_mode=WAL;", timeout=30,
+            )
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            report = self.benchmark(options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            connection.settings_dict["TEST"], connection.settings_dict["OPTIONS"] = old_test, old_options
+
+        self.print_report(report)
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                json.dump(report, f, indent=2, sort_keys=True)
+            self.stdout.write(f"Results written to {options['output']}")
+
+        if baseline is not None:
+            regressions = benchmark.compare(
+                report, baseline, tolerance=options["tolerance"], min_ms=options["min_ms"],
+                query_slack=options["query_slack"],
+            )
+            if regressions:
+                for line in regressions:
+                    self.stderr.write(f"  {line}")
+                raise CommandError(f"{len(regressions)} regressions against {options['baseline']}")
+            self.stdout.write(self.style.SUCCESS(f"No regressions against {options['baseline']}"))
+
+    def benchmark(self, options):
+        rng = random.Random(options["seed"])
+        # sign-up and confirmation issue tokens to inactive users on purpose
+        logging.getLogger("rest_framework_simplejwt").setLevel(logging.ERROR)
+        services = benchmark.FakeServices(latency=options["external_latency"] / 1000)
+        with benchmark.offline(services):
+            self.stdout.write("Seeding...")
+            data = benchmark.seed(
+                products=options["products"], users=options["users"], orders=options["orders"], rng=rng,
+            )
+            factories = benchmark.scenarios(data, rng)
+            missing = benchmark.uncovered(factories)
+            if missing:
+                raise CommandError(f"No benchmark scenario for: {', '.join(missing)}")
+
+            calls = [factory(i) for factory in factories.values() for i in range(options["requests"])]
+            self.stdout.write(f"Sending {len(calls)} requests, {options['concurrency']} at a time...")
+            report = benchmark.run(calls, concurrency=options["concurrency"])
+            # views and slow queries still buffered for their tables, before they go away
+            recently_viewed.flush()
+            slow_queries.flush()
+
+        report["meta"] = {
+            "at": timezone.now().isoformat(),
+            "python": platform.python_version(),
+            "django": django.get_version(),
+            "database": connection.vendor,
+            "external_calls": services.calls,
+            **{key: options[key] for key in (
+                "products", "users", "orders", "requests", "concurrency", "external_latency", "seed",
+            )},
+        }
+        return report
+
+    def print_report(self, report):
+        self.stdout.write(
+            f"\n{'route':<52} {'req/s':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'queries':>8} {'errors':>7}"
+        )
+        for name, row in [*report["routes"].items(), ("total", report["total"])]:
+            self.stdout.write(
+                f"{name[:52]:<52} {row['throughput_rps']:>8.1f} {row['p50_ms']:>8.1f} {row['p95_ms']:>8.1f}"
+                f" {row['p99_ms']:>8.1f} {row['queries_per_request']:>8.1f} {row['errors']:>7}"
+            )
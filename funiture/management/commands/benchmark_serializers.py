@@ -0,0 +1,83 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Prefetch
+
+from funiture import fast_serializers
+from funiture.models import Product, Category, Cart, CartItem, Order, OrderItem
+from funiture.serializers import ProductListSerializer, CartSerializer, OrderItemSerializer
+
+
+class Command(BaseCommand):
+    help = "Compare DRF and values()-based serializer throughput on a throwaway test database"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, nargs="+", default=[1000, 10000])
+        parser.add_argument("--repeat", type=int, default=3)
+
+    def handle(self, *args, **options):
+        old_name = connection.settings_dict["NAME"]
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            for rows in options["rows"]:
+                self.seed(rows)
+                self.stdout.write(f"\n{rows} rows")
+                for label, drf, fast in self.cases():
+                    drf_time = self.best_of(drf, options["repeat"])
+                    fast_time = self.best_of(fast, options["repeat"])
+                    self.stdout.write(
+                        f"  {label:<12} drf {rows / drf_time:>10.0f} rows/s"
+                        f"   fast {rows / fast_time:>10.0f} rows/s   x{drf_time / fast_time:.1f}"
+                    )
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    def seed(self, rows):
+        for model in (OrderItem, Order, CartItem, Cart, Product, Category):
+            model.objects.all().delete()
+        categories = Category.objects.bulk_create(Category(name=f"Category {i}", slug=f"category-{i}") for i in range(10))
+        products = Product.objects.bulk_create(
+            Product(
+                name=f"Product {i}", slug=f"product-{i}", description="A sturdy piece of furniture. " * 20,
+                price=f"{i % 500 * 100 + 99}.00", image=f"v1/products/p{i}.jpg", stock=i % 40,
+            )
+            for i in range(rows)
+        )
+        Product.categories.through.objects.bulk_create(
+            Product.categories.through(product_id=product.id, category_id=categories[i % 10].id)
+            for i, product in enumerate(products)
+        )
+        self.cart = Cart.objects.create()
+        CartItem.objects.bulk_create(CartItem(cart=self.cart, product=product, quantity=2) for product in products)
+        order = Order.objects.create(
+            paystack_checkout_id="bench", amount="1.00", currency="NGN",
+            customer_email="bench@example.com", status="Paid",
+        )
+        OrderItem.objects.bulk_create(OrderItem(order=order, product=product, quantity=1) for product in products)
+
+    def cases(self):
+        products = Product.objects.prefetch_related("categories")
+        order_items = OrderItem.objects.select_related("order", "product").prefetch_related("product__categories")
+        cart = Cart.objects.prefetch_related(Prefetch(
+            "cartitems", CartItem.objects.select_related("product").prefetch_related("product__categories")
+        )).filter(pk=self.cart.pk)
+        return [
+            ("products",
+             lambda: ProductListSerializer(products.all(), many=True).data,
+             lambda: fast_serializers.product_list_serializer.serialize(products.all())),
+            ("cart",
+             lambda: CartSerializer(cart.get()).data,
+             lambda: fast_serializers.cart_serializer.serialize(cart.all())),
+            ("order items",
+             lambda: OrderItemSerializer(order_items.all(), many=True).data,
+             lambda: fast_serializers.order_item_serializer.serialize(order_items.all())),
+        ]
+
+    def best_of(self, func, repeat):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - start)
+        return min(timings)
@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from funiture.image_uploads import CloudinaryUploader, FakeUploader
+from funiture.product_import import ProductImporter, read_rows
+
+
+class Command(BaseCommand):
+    help = (
+        "Import products from a .csv or .jsonl file. Columns: name, description, price, stock, "
+        "featured, is_popular, fabric, dimension, care, height, categories and gallery "
+        "('|'-separated in CSV) and image (local path or URL, uploaded to Cloudinary)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path")
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument("--workers", type=int, default=8, help="Concurrent image uploads")
+        parser.add_argument("--folder", default="products", help="Cloudinary folder for uploads")
+        parser.add_argument(
+            "--fake-uploads", action="store_true",
+            help="Don't contact Cloudinary; store deterministic fake image ids",
+        )
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        if not path.endswith((".csv", ".jsonl")):
+            raise CommandError("Expected a .csv or .jsonl file")
+        uploader_class = FakeUploader if options["fake_uploads"] else CloudinaryUploader
+        importer = ProductImporter(
+            uploader_class(options["folder"]),
+            batch_size=options["batch_size"],
+            workers=options["workers"],
+            stdout=self.stdout,
+        )
+        try:
+            result = importer.run(read_rows(path))
+        except OSError as e:
+            raise CommandError(str(e))
+
+        for line, error in result["errors"]:
+            self.stderr.write(f"line {line}: {error}")
+        seconds = result["seconds"] or 1e-9
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {result['created']} products and {result['uploads']} images in {seconds:.1f}s "
+            f"({result['created'] / seconds:.0f} products/s), {len(result['errors'])} rows skipped"
+        ))
@@ -0,0 +1,35 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from funiture import image_uploads
+from funiture.models import PendingUpload
+
+
+class Command(BaseCommand):
+    help = "Upload images still waiting in PendingUpload, e.g. after a restart killed the background queue"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--retry-failed", action="store_true", help="Also retry uploads that failed before")
+        parser.add_argument("--batch-size", type=int, default=100)
+        parser.add_argument(
+            "--stale-minutes", type=int, default=30,
+            help="Take back uploads claimed longer ago than this, whose worker must have died",
+        )
+
+    def handle(self, *args, **options):
+        if options["retry_failed"]:
+            PendingUpload.objects.filter(status=PendingUpload.FAILED).update(status=PendingUpload.PENDING, error="")
+        PendingUpload.objects.filter(
+            status=PendingUpload.UPLOADING, claimed_at__lt=timezone.now() - timedelta(minutes=options["stale_minutes"]),
+        ).update(status=PendingUpload.PENDING, claim=None)
+        ids = list(PendingUpload.objects.filter(status=PendingUpload.PENDING).order_by("id").values_list("id", flat=True))
+        done = failed = 0
+        with ThreadPoolExecutor(max_workers=image_uploads.WORKERS) as pool:
+            for start in range(0, len(ids), options["batch_size"]):
+                batch_done, batch_failed = image_uploads.process(ids[start:start + options["batch_size"]], pool)
+                done += batch_done
+                failed += batch_failed
+        self.stdout.write(self.style.SUCCESS(f"{done} uploaded, {failed} failed"))
@@ -0,0 +1,17 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from funiture import recommendations
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the "customers also bought" tables from every paid order'
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=10000)
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        recommendations.rebuild(options["batch_size"], self.stdout)
+        self.stdout.write(self.style.SUCCESS(f"Done in {time.perf_counter() - started:.1f}s"))
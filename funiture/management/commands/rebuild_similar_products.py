@@ -0,0 +1,17 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from funiture import similarity
+
+
+class Command(BaseCommand):
+    help = "Recompute TF-IDF vectors and similar-product neighbours for the whole catalog"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=5000)
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        similarity.rebuild(options["batch_size"], self.stdout)
+        self.stdout.write(self.style.SUCCESS(f"Done in {time.perf_counter() - started:.1f}s"))
@@ -0,0 +1,52 @@
+import time
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from funiture import popularity
+from funiture.models import OrderItem, WishList, RecentlyViewed, ProductPopularity
+
+
+class Command(BaseCommand):
+    help = "Rebuild product popularity scores from the full order, wishlist and view history"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument(
+            "--popular", type=int, default=10,
+            help="Flag this many top products as is_popular afterwards (0 leaves the flags alone)",
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        started = time.perf_counter()
+        scores = defaultdict(float)
+        sources = [
+            ("order", OrderItem.objects.values_list("product_id", "quantity", "order__created_at")),
+            ("wishlist", WishList.objects.values_list("product_id", "created")),
+            ("view", RecentlyViewed.objects.values_list("product_id", "viewed_at")),
+        ]
+
+        # rows are streamed; memory only grows with the number of products
+        for kind, rows in sources:
+            weight = popularity.WEIGHTS[kind]
+            seen = 0
+            for row in rows.iterator(chunk_size=batch_size):
+                count = row[1] if kind == "order" else 1
+                scores[row[0]] += weight * count * popularity.growth(row[-1])
+                seen += 1
+            self.stdout.write(f"{kind}: {seen} rows")
+
+        with transaction.atomic():
+            ProductPopularity.objects.all().delete()
+            ProductPopularity.objects.bulk_create(
+                (ProductPopularity(product_id=product_id, score=score) for product_id, score in scores.items()),
+                batch_size=batch_size,
+            )
+            if options["popular"]:
+                popularity.refresh_popular_flags(options["popular"])
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Scored {len(scores)} products in {time.perf_counter() - started:.1f}s"
+        ))
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from funiture import image_variants
+from funiture.models import Product, ProductImage
+
+
+class Command(BaseCommand):
+    help = "Rebuild the stored Cloudinary variant URLs of every product and gallery image"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        for model in (Product, ProductImage):
+            changed, batch = 0, []
+            for instance in model.objects.only("pk", "image", "image_variants").iterator(chunk_size=batch_size):
+                variants = image_variants.build(instance.image)
+                if variants != instance.image_variants:
+                    instance.image_variants = variants
+                    batch.append(instance)
+                if len(batch) == batch_size:
+                    model.objects.bulk_update(batch, ["image_variants"])
+                    changed += len(batch)
+                    batch = []
+            if batch:
+                model.objects.bulk_update(batch, ["image_variants"])
+                changed += len(batch)
+            self.stdout.write(f"{model.__name__}: {changed} updated")
@@ -0,0 +1,66 @@
+import glob
+import json
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = "Print a recorded request trace as a tree of spans, or list the slowest traces"
+
+    def add_arguments(self, parser):
+        parser.add_argument("trace_id", nargs="?", help="trace to print (the X-Trace-Id header); omit to list")
+        parser.add_argument("--slowest", type=int, default=20, help="how many traces to list")
+        parser.add_argument("--dir", default=None, help="defaults to TRACING_DIR")
+
+    def handle(self, *args, **options):
+        spans = self.read(options["dir"] or settings.TRACING_DIR, options["trace_id"])
+        if options["trace_id"]:
+            if not spans:
+                raise CommandError(f"No spans for trace {options['trace_id']}")
+            self.print_tree(spans)
+            return
+
+        roots = sorted((span for span in spans if span["parent_id"] is None), key=lambda span: -span["duration_ms"])
+        for root in roots[:options["slowest"]]:
+            attributes = root["attributes"]
+            self.stdout.write(
+                f"{root['trace_id']}  {root['duration_ms']:>9.1f}ms  {attributes.get('status', '')}  "
+                f"{attributes.get('method', '')} {attributes.get('view') or attributes.get('path', '')}"
+            )
+
+    def read(self, directory, trace_id=None):
+        spans = []
+        # rotated files are traces_<pid>.jsonl.1, .2, ...
+        for path in sorted(glob.glob(os.path.join(directory, "traces_*.jsonl*"))):
+            with open(path) as f:
+                for line in f:
+                    if trace_id and trace_id not in line:
+                        continue
+                    span = json.loads(line)
+                    if not trace_id or span["trace_id"] == trace_id:
+                        spans.append(span)
+        return spans
+
+    def print_tree(self, spans):
+        children = {}
+        for span in sorted(spans, key=lambda span: span["start"]):
+            children.setdefault(span["parent_id"], []).append(span)
+        ids = {span["span_id"] for span in spans}
+        # a thread's spans can outlive a rotated-away parent; show them at the top
+        roots = [span for span in spans if span["parent_id"] not in ids]
+        started = min(span["start"] for span in spans)
+
+        def walk(span, depth):
+            details = " ".join(f"{key}={value}" for key, value in span["attributes"].items())
+            error = f"  ERROR {span['error']}" if span["error"] else ""
+            self.stdout.write(
+                f"{(span['start'] - started) * 1000:>9.1f}ms {span['duration_ms']:>9.1f}ms  "
+                f"{'  ' * depth}{span['name']}  {details[:200]}{error}"
+            )
+            for child in children.get(span["span_id"], []):
+                walk(child, depth + 1)
+
+        for root in sorted(roots, key=lambda span: span["start"]):
+            walk(root, 0)
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from funiture import slow_queries
+from funiture.models import SlowQuery
+
+
+class Command(BaseCommand):
+    help = "Print the slow-query log, worst first, with each query's plan"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--limit", type=int, default=20)
+        parser.add_argument("--order", choices=slow_queries.ORDERS, default="total_ms")
+        parser.add_argument("--reset", action="store_true", help="empty the log, e.g. after a fix is deployed")
+
+    def handle(self, *args, **options):
+        if options["reset"]:
+            deleted, _ = SlowQuery.objects.all().delete()
+            self.stdout.write(self.style.SUCCESS(f"Removed {deleted} slow queries"))
+            return
+
+        for row in slow_queries.report(options["limit"], options["order"]):
+            entry = slow_queries.as_dict(row)
+            self.stdout.write(self.style.WARNING(
+                f"{entry['total_ms']:.1f}ms total  {entry['count']} runs  {entry['mean_ms']:.1f}ms mean  "
+                f"{entry['max_ms']:.1f}ms max"
+            ))
+            self.stdout.write(f"  {entry['fingerprint'][:500]}")
+            for label, counts in (("views", entry["views"]), ("from", entry["locations"])):
+                self.stdout.write(f"  {label}: " + ", ".join(f"{name} ({count})" for name, count in counts.items()))
+            for line in (entry["plan"] or "(not explained yet)").splitlines():
+                self.stdout.write(f"    {line}")
+            self.stdout.write("")
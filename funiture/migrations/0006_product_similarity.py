@@ -0,0 +1,43 @@
+# Generated by Django 5.2.8 on 2026-10-19 13:46
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('funiture', '0005_product_recommendations'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductVector',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='vector', serialize=False, to='funiture.product')),
+                ('columns', models.BinaryField()),
+                ('weights', models.BinaryField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='SimilarityTerm',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=100, unique=True)),
+                ('column', models.PositiveIntegerField(unique=True)),
+                ('idf', models.FloatField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='SimilarProduct',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField()),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='similar_products', to='funiture.product')),
+                ('similar', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='similar_to', to='funiture.product')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['product', '-score'], name='similar_product_score_idx')],
+            },
+        ),
+    ]
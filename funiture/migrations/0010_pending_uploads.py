@@ -0,0 +1,30 @@
+# Generated by Django 5.2.8 on 2026-10-19 13:57
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('funiture', '0009_image_variants'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PendingUpload',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('path', models.CharField(max_length=255)),
+                ('main', models.BooleanField(default=False)),
+                ('add_to_gallery', models.BooleanField(default=True)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('failed', 'Failed')], default='pending', max_length=10)),
+                ('error', models.CharField(blank=True, max_length=255)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pending_uploads', to='funiture.product')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'created_at'], name='pending_upload_status_idx')],
+            },
+        ),
+    ]
@@ -1,10 +1,11 @@
 from django.db import models
-from django.utils.text import slugify
+from .slugs import save_with_slug
 from django.contrib.auth.models import User
 from phonenumber_field.modelfields import PhoneNumberField
 from django.conf import settings  
 from django.core.validators import validate_email
 from django.core.exceptions import ValidationError
+from django.utils import timezone
 import uuid
 
 
@@ -49,18 +50,11 @@ class Category(models.Model):
     
     
     def save(self, force_insert=False, force_update=False, using=None, update_fields=None):
-        
-        if not self.slug:
-            self.slug = slugify(self.name)
-            unique_slug = self.slug
-            counter = 1
-            
-            if Product.objects.filter(slug= unique_slug).exists():
-                unique_slug = f'{self.slug}-{counter}'
-                counter +=1 
-                self.slug = unique_slug
-        
-        super().save(force_insert=force_insert, force_update=force_update, using=using, update_fields=update_fields)
+        # picks the next free name-N slug and retries if a concurrent save takes it
+        save_with_slug(
+            self, super().save,
+            force_insert=force_insert, force_update=force_update, using=using, update_fields=update_fields,
+        )
     
     
 class Product(models.Model):
@@ -78,28 +72,24 @@ class Product(models.Model):
     care = models.TextField(blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
     height = models.PositiveIntegerField(null=True, blank=True)
+    # precomputed Cloudinary URLs, see funiture/image_variants.py
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
     
     def __str__(self):
         return self.name
     
     
     def save(self, force_insert=False, force_update=False, using=None, update_fields=None):
-        
-        if not self.slug:
-            self.slug = slugify(self.name)
-            unique_slug = self.slug
-            counter = 1
-            
-            if Product.objects.filter(slug= unique_slug).exists():
-                unique_slug = f'{self.slug}-{counter}'
-                counter +=1 
-                self.slug = unique_slug
-        
-        super().save(force_insert=force_insert, force_update=force_update, using=using, update_fields=update_fields)
+        # picks the next free name-N slug and retries if a concurrent save takes it
+        save_with_slug(
+            self, super().save,
+            force_insert=force_insert, force_update=force_update, using=using, update_fields=update_fields,
+        )
  
 class ProductImage(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="gallery")
     image = image = CloudinaryField('image')
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
     
 class Cart(models.Model):
     cart_code = models.UUIDField(default=uuid.uuid4, editable=False, unique=True)
@@ -107,7 +97,7 @@ class Cart(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     
     def __str__(self):
-        return self.cart_code
+        return str(self.cart_code)
     
 class CartItem(models.Model):
     cart = models.ForeignKey(Cart, on_delete=models.CASCADE, related_name="cartitems")
@@ -146,11 +136,13 @@ class Address(models.Model):
 class RecentlyViewed(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="recently_viewed")
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="viewed_by_users")
-    viewed_at = models.DateTimeField(auto_now=True)
+    # set explicitly by the tracker, which writes views in batches after the fact
+    viewed_at = models.DateTimeField(default=timezone.now)
 
     class Meta:
         unique_together = ('user', 'product')
         ordering = ['-viewed_at']
+        indexes = [models.Index(fields=["user", "-viewed_at"], name="recent_user_viewed_idx")]
 
     def __str__(self):
         return f"{self.user} viewed {self.product}"
@@ -163,6 +155,14 @@ class Order(models.Model):
     status = models.CharField(max_length=20, choices=[("Pending", "Pending"), ("Paid", "Paid")])
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        # admin filters and the per-customer order history
+        indexes = [
+            models.Index(fields=["status", "-created_at"], name="order_status_created_idx"),
+            models.Index(fields=["-created_at"], name="order_created_idx"),
+            models.Index(fields=["customer_email"], name="order_customer_email_idx"),
+        ]
+
     def __str__(self):
         return f"Order {self.paystack_checkout_id} - {self.status}"
     
@@ -174,3 +174,176 @@ class OrderItem(models.Model):
 
     def __str__(self):
         return f"Order {self.product.name} - {self.order.paystack_checkout_id}"
+
+
+
+class ProductPopularity(models.Model):
+    """
+    Time-decayed demand score, maintained by funiture/popularity.py.
+    `score` is stored relative to a fixed epoch so adding an event is a plain
+    increment and ordering by it is the same as ordering by the decayed score.
+    """
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, primary_key=True, related_name="popularity")
+    score = models.FloatField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["-score"], name="popularity_score_idx")]
+
+    def __str__(self):
+        return f"{self.product_id} - {self.score:.2f}"
+
+
+
+class ProductCooccurrence(models.Model):
+    """
+    How many paid orders contained both products (sparse, symmetric).
+    The diagonal row (product == other) holds the product's own order count.
+    """
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="+")
+    other = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="+")
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=["product", "other"], name="cooccurrence_pair_uniq")]
+
+
+class RelatedProduct(models.Model):
+    """Precomputed "customers also bought" neighbours, top-k per product"""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="related_products")
+    related = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="recommended_for")
+    score = models.FloatField()
+
+    class Meta:
+        indexes = [models.Index(fields=["product", "-score"], name="related_product_score_idx")]
+
+    def __str__(self):
+        return f"{self.product_id} -> {self.related_id} ({self.score:.3f})"
+
+
+class SimilarityTerm(models.Model):
+    """TF-IDF vocabulary of the last full similarity rebuild (column -> term)"""
+    term = models.CharField(max_length=100, unique=True)
+    column = models.PositiveIntegerField(unique=True)
+    idf = models.FloatField()
+
+    def __str__(self):
+        return self.term
+
+
+class ProductVector(models.Model):
+    """
+    A product's L2-normalised TF-IDF vector, sparse: `columns` (int32) and
+    `weights` (float32) are raw NumPy buffers, see funiture/similarity.py.
+    """
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, primary_key=True, related_name="vector")
+    columns = models.BinaryField()
+    weights = models.BinaryField()
+
+
+class SimilarProduct(models.Model):
+    """Precomputed content-based neighbours, top-k per product"""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="similar_products")
+    similar = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="similar_to")
+    score = models.FloatField()
+
+    class Meta:
+        indexes = [models.Index(fields=["product", "-score"], name="similar_product_score_idx")]
+
+    def __str__(self):
+        return f"{self.product_id} ~ {self.similar_id} ({self.score:.3f})"
+
+
+class DailySales(models.Model):
+    """Paid-order totals per day, maintained by funiture/sales.py"""
+    date = models.DateField(unique=True)
+    orders = models.PositiveIntegerField(default=0)
+    units = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    def __str__(self):
+        return f"{self.date} - {self.revenue}"
+
+
+class DailyProductSales(models.Model):
+    """Products and categories with sales history can't be deleted, so the rollups keep matching the orders"""
+    date = models.DateField()
+    product = models.ForeignKey(Product, on_delete=models.PROTECT, related_name="daily_sales")
+    orders = models.PositiveIntegerField(default=0)
+    units = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=["date", "product"], name="daily_product_sales_uniq")]
+
+    def __str__(self):
+        return f"{self.date} {self.product_id} - {self.revenue}"
+
+
+class DailyCategorySales(models.Model):
+    """A product in several categories counts towards each of them"""
+    date = models.DateField()
+    category = models.ForeignKey(Category, on_delete=models.PROTECT, related_name="daily_sales")
+    orders = models.PositiveIntegerField(default=0)
+    units = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=["date", "category"], name="daily_category_sales_uniq")]
+
+    def __str__(self):
+        return f"{self.date} {self.category_id} - {self.revenue}"
+
+
+class PendingUpload(models.Model):
+    """
+    An image saved locally and waiting for the background upload to
+    Cloudinary (funiture/image_uploads.py). Deleted once it lands; while an
+    upload is running the row is "uploading" and carries that run's claim.
+    """
+    PENDING, UPLOADING, FAILED = "pending", "uploading", "failed"
+
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="pending_uploads")
+    path = models.CharField(max_length=255)  # name in default_storage
+    main = models.BooleanField(default=False)  # becomes Product.image once uploaded
+    add_to_gallery = models.BooleanField(default=True)
+    status = models.CharField(
+        max_length=10, choices=[(PENDING, "Pending"), (UPLOADING, "Uploading"), (FAILED, "Failed")], default=PENDING,
+    )
+    claim = models.UUIDField(null=True, blank=True, editable=False, db_index=True)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    error = models.CharField(max_length=255, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["status", "created_at"], name="pending_upload_status_idx")]
+
+    def __str__(self):
+        return f"{self.path} ({self.status})"
+
+
+class SlowQuery(models.Model):
+    """
+    One SQL fingerprint that has run slower than SLOW_QUERY_MS, totalled
+    across workers by funiture/slow_queries.py, with its query plan
+    """
+    fingerprint_hash = models.CharField(max_length=40, unique=True)
+    fingerprint = models.TextField()
+    # the slowest run so far, with its parameters
+    sample_sql = models.TextField()
+    sample_params = models.TextField(blank=True)
+    count = models.PositiveBigIntegerField(default=0)
+    total_ms = models.FloatField(default=0)
+    max_ms = models.FloatField(default=0)
+    views = models.JSONField(default=dict)  # url name -> count
+    locations = models.JSONField(default=dict)  # "file:line in function" -> count
+    plan = models.TextField(blank=True)
+    explained_at = models.DateTimeField(null=True, blank=True)
+    first_seen = models.DateTimeField(default=timezone.now)
+    last_seen = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [models.Index(fields=["-total_ms"], name="slow_query_total_idx")]
+
+    def __str__(self):
+        return f"{self.count} x {self.fingerprint[:80]}"
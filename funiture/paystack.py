@@ -1,17 +1,20 @@
 import requests
 from django.conf import settings
 
+from core import metrics
+
 def checkout(payload):
     headers = {
         "Authorization": f"Bearer {settings.PAYSTACK_SECRET_KEY}",
         "Content-Type": "application/json"
     }
 
-    response = requests.post(
-        'https://api.paystack.co/transaction/initialize',
-        json=payload,  # ✅ use 'json=' instead of 'data=json.dumps(...)'
-        headers=headers
-    )
+    with metrics.external_call("paystack"):
+        response = requests.post(
+            'https://api.paystack.co/transaction/initialize',
+            json=payload,  # ✅ use 'json=' instead of 'data=json.dumps(...)'
+            headers=headers
+        )
 
     try:
         response_data = response.json()
@@ -0,0 +1,73 @@
+"""
+Popularity ranking from orders, wishlist adds and product views.
+
+Scores use forward decay: an event at time t adds weight * 2**((t - EPOCH) / half_life)
+to the product's stored score. Every score decays at the same rate, so the
+stored value orders products exactly like the decayed score would, updates are
+plain increments, and the top-N is an ordered read on the score index.
+current_score() converts a stored value back to today's decayed score.
+"""
+import math
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, FloatField, Value, When
+from django.utils import timezone
+
+from .facets import catalog_index
+from .models import Product, ProductPopularity
+
+EPOCH = datetime(2026, 1, 1, tzinfo=dt_timezone.utc)
+HALF_LIFE_DAYS = getattr(settings, "POPULARITY_HALF_LIFE_DAYS", 14)
+WEIGHTS = getattr(settings, "POPULARITY_WEIGHTS", {"order": 5.0, "wishlist": 3.0, "view": 1.0})
+
+
+def growth(at=None):
+    """The forward-decay multiplier for an event happening at `at`"""
+    days = ((at or timezone.now()) - EPOCH).total_seconds() / 86400
+    return math.pow(2, days / HALF_LIFE_DAYS)
+
+
+def current_score(stored, now=None):
+    return stored / growth(now)
+
+
+def record(kind, counts, at=None):
+    """
+    Add `kind` events to the scores; counts is {product_id: number of events}.
+    Two statements however many products are touched.
+    """
+    factor = WEIGHTS[kind] * growth(at)
+    increments = {product_id: count * factor for product_id, count in counts.items() if count}
+    if not increments:
+        return
+    with transaction.atomic():
+        ProductPopularity.objects.bulk_create(
+            [ProductPopularity(product_id=product_id) for product_id in increments],
+            ignore_conflicts=True,
+        )
+        ProductPopularity.objects.filter(product_id__in=increments).update(
+            score=F("score") + Case(
+                *(When(product_id=product_id, then=Value(amount)) for product_id, amount in increments.items()),
+                output_field=FloatField(),
+            ),
+        )
+
+
+def top_products(limit=10):
+    """Most popular products, read in score-index order"""
+    return Product.objects.filter(popularity__isnull=False).order_by("-popularity__score")[:limit]
+
+
+def refresh_popular_flags(limit):
+    """Point Product.is_popular at the current top `limit` products"""
+    top = list(
+        ProductPopularity.objects.order_by("-score").values_list("product_id", flat=True)[:limit]
+    )
+    with transaction.atomic():
+        Product.objects.filter(is_popular=True).exclude(id__in=top).update(is_popular=False)
+        Product.objects.filter(id__in=top, is_popular=False).update(is_popular=True)
+    # queryset.update() skips the signals that keep the facet index current
+    transaction.on_commit(catalog_index.invalidate)
+    return top
@@ -0,0 +1,221 @@
+"""
+Bulk product import.
+
+Rows (dicts, see ROW_FIELDS) are read lazily and handled BATCH at a time, so
+memory stays flat however long the file is. Per batch: images are uploaded
+through a bounded thread pool, slugs are allocated in bulk, and products,
+category links and gallery images go in with bulk_create inside one
+transaction. If the database rejects the batch (a value too long for its
+column, a negative stock, ...), it is written again a row at a time, each in
+its own savepoint, and the rejected rows are reported like invalid ones.
+bulk_create skips the Product signals, so the facet index and similar
+products are brought up to date once at the end.
+"""
+import csv
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+from django.db import DataError, IntegrityError, transaction
+
+from . import image_variants, similarity
+from .facets import catalog_index
+from .models import Category, Product, ProductImage
+from .slugs import ATTEMPTS, allocate_slugs, is_slug_conflict
+
+ROW_FIELDS = (
+    "name", "description", "price", "stock", "featured", "is_popular", "fabric",
+    "dimension", "care", "height", "categories", "image", "gallery",
+)
+# categories and gallery hold several values in one CSV cell
+LIST_SEPARATOR = "|"
+
+
+def read_rows(path):
+    """Stream dict rows from a .csv or .jsonl file"""
+    if path.endswith(".jsonl"):
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+    else:
+        with open(path, newline="", encoding="utf-8") as f:
+            yield from csv.DictReader(f)
+
+
+def _list(value):
+    if isinstance(value, (list, tuple)):
+        return [str(item).strip() for item in value if str(item).strip()]
+    return [item.strip() for item in (value or "").split(LIST_SEPARATOR) if item.strip()]
+
+
+def _bool(value):
+    if isinstance(value, bool):
+        return value
+    return str(value or "").strip().lower() in ("1", "true", "yes", "y")
+
+
+def _int(value, default=None):
+    return default if value in (None, "") else int(value)
+
+
+def clean_row(row):
+    """Validate one input row; raises ValueError with a readable message"""
+    name = (row.get("name") or "").strip()
+    if not name:
+        raise ValueError("name is required")
+    if len(name) > Product._meta.get_field("name").max_length:
+        raise ValueError("name is too long")
+    try:
+        price = Decimal(str(row.get("price", "")).strip())
+    except InvalidOperation:
+        raise ValueError(f"invalid price {row.get('price')!r}")
+    image = (row.get("image") or "").strip()
+    if not image:
+        raise ValueError("image is required")
+    return {
+        "name": name,
+        "description": row.get("description") or "",
+        "price": price,
+        "stock": _int(row.get("stock"), 0),
+        "featured": _bool(row.get("featured")),
+        "is_popular": _bool(row.get("is_popular")),
+        "fabric": row.get("fabric") or None,
+        "dimension": row.get("dimension") or None,
+        "care": row.get("care") or None,
+        "height": _int(row.get("height")),
+        "categories": _list(row.get("categories")),
+        "image": image,
+        "gallery": _list(row.get("gallery")),
+    }
+
+
+class ProductImporter:
+    def __init__(self, uploader, batch_size=500, workers=8, stdout=None):
+        self.uploader = uploader
+        self.batch_size = batch_size
+        self.workers = workers
+        self.stdout = stdout
+        self.categories = {}  # name -> id, filled as names show up
+        self.created = 0
+        self.errors = []
+        self.uploads = 0
+
+    def log(self, message):
+        if self.stdout:
+            self.stdout.write(message)
+
+    def run(self, rows):
+        started = time.perf_counter()
+        numbered = enumerate(rows, start=1)
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            while batch := list(islice(numbered, self.batch_size)):
+                self._import_batch(batch, pool)
+                elapsed = time.perf_counter() - started
+                self.log(f"{self.created} products ({self.created / elapsed:.0f}/s), {len(self.errors)} errors")
+        self._after_import()
+        return {
+            "created": self.created,
+            "errors": self.errors,
+            "uploads": self.uploads,
+            "seconds": time.perf_counter() - started,
+        }
+
+    def _import_batch(self, batch, pool):
+        cleaned = []
+        for line, row in batch:
+            try:
+                cleaned.append((line, clean_row(row)))
+            except (ValueError, TypeError) as e:
+                self.errors.append((line, str(e)))
+
+        # every image of the batch at once; the pool bounds concurrency
+        sources = sorted({source for _, row in cleaned for source in [row["image"], *row["gallery"]]})
+        uploaded, failed = {}, {}
+        for source, result in zip(sources, pool.map(self._upload, sources)):
+            (uploaded if isinstance(result, str) else failed)[source] = result
+        self.uploads += len(uploaded)
+
+        ready = []
+        for line, row in cleaned:
+            broken = [source for source in [row["image"], *row["gallery"]] if source in failed]
+            if broken:
+                self.errors.append((line, f"upload failed for {broken[0]}: {failed[broken[0]]}"))
+            else:
+                ready.append((line, row))
+        if not ready:
+            return
+
+        try:
+            self.created += len(self._write([row for _, row in ready], uploaded))
+        except (DataError, IntegrityError):
+            # find the rows the database won't take
+            for line, row in ready:
+                try:
+                    self.created += len(self._write([row], uploaded))
+                except (DataError, IntegrityError) as e:
+                    self.errors.append((line, f"rejected by the database: {e}"))
+
+    def _write(self, rows, uploaded):
+        for attempt in range(ATTEMPTS):
+            try:
+                return self._write_batch(rows, uploaded)
+            except (DataError, IntegrityError) as e:
+                # categories created by the rolled back batch are gone again
+                self.categories.clear()
+                # a concurrent writer took one of the allocated slugs; allocate again
+                if not is_slug_conflict(e, Product, Category) or attempt == ATTEMPTS - 1:
+                    raise
+
+    @transaction.atomic
+    def _write_batch(self, ready, uploaded):
+        category_ids = self._category_ids({name for row in ready for name in row["categories"]})
+        slugs = allocate_slugs(Product, [row["name"] for row in ready])
+        products = Product.objects.bulk_create([
+            Product(
+                slug=slug, image=uploaded[row["image"]],
+                image_variants=image_variants.build(uploaded[row["image"]]),
+                **{field: row[field] for field in ROW_FIELDS if field not in ("categories", "image", "gallery")},
+            )
+            for slug, row in zip(slugs, ready)
+        ])
+        Product.categories.through.objects.bulk_create([
+            Product.categories.through(product_id=product.pk, category_id=category_ids[name])
+            for product, row in zip(products, ready)
+            for name in dict.fromkeys(row["categories"])
+        ])
+        # the main image goes in the gallery too, as the post_save signal would do
+        ProductImage.objects.bulk_create([
+            ProductImage(
+                product_id=product.pk, image=uploaded[source], image_variants=image_variants.build(uploaded[source]),
+            )
+            for product, row in zip(products, ready)
+            for source in dict.fromkeys([row["image"], *row["gallery"]])
+        ])
+        return products
+
+    def _upload(self, source):
+        try:
+            return self.uploader.upload(source)
+        except Exception as e:
+            return e
+
+    def _category_ids(self, names):
+        missing = names - self.categories.keys()
+        if missing:
+            self.categories.update(Category.objects.filter(name__in=missing).values_list("name", "id"))
+        missing = sorted(names - self.categories.keys())
+        if missing:
+            created = Category.objects.bulk_create([
+                Category(name=name, slug=slug) for name, slug in zip(missing, allocate_slugs(Category, missing))
+            ])
+            self.categories.update((category.name, category.pk) for category in created)
+        return self.categories
+
+    def _after_import(self):
+        if not self.created:
+            return
+        catalog_index.invalidate()
+        similarity.rebuild()
@@ -0,0 +1,235 @@
+"""
+Recently viewed tracker.
+
+Product page views are recorded into a capped per-user list in the cache and
+buffered in-process; the buffer is written to RecentlyViewed in batches every
+RECENTLY_VIEWED_FLUSH_INTERVAL seconds by each worker's Flusher thread
+(started from gunicorn.conf.py), or sooner once RECENTLY_VIEWED_FLUSH_BATCH
+users are pending, so a page view no longer costs synchronous DB writes.
+Reads are served from the cache and only fall back to the table on a miss.
+
+The lists are only shared between workers through a shared cache (set
+CACHE_BACKEND to Redis or Memcached). With a per-process cache, such as the
+default LocMemCache, lists are kept for one flush interval so a worker sees
+views recorded by another one within about two intervals. A list read from
+the table is also only kept for one interval, as views recorded elsewhere
+may not have been flushed yet.
+"""
+import atexit
+import logging
+import os
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+from django.utils import timezone
+
+from core import metrics
+
+from . import popularity
+from .models import Product, RecentlyViewed
+
+logger = logging.getLogger(__name__)
+
+RECENT_LIMIT = 10
+CACHE_TIMEOUT = 60 * 60 * 24
+FLUSH_INTERVAL = getattr(settings, "RECENTLY_VIEWED_FLUSH_INTERVAL", 30)
+FLUSH_BATCH = getattr(settings, "RECENTLY_VIEWED_FLUSH_BATCH", 500)
+
+_lock = threading.Lock()
+# user_id -> latest capped list of (product_id, viewed_at) not yet written
+_pending = {}
+# product_id -> views since the last flush, fed to the popularity scores
+_pending_views = Counter()
+_last_flush = time.monotonic()
+# held for the whole of a flush, so two never write (and trim) at once
+_flushing = threading.Lock()
+
+
+def _cache_key(user_id):
+    return f"recently_viewed:{user_id}"
+
+
+def _list_timeout():
+    """How long a list recorded here may be served from the cache"""
+    if isinstance(caches["default"], (LocMemCache, DummyCache)):
+        return FLUSH_INTERVAL
+    return CACHE_TIMEOUT
+
+
+def get_recent(user_id):
+    """Return the user's [(product_id, viewed_at), ...], newest first"""
+    entries = cache.get(_cache_key(user_id))
+    metrics.cache_lookup("recently_viewed", entries is not None)
+    if entries is not None:
+        return entries
+
+    with _lock:
+        entries = _pending.get(user_id)
+    if entries is not None:
+        cache.set(_cache_key(user_id), entries, _list_timeout())
+        return entries
+
+    entries = list(
+        RecentlyViewed.objects
+        .filter(user_id=user_id)
+        .order_by("-viewed_at")
+        .values_list("product_id", "viewed_at")[:RECENT_LIMIT]
+    )
+    # another worker may still hold newer views for this user
+    cache.set(_cache_key(user_id), entries, FLUSH_INTERVAL)
+    return entries
+
+
+def get_recent_ids(user_id):
+    return [product_id for product_id, _ in get_recent(user_id)]
+
+
+def record_view(user_id, product_id, viewed_at=None):
+    """Move product_id to the front of the user's list and queue it for the DB"""
+    viewed_at = viewed_at or timezone.now()
+    entries = [entry for entry in get_recent(user_id) if entry[0] != product_id]
+    entries = [(product_id, viewed_at)] + entries[:RECENT_LIMIT - 1]
+    cache.set(_cache_key(user_id), entries, _list_timeout())
+
+    with _lock:
+        _pending[user_id] = entries
+        _pending_views[product_id] += 1
+        due = (
+            len(_pending) >= FLUSH_BATCH
+            or time.monotonic() - _last_flush >= FLUSH_INTERVAL
+        ) and not _flushing.locked()
+    if due:
+        FlushThread().start()
+
+
+def flush():
+    """
+    Write every pending user's list to RecentlyViewed, then trim each of
+    those users to their newest RECENT_LIMIT rows. Flushes run one at a time.
+    Views of products or by users deleted since are dropped, and so is a
+    batch the database rejects; only other failures put it back for later.
+    """
+    with _flushing:
+        return _flush()
+
+
+def _flush():
+    global _last_flush
+    with _lock:
+        pending = dict(_pending)
+        views = Counter(_pending_views)
+        _pending.clear()
+        _pending_views.clear()
+        _last_flush = time.monotonic()
+    if not pending:
+        return 0
+
+    # a product or account deleted since it was viewed would fail the whole
+    # batch on its foreign key, and again on every retry
+    users = set(get_user_model().objects.filter(id__in=pending).values_list("id", flat=True))
+    products = set(
+        Product.objects
+        .filter(id__in={product_id for entries in pending.values() for product_id, _ in entries})
+        .values_list("id", flat=True)
+    )
+    views = Counter({product_id: count for product_id, count in views.items() if product_id in products})
+    rows = [
+        RecentlyViewed(user_id=user_id, product_id=product_id, viewed_at=viewed_at)
+        for user_id, entries in pending.items() if user_id in users
+        for product_id, viewed_at in entries if product_id in products
+    ]
+    if not rows:
+        return 0
+
+    try:
+        with transaction.atomic():
+            RecentlyViewed.objects.bulk_create(
+                rows,
+                update_conflicts=True,
+                unique_fields=["user", "product"],
+                update_fields=["viewed_at"],
+            )
+            # anything a user has scrolled past the cap is dropped; ranking by
+            # viewed_at keeps views another worker wrote since this batch began
+            overflow = list(
+                RecentlyViewed.objects
+                .filter(user_id__in=pending)
+                .annotate(rank=Window(RowNumber(), partition_by=F("user_id"), order_by=F("viewed_at").desc()))
+                .filter(rank__gt=RECENT_LIMIT)
+                .values_list("id", flat=True)
+            )
+            if overflow:
+                RecentlyViewed.objects.filter(id__in=overflow).delete()
+            popularity.record("view", views)
+    except IntegrityError:
+        # a deletion that raced the check above; retrying would fail the same way
+        raise
+    except Exception:
+        # put the batch back (newer views win) so it is retried next flush
+        with _lock:
+            for user_id, entries in pending.items():
+                _pending.setdefault(user_id, entries)
+            _pending_views.update(views)
+        raise
+    return len(rows)
+
+
+class FlushThread(threading.Thread):
+    """Flush pending views without holding up the request that triggered it."""
+
+    def run(self):
+        try:
+            flush()
+        except Exception:
+            logger.exception("Recently viewed flush failed")
+        finally:
+            connection.close()
+
+
+class Flusher(threading.Thread):
+    """Flushes every FLUSH_INTERVAL seconds, so views are written even if no more arrive"""
+
+    def __init__(self):
+        super().__init__(daemon=True, name="recently-viewed-flusher")
+
+    def run(self):
+        while True:
+            time.sleep(FLUSH_INTERVAL)
+            try:
+                flush()
+            except Exception:
+                logger.exception("Recently viewed flush failed")
+            finally:
+                connection.close()
+
+
+_flusher_pid = None
+
+
+def start_flusher():
+    """Start this process's Flusher once"""
+    global _flusher_pid
+    with _lock:
+        if _flusher_pid == os.getpid():
+            return
+        _flusher_pid = os.getpid()
+    Flusher().start()
+
+
+def _flush_on_exit():
+    try:
+        flush()
+    except Exception:
+        logger.exception("Recently viewed flush failed")
+
+
+atexit.register(_flush_on_exit)
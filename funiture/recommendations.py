@@ -0,0 +1,168 @@
+"""
+"Customers also bought" recommendations.
+
+ProductCooccurrence holds the sparse product x product co-occurrence matrix
+of paid orders (diagonal = orders per product); RelatedProduct holds the
+top-k neighbours per product, scored by cosine similarity
+count(a, b) / sqrt(orders(a) * orders(b)), so the endpoint is one indexed read.
+
+rebuild() recomputes both tables from the full order history with vectorized
+NumPy; record_order() folds a newly fulfilled order in incrementally and
+re-ranks the products in it (their neighbours are re-ranked on the next
+rebuild).
+"""
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+
+from .models import OrderItem, ProductCooccurrence, RelatedProduct
+
+TOP_K = getattr(settings, "RECOMMENDATIONS_TOP_K", 12)
+# upper bound on item pairs expanded at once while building the matrix
+PAIRS_PER_CHUNK = 5_000_000
+
+
+def cooccurrence(order_ids, product_ids):
+    """
+    COO arrays (a, b, counts) of the symmetric co-occurrence matrix for the
+    given order lines, diagonal included. Ids are the real product ids.
+    """
+    products, dense = np.unique(product_ids, return_inverse=True)
+    n = len(products)
+    if n == 0:
+        empty = np.array([], dtype=np.int64)
+        return empty, empty, empty
+
+    # one line per (order, product), sorted by order
+    lines = np.unique(order_ids.astype(np.int64) * n + dense)
+    orders, items = lines // n, lines % n
+
+    starts = np.flatnonzero(np.r_[True, orders[1:] != orders[:-1]])
+    sizes = np.diff(np.r_[starts, len(items)])
+
+    # expand groups a chunk at a time so memory stays bounded on big histories
+    cumulative = np.cumsum(sizes.astype(np.int64) ** 2)
+    bounds = np.searchsorted(cumulative, np.arange(PAIRS_PER_CHUNK, cumulative[-1], PAIRS_PER_CHUNK), side="right")
+    bounds = np.unique(np.r_[0, bounds, len(sizes)])
+
+    keys, counts = [], []
+    for first, last in zip(bounds[:-1], bounds[1:]):
+        group_sizes, group_starts = sizes[first:last], starts[first:last]
+        # every item of a group is paired with every item of the same group
+        per_item = np.repeat(group_sizes, group_sizes)
+        item_index = np.arange(group_starts[0], group_starts[-1] + group_sizes[-1])
+        left = np.repeat(item_index, per_item)
+        offsets = np.arange(len(left)) - np.repeat(np.cumsum(per_item) - per_item, per_item)
+        right = np.repeat(np.repeat(group_starts, group_sizes), per_item) + offsets
+        chunk_keys, chunk_counts = np.unique(items[left] * n + items[right], return_counts=True)
+        keys.append(chunk_keys)
+        counts.append(chunk_counts)
+
+    keys, inverse = np.unique(np.concatenate(keys), return_inverse=True)
+    counts = np.bincount(inverse, weights=np.concatenate(counts)).astype(np.int64)
+    return products[keys // n], products[keys % n], counts
+
+
+def top_k(a, b, counts, orders_a, orders_b, k=TOP_K):
+    """Best k neighbours b for every a by cosine score; drops the diagonal"""
+    keep = a != b
+    a, b, counts = a[keep], b[keep], counts[keep]
+    scores = counts / np.sqrt(orders_a[keep] * orders_b[keep])
+
+    # by product, best score first; ties go to the larger count, then lower id
+    order = np.lexsort((b, -counts, -scores, a))
+    a, b, scores = a[order], b[order], scores[order]
+    starts = np.flatnonzero(np.r_[True, a[1:] != a[:-1]])
+    rank = np.arange(len(a)) - np.repeat(starts, np.diff(np.r_[starts, len(a)]))
+    best = rank < k
+    return a[best], b[best], scores[best]
+
+
+def _orders_per_product(a, b, counts):
+    # every product pairs with itself, and a comes out of cooccurrence() sorted
+    diagonal = a == b
+    ids, totals = a[diagonal], counts[diagonal]
+    return totals[np.searchsorted(ids, a)], totals[np.searchsorted(ids, b)]
+
+
+def rebuild(batch_size=10000, stdout=None):
+    """Recompute both tables from every paid order line"""
+    order_chunks, product_chunks, buffer = [], [], []
+    lines = OrderItem.objects.filter(order__status="Paid").values_list("order_id", "product_id")
+    for line in lines.iterator(chunk_size=batch_size):
+        buffer.append(line)
+        if len(buffer) == batch_size:
+            chunk = np.array(buffer, dtype=np.int64)
+            order_chunks.append(chunk[:, 0])
+            product_chunks.append(chunk[:, 1])
+            buffer = []
+    if buffer:
+        chunk = np.array(buffer, dtype=np.int64)
+        order_chunks.append(chunk[:, 0])
+        product_chunks.append(chunk[:, 1])
+
+    if order_chunks:
+        a, b, counts = cooccurrence(np.concatenate(order_chunks), np.concatenate(product_chunks))
+    else:
+        a = b = counts = np.array([], dtype=np.int64)
+    orders_a, orders_b = _orders_per_product(a, b, counts)
+    best_a, best_b, scores = top_k(a, b, counts, orders_a, orders_b)
+
+    with transaction.atomic():
+        ProductCooccurrence.objects.all().delete()
+        RelatedProduct.objects.all().delete()
+        ProductCooccurrence.objects.bulk_create(
+            (ProductCooccurrence(product_id=int(x), other_id=int(y), count=int(c)) for x, y, c in zip(a, b, counts)),
+            batch_size=batch_size,
+        )
+        RelatedProduct.objects.bulk_create(
+            (RelatedProduct(product_id=int(x), related_id=int(y), score=float(s)) for x, y, s in zip(best_a, best_b, scores)),
+            batch_size=batch_size,
+        )
+    if stdout:
+        stdout.write(f"{len(counts)} co-occurring pairs, {len(scores)} recommendations")
+    return len(scores)
+
+
+def refresh(product_ids):
+    """Re-rank the neighbours of product_ids from the stored counts"""
+    rows = list(
+        ProductCooccurrence.objects
+        .filter(product_id__in=product_ids)
+        .values_list("product_id", "other_id", "count")
+    )
+    others = {other for _, other, _ in rows}
+    orders = dict(
+        ProductCooccurrence.objects
+        .filter(product_id__in=others, other_id=F("product_id"))
+        .values_list("product_id", "count")
+    )
+    if rows:
+        a, b, counts = (np.array(column, dtype=np.int64) for column in zip(*rows))
+        orders_a = np.array([orders.get(x, 0) for x in a], dtype=np.int64)
+        orders_b = np.array([orders.get(y, 0) for y in b], dtype=np.int64)
+        best_a, best_b, scores = top_k(a, b, counts, orders_a, orders_b)
+    else:
+        best_a = best_b = scores = []
+
+    RelatedProduct.objects.filter(product_id__in=product_ids).delete()
+    RelatedProduct.objects.bulk_create(
+        RelatedProduct(product_id=int(x), related_id=int(y), score=float(s))
+        for x, y, s in zip(best_a, best_b, scores)
+    )
+
+
+def record_order(product_ids):
+    """Count one more order containing all of product_ids"""
+    ids = sorted(set(product_ids))
+    if not ids:
+        return
+    with transaction.atomic():
+        ProductCooccurrence.objects.bulk_create(
+            [ProductCooccurrence(product_id=a, other_id=b) for a in ids for b in ids],
+            ignore_conflicts=True,
+        )
+        ProductCooccurrence.objects.filter(product_id__in=ids, other_id__in=ids).update(count=F("count") + 1)
+        if len(ids) > 1:
+            refresh(ids)
@@ -0,0 +1,114 @@
+"""
+Daily sales rollups.
+
+DailySales, DailyProductSales and DailyCategorySales hold orders, units and
+revenue per day (overall, per product, per category). fulfill_checkout() adds
+every paid order in the same transaction that creates it, so the analytics
+endpoints read one row per day/product/category instead of scanning
+Order/OrderItem.
+
+Revenue is price x quantity when the order is recorded. OrderItem keeps no
+unit price, so backfill_sales has to price older orders at today's prices.
+Products and categories that have sales are protected from deletion, so the
+history can always be rebuilt from the orders it came from.
+"""
+from decimal import Decimal
+
+from django.db.models import Case, DecimalField, F, IntegerField, Value, When
+from django.utils import timezone
+
+from .models import DailyCategorySales, DailyProductSales, DailySales, Product
+
+
+def sale_date(created_at):
+    return timezone.localdate(created_at)
+
+
+def product_categories(product_ids=None):
+    """{product_id: [category ids]}"""
+    links = Product.categories.through.objects.all()
+    if product_ids is not None:
+        links = links.filter(product_id__in=product_ids)
+    categories = {}
+    for product_id, category_id in links.values_list("product_id", "category_id"):
+        categories.setdefault(product_id, []).append(category_id)
+    return categories
+
+
+def _bump(totals, key, units, revenue):
+    row = totals.setdefault(key, [0, 0, Decimal("0")])
+    row[0] += 1
+    row[1] += units
+    row[2] += revenue
+
+
+def add_order(rollups, date, lines, categories):
+    """
+    Fold one order into rollups = (by day, by (day, product), by (day, category)),
+    each {key: [orders, units, revenue]}. lines are (product_id, quantity, price),
+    categories is {product_id: [category ids]}.
+    """
+    by_day, by_product, by_category = rollups
+    products = {}
+    for product_id, quantity, price in lines:
+        units, revenue = products.get(product_id, (0, Decimal("0")))
+        products[product_id] = (units + quantity, revenue + price * quantity)
+
+    category_totals = {}
+    for product_id, (units, revenue) in products.items():
+        _bump(by_product, (date, product_id), units, revenue)
+        for category_id in categories.get(product_id, ()):
+            category_units, category_revenue = category_totals.get(category_id, (0, Decimal("0")))
+            category_totals[category_id] = (category_units + units, category_revenue + revenue)
+    for category_id, (units, revenue) in category_totals.items():
+        _bump(by_category, (date, category_id), units, revenue)
+
+    _bump(
+        by_day, date,
+        sum(units for units, _ in products.values()),
+        sum((revenue for _, revenue in products.values()), Decimal("0")),
+    )
+
+
+def _increments(key_field, totals):
+    """F() += CASE ... per key for orders, units and revenue"""
+    def case(index, output_field):
+        return Case(
+            *(When(**{key_field: key}, then=Value(row[index])) for key, row in totals.items()),
+            output_field=output_field,
+        )
+    return {
+        "orders": F("orders") + case(0, IntegerField()),
+        "units": F("units") + case(1, IntegerField()),
+        "revenue": F("revenue") + case(2, DecimalField(max_digits=14, decimal_places=2)),
+    }
+
+
+def record_order(order, lines):
+    """
+    Add a freshly paid order, lines (product_id, quantity, price), to the
+    rollups: seven statements whatever its size. Call inside the transaction
+    that creates the order.
+    """
+    by_day, by_product, by_category = rollups = ({}, {}, {})
+    date = sale_date(order.created_at)
+    categories = product_categories({product_id for product_id, _, _ in lines})
+    add_order(rollups, date, lines, categories)
+    if not by_product:
+        return
+
+    orders, units, revenue = by_day[date]
+    DailySales.objects.bulk_create([DailySales(date=date)], ignore_conflicts=True)
+    DailySales.objects.filter(date=date).update(
+        orders=F("orders") + orders, units=F("units") + units, revenue=F("revenue") + revenue,
+    )
+
+    for model, key_field, totals in (
+        (DailyProductSales, "product_id", by_product),
+        (DailyCategorySales, "category_id", by_category),
+    ):
+        if not totals:
+            continue
+        totals = {key: row for (_, key), row in totals.items()}
+        model.objects.bulk_create([model(date=date, **{key_field: key}) for key in totals], ignore_conflicts=True)
+        model.objects.filter(date=date, **{f"{key_field}__in": totals}).update(**_increments(key_field, totals))
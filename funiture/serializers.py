@@ -1,7 +1,102 @@
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
+from django.core.exceptions import FieldDoesNotExist
 from .models import Address, InputEmail, RecentlyViewed, Product, Category, CartItem, Cart, WishList, ProductImage, OrderItem, Order 
 
+class CompactSerializerMixin:
+    """
+    With context["compact"] set, the nested serializers named in Meta.compact
+    are swapped for primary keys; compact_payload() then serializes each
+    related object once into the side table Meta.compact maps it to.
+    """
+
+    def get_fields(self):
+        fields = super().get_fields()
+        if self.context.get("compact"):
+            for name in getattr(self.Meta, "compact", {}):
+                many = isinstance(fields[name], serializers.ListSerializer)
+                fields[name] = serializers.PrimaryKeyRelatedField(read_only=True, many=many)
+        return fields
+
+
+def compact_payload(instances, serializer_class, context=None):
+    """
+    Normalized shape for list endpoints:
+    {"results": [{"user": 1, "product": 7, ...}], "users": {1: {...}}, "products": {7: {...}}}
+    """
+    context = dict(context or {}, compact=True)
+    instances = list(instances)
+    payload = {"results": serializer_class(instances, many=True, context=context).data}
+    _add_side_tables(payload, instances, serializer_class, context)
+    return payload
+
+
+def _add_side_tables(payload, instances, serializer_class, context):
+    for name, table in getattr(serializer_class.Meta, "compact", {}).items():
+        nested = serializer_class._declared_fields[name]
+        many = isinstance(nested, serializers.ListSerializer)
+        nested_class = type(nested.child) if many else type(nested)
+        source = nested.source or name
+
+        related = {}
+        for instance in instances:
+            value = getattr(instance, source)
+            for obj in (value.all() if many else [value]):
+                if obj is not None:
+                    related.setdefault(obj.pk, obj)
+
+        rows = payload.setdefault(table, {})
+        new = [obj for pk, obj in related.items() if pk not in rows]
+        data = nested_class(new, many=True, context=context).data
+        rows.update((obj.pk, item) for obj, item in zip(new, data))
+        _add_side_tables(payload, new, nested_class, context)
+
+
+class SparseFieldsMixin:
+    """
+    Accept a `fields` kwarg (from ?fields=a,b,c) and drop every other field.
+    Pair with sparse_queryset() so the SQL only reads what is serialized.
+    """
+
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop("fields", None)
+        super().__init__(*args, **kwargs)
+        if fields:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+
+def parse_sparse_fields(request, serializer_class):
+    """Valid names from ?fields=, or None when absent (= every field)"""
+    requested = request.query_params.get("fields")
+    if not requested:
+        return None
+    allowed = serializer_class.Meta.fields
+    fields = [name for name in dict.fromkeys(requested.split(",")) if name in allowed]
+    return fields or None
+
+
+def sparse_queryset(queryset, serializer_class, fields=None):
+    """
+    Narrow the SELECT to the columns behind `fields` and prefetch only the
+    nested relations that will actually be serialized.
+    """
+    model = serializer_class.Meta.model
+    columns, prefetch = [], []
+    for name in fields or serializer_class.Meta.fields:
+        nested = serializer_class._declared_fields.get(name)
+        if isinstance(nested, serializers.BaseSerializer):
+            prefetch.append(nested.source or name)
+            continue
+        try:
+            field = model._meta.get_field(name)
+        except FieldDoesNotExist:
+            continue
+        if field.concrete:
+            columns.append(name)
+    return queryset.only(*columns).prefetch_related(*prefetch)
+
+
 class  InputEmailSerializer(serializers.ModelSerializer):
     class Meta:
         model =InputEmail
@@ -17,23 +112,24 @@ class CategoryListSerializer(serializers.ModelSerializer):
         model = Category
         fields = ["id", "name"]  
         
-class ProductListSerializer(serializers.ModelSerializer):
+class ProductListSerializer(SparseFieldsMixin, CompactSerializerMixin, serializers.ModelSerializer):
     categories  = CategoryListSerializer(many=True, read_only=True)
     class Meta:
         model = Product
-        fields = ["id", "name", "description","price", "slug", "image", "featured", "categories", "stock",  "is_popular", "created_at"]
+        fields = ["id", "name", "description","price", "slug", "image", "image_variants", "featured", "categories", "stock",  "is_popular", "created_at"]
+        compact = {"categories": "categories"}
 
 class ProductImageSerializer(serializers.ModelSerializer):
     class Meta:
         model = ProductImage
-        fields = ["image"]
+        fields = ["image", "image_variants"]
         
-class ProductDetailSerializer(serializers.ModelSerializer):
+class ProductDetailSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     categories  = CategoryListSerializer(many=True, read_only=True)
     gallery = ProductImageSerializer(many=True, read_only=True)
     class Meta:
         model = Product
-        fields = ["id", "name", "description","price", "gallery", "fabric", "dimension",  "care", "categories"]
+        fields = ["id", "name", "description","price", "image_variants", "gallery", "fabric", "dimension",  "care", "categories"]
 
             
         
@@ -61,28 +157,31 @@ class CartSerializer(serializers.ModelSerializer):
         return total
     
     
-class WishListSerializer(serializers.ModelSerializer):
+class WishListSerializer(CompactSerializerMixin, serializers.ModelSerializer):
     user = UserSerializer(read_only= True)
     product = ProductListSerializer(read_only= True)
     class Meta:
         model = WishList
         fields = ["id", "user", "product"]
+        compact = {"user": "users", "product": "products"}
         
      
         
-class AddressSerializer(serializers.ModelSerializer):
+class AddressSerializer(CompactSerializerMixin, serializers.ModelSerializer):
     user = UserSerializer(read_only= True)
     class Meta:
         model = Address
         fields = ["id", "user", "first_name", "last_name", "phone_number", "additional_phone_number", "delivery_address", "additional_information", "region", "city"]
+        compact = {"user": "users"}
         
         
-class RecentlyViewedSerializer(serializers.ModelSerializer):
+class RecentlyViewedSerializer(CompactSerializerMixin, serializers.ModelSerializer):
     user = UserSerializer(read_only= True)
     product = ProductListSerializer(read_only= True)
     class Meta:
         model = RecentlyViewed
         fields = ["id", "user", "product"]
+        compact = {"user": "users", "product": "products"}
         
  
 class OrderSerializer(serializers.ModelSerializer):
@@ -91,9 +190,10 @@ class OrderSerializer(serializers.ModelSerializer):
         fields = ["id", "paystack_checkout_id", "amount", "currency", "customer_email", "status", "created_at"]
                
     
-class OrderItemSerializer(serializers.ModelSerializer):
+class OrderItemSerializer(CompactSerializerMixin, serializers.ModelSerializer):
     order = OrderSerializer(read_only= True)
     product = ProductListSerializer(read_only= True)
     class Meta:
         model = OrderItem
         fields = ["id", "order", "product", "quantity"]
+        compact = {"order": "orders", "product": "products"}
@@ -1,9 +1,41 @@
 # signals.py
-from django.db.models.signals import post_save
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete, m2m_changed, post_init
+from django.core.files import File
 from django.dispatch import receiver
 from django.db import transaction
 
-from .models import Product, ProductImage
+from .models import Product, ProductImage, Category, SimilarProduct
+from .facets import catalog_index
+from . import similarity, image_variants
+
+@receiver(post_init, sender=Product)
+@receiver(post_init, sender=ProductImage)
+def remember_image(sender, instance, **kwargs):
+    # the value as loaded, parsed only if the instance is saved
+    instance._loaded_image = instance.__dict__.get("image")
+
+
+@receiver(pre_save, sender=Product)
+@receiver(pre_save, sender=ProductImage)
+def build_image_variants(sender, instance, **kwargs):
+    """Variant URLs go in with the row itself when the image is already on Cloudinary."""
+    image = instance.__dict__.get("image")
+    instance._image_uploading = isinstance(image, File)
+    if "image" not in instance.__dict__:
+        return  # deferred, so not being changed
+    if instance.image_variants and image_variants.public_id(image) == image_variants.public_id(instance._loaded_image):
+        return  # same image, its variants are already stored
+    instance.image_variants = image_variants.build(image)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=ProductImage)
+def store_uploaded_image_variants(sender, instance, **kwargs):
+    # a fresh upload only gets its Cloudinary id during save()
+    if instance._image_uploading:
+        image_variants.refresh(instance)
+    instance._loaded_image = instance.__dict__.get("image")
+
 
 @receiver(post_save, sender=Product)
 def create_product_image_on_create(sender, instance: Product, created: bool, **kwargs):
@@ -24,3 +56,104 @@ def create_product_image_on_create(sender, instance: Product, created: bool, **k
             ProductImage.objects.create(product=instance, image=instance.image)
 
     transaction.on_commit(_create_gallery_image)
+
+
+@receiver(post_save, sender=Product)
+def update_facet_index(sender, instance: Product, **kwargs):
+    """Keep the in-memory facet bitmaps in step with product edits."""
+    transaction.on_commit(lambda: catalog_index.update_product(instance))
+
+
+@receiver(post_delete, sender=Product)
+def remove_from_facet_index(sender, instance: Product, **kwargs):
+    product_id = instance.pk
+    transaction.on_commit(lambda: catalog_index.remove_product(product_id))
+
+
+@receiver(m2m_changed, sender=Product.categories.through)
+def update_facet_categories(sender, instance, action, reverse, **kwargs):
+    if not action.startswith("post_"):
+        return
+    if reverse:
+        # category.products.add(...) touches many products at once
+        transaction.on_commit(catalog_index.invalidate)
+        return
+    category_ids = list(instance.categories.values_list("id", flat=True))
+    transaction.on_commit(lambda: catalog_index.update_product(instance, category_ids))
+
+
+@receiver(post_delete, sender=Category)
+def drop_category_from_facet_index(sender, instance: Category, **kwargs):
+    # the through rows go with it and don't send m2m_changed
+    transaction.on_commit(catalog_index.invalidate)
+
+
+# similar products: refresh_queue does the work in the background, and only
+# for changes to what the vectors are made of (not stock, price, ...)
+
+def _similarity_fields(model):
+    return similarity.TEXT_FIELDS if model is Product else ("name",)
+
+
+@receiver(post_init, sender=Product)
+@receiver(post_init, sender=Category)
+def remember_similarity_text(sender, instance, **kwargs):
+    # deferred fields are left out rather than loaded
+    instance._similarity_text = {
+        field: instance.__dict__[field] for field in _similarity_fields(sender) if field in instance.__dict__
+    }
+
+
+def _similarity_text_changed(instance, update_fields):
+    fields = [field for field in _similarity_fields(type(instance)) if update_fields is None or field in update_fields]
+    saved = {field: instance.__dict__[field] for field in fields if field in instance.__dict__}
+    before = instance._similarity_text
+    instance._similarity_text = {**before, **saved}
+    return any(field not in before or before[field] != value for field, value in saved.items())
+
+
+@receiver(post_save, sender=Product)
+def refresh_similar_products(sender, instance: Product, created: bool, update_fields, **kwargs):
+    if _similarity_text_changed(instance, update_fields) or created:
+        product_id = instance.pk
+        transaction.on_commit(lambda: similarity.refresh_queue.add([product_id]))
+
+
+@receiver(pre_delete, sender=Product)
+def refresh_similar_on_delete(sender, instance: Product, **kwargs):
+    # the cascade removes the rows pointing at it, so look them up first
+    affected = list(SimilarProduct.objects.filter(similar=instance).values_list("product_id", flat=True))
+    if affected:
+        transaction.on_commit(lambda: similarity.refresh_queue.add(affected))
+
+
+@receiver(m2m_changed, sender=Product.categories.through)
+def refresh_similar_categories(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    if not reverse:
+        product_ids = [instance.pk]
+    elif pk_set:
+        product_ids = list(pk_set)
+    else:
+        # category.products.clear() doesn't say which products it touched
+        transaction.on_commit(lambda: similarity.refresh_queue.add(rebuild=True))
+        return
+    transaction.on_commit(lambda: similarity.refresh_queue.add(product_ids))
+
+
+@receiver(post_save, sender=Category)
+def refresh_similar_category_rename(sender, instance: Category, created: bool, update_fields, **kwargs):
+    """Category names are part of every product vector in it"""
+    if not _similarity_text_changed(instance, update_fields) or created:
+        return
+    product_ids = list(instance.products.values_list("id", flat=True))
+    if product_ids:
+        transaction.on_commit(lambda: similarity.refresh_queue.add(product_ids))
+
+
+@receiver(pre_delete, sender=Category)
+def refresh_similar_category_delete(sender, instance: Category, **kwargs):
+    product_ids = list(instance.products.values_list("id", flat=True))
+    if product_ids:
+        transaction.on_commit(lambda: similarity.refresh_queue.add(product_ids))
@@ -0,0 +1,340 @@
+"""
+Content-based "similar products".
+
+A product's name, description, fabric, dimension and category names become an
+L2-normalised TF-IDF vector (ProductVector, over the SimilarityTerm
+vocabulary), so cosine similarity is a plain dot product. Neighbours are found
+BLOCK_SIZE x BLOCK_SIZE products at a time, keeping a running top-k per row,
+so memory is bounded by the block size rather than the catalog size. The top-k
+lands in SimilarProduct and the endpoint is one indexed read.
+
+rebuild() recomputes vocabulary, vectors and neighbours from scratch.
+refresh() re-vectorises a few changed products against the stored vocabulary
+(words first seen since the last rebuild are ignored until the next one) and
+only touches the neighbour lists those products can affect. Both scan the
+whole catalog, so the signals hand changes to refresh_queue, which runs them
+on a background thread, one at a time, coalescing whatever arrived meanwhile.
+"""
+import logging
+import math
+import re
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from django.conf import settings
+from django.db import connections, transaction
+
+from .models import Product, ProductVector, SimilarityTerm, SimilarProduct
+
+logger = logging.getLogger(__name__)
+
+TOP_K = getattr(settings, "SIMILAR_PRODUCTS_TOP_K", 12)
+MAX_TERMS = getattr(settings, "SIMILAR_PRODUCTS_MAX_TERMS", 5000)
+BLOCK_SIZE = 512
+# what a product's vector is made of, besides its category names
+TEXT_FIELDS = ("name", "description", "fabric", "dimension")
+
+_WORD = re.compile(r"[a-z0-9]+")
+STOP_WORDS = frozenset(
+    "a an and are as at be by for from has in is it its of on or our that the this to with you your".split()
+)
+
+
+def tokens(*texts):
+    words = _WORD.findall(" ".join(text for text in texts if text).lower())
+    return [word for word in words if len(word) > 1 and word not in STOP_WORDS]
+
+
+def _documents(product_ids=None):
+    """{product id: Counter of terms} for every product, or just product_ids"""
+    products = Product.objects.all()
+    links = Product.categories.through.objects.all()
+    if product_ids is not None:
+        products = products.filter(id__in=product_ids)
+        links = links.filter(product_id__in=product_ids)
+
+    categories = {}
+    for product_id, name in links.values_list("product_id", "category__name"):
+        categories.setdefault(product_id, []).append(name)
+
+    return {
+        product_id: Counter(tokens(name, description, fabric, dimension, *categories.get(product_id, ())))
+        for product_id, name, description, fabric, dimension in products.values_list("id", *TEXT_FIELDS)
+    }
+
+
+def _vectorize(document, vocabulary):
+    """Sparse (columns, weights) for one document; sublinear tf, unit length"""
+    entries = sorted(
+        (vocabulary[term][0], (1 + math.log(count)) * vocabulary[term][1])
+        for term, count in document.items()
+        if term in vocabulary
+    )
+    columns = np.array([column for column, _ in entries], dtype=np.int32)
+    weights = np.array([weight for _, weight in entries], dtype=np.float32)
+    if len(weights):
+        weights /= np.linalg.norm(weights)
+    return columns, weights
+
+
+class _Vectors:
+    """Sparse rows (CSR layout) for a set of products, densified a block at a time"""
+
+    def __init__(self, vectors, width):
+        self.ids = np.array(sorted(vectors), dtype=np.int64)
+        rows = [vectors[product_id] for product_id in self.ids.tolist()]
+        self.indptr = np.r_[0, np.cumsum([len(columns) for columns, _ in rows])].astype(np.int64)
+        self.columns = np.concatenate([columns for columns, _ in rows]) if rows else np.array([], dtype=np.int32)
+        self.weights = np.concatenate([weights for _, weights in rows]) if rows else np.array([], dtype=np.float32)
+        self.width = width
+
+    def __len__(self):
+        return len(self.ids)
+
+    def dense(self, start, stop):
+        block = np.zeros((stop - start, self.width), dtype=np.float32)
+        low, high = self.indptr[start], self.indptr[stop]
+        rows = np.repeat(np.arange(stop - start), np.diff(self.indptr[start:stop + 1]))
+        block[rows, self.columns[low:high]] = self.weights[low:high]
+        return block
+
+
+def _blocks(vectors):
+    for start in range(0, len(vectors), BLOCK_SIZE):
+        stop = min(start + BLOCK_SIZE, len(vectors))
+        yield start, stop, vectors.dense(start, stop)
+
+
+def _neighbours(queries, everything, k=TOP_K, each_block=None):
+    """
+    Yields (product id, [(neighbour id, score), ...]) for every query row,
+    best first, against every product in `everything`. each_block, if given,
+    sees every (query ids, everything ids, scores) block as it is computed.
+    """
+    for q_start, q_stop, query_block in _blocks(queries):
+        query_ids = queries.ids[q_start:q_stop, None]
+        best_scores = np.full((len(query_ids), k), -np.inf, dtype=np.float32)
+        best_ids = np.full((len(query_ids), k), -1, dtype=np.int64)
+
+        for start, stop, block in _blocks(everything):
+            scores = query_block @ block.T
+            if each_block:
+                each_block(queries.ids[q_start:q_stop], everything.ids[start:stop], scores)
+            ids = np.broadcast_to(everything.ids[start:stop], scores.shape)
+            scores[ids == query_ids] = -np.inf  # not your own neighbour
+            scores = np.hstack([best_scores, scores])
+            ids = np.hstack([best_ids, ids])
+            keep = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            best_scores = np.take_along_axis(scores, keep, axis=1)
+            best_ids = np.take_along_axis(ids, keep, axis=1)
+
+        order = np.argsort(-best_scores, axis=1, kind="stable")
+        best_scores = np.take_along_axis(best_scores, order, axis=1)
+        best_ids = np.take_along_axis(best_ids, order, axis=1)
+        for product_id, row_ids, row_scores in zip(query_ids[:, 0].tolist(), best_ids.tolist(), best_scores.tolist()):
+            yield product_id, [(other, score) for other, score in zip(row_ids, row_scores) if score > 0]
+
+
+def _similar_rows(product_id, neighbours):
+    return [SimilarProduct(product_id=product_id, similar_id=other, score=score) for other, score in neighbours]
+
+
+def _vector_row(product_id, vector):
+    columns, weights = vector
+    return ProductVector(product_id=product_id, columns=columns.tobytes(), weights=weights.tobytes())
+
+
+def _stored_vectors(width):
+    vectors = {
+        product_id: (np.frombuffer(columns, dtype=np.int32), np.frombuffer(weights, dtype=np.float32))
+        for product_id, columns, weights in ProductVector.objects.values_list("product_id", "columns", "weights")
+    }
+    return _Vectors(vectors, width)
+
+
+def rebuild(batch_size=5000, stdout=None):
+    """Recompute vocabulary, vectors and neighbours for the whole catalog"""
+    documents = _documents()
+    frequency = Counter()
+    for document in documents.values():
+        frequency.update(document.keys())
+
+    n = len(documents)
+    terms = sorted(sorted(frequency, key=lambda term: (-frequency[term], term))[:MAX_TERMS])
+    vocabulary = {
+        term: (column, math.log((1 + n) / (1 + frequency[term])) + 1)
+        for column, term in enumerate(terms)
+    }
+    vectors = {product_id: _vectorize(document, vocabulary) for product_id, document in documents.items()}
+    vectors = {product_id: vector for product_id, vector in vectors.items() if len(vector[0])}
+
+    everything = _Vectors(vectors, len(vocabulary))
+    similar = []
+    for product_id, neighbours in _neighbours(everything, everything):
+        similar.extend(_similar_rows(product_id, neighbours))
+
+    with transaction.atomic():
+        SimilarityTerm.objects.all().delete()
+        ProductVector.objects.all().delete()
+        SimilarProduct.objects.all().delete()
+        SimilarityTerm.objects.bulk_create(
+            (SimilarityTerm(term=term, column=column, idf=idf) for term, (column, idf) in vocabulary.items()),
+            batch_size=batch_size,
+        )
+        ProductVector.objects.bulk_create(
+            (_vector_row(product_id, vector) for product_id, vector in vectors.items()),
+            batch_size=batch_size,
+        )
+        SimilarProduct.objects.bulk_create(similar, batch_size=batch_size)
+
+    if stdout:
+        stdout.write(f"{len(vocabulary)} terms, {len(vectors)} products, {len(similar)} similar pairs")
+    return len(similar)
+
+
+def refresh(product_ids):
+    """Bring vectors and neighbour lists up to date after product_ids changed or were deleted"""
+    changed = set(product_ids)
+    vocabulary = {
+        term: (column, idf) for term, column, idf in SimilarityTerm.objects.values_list("term", "column", "idf")
+    }
+    if not vocabulary:
+        rebuild()  # never built, so there is nothing to patch
+        return
+
+    vectors = {
+        product_id: vector
+        for product_id, document in _documents(changed).items()
+        if len((vector := _vectorize(document, vocabulary))[0])
+    }
+
+    with transaction.atomic():
+        ProductVector.objects.filter(product_id__in=changed).delete()
+        ProductVector.objects.bulk_create(_vector_row(product_id, vector) for product_id, vector in vectors.items())
+
+        everything = _stored_vectors(len(vocabulary))
+        # lists that mention a changed product may lose it, so they are recomputed in full
+        stale = set(SimilarProduct.objects.filter(similar_id__in=changed).values_list("product_id", flat=True))
+        recompute = {product_id: vectors.get(product_id) for product_id in changed | stale}
+        for product_id in stale - changed:
+            position = np.searchsorted(everything.ids, product_id)
+            if position < len(everything) and everything.ids[position] == product_id:
+                low, high = everything.indptr[position], everything.indptr[position + 1]
+                recompute[product_id] = (everything.columns[low:high], everything.weights[low:high])
+        recompute = {product_id: vector for product_id, vector in recompute.items() if vector is not None}
+        skip = changed | stale
+
+        # the changed rows' scores against everything are also everyone
+        # else's scores against them, so one pass finds both
+        candidates = {}
+
+        def collect(query_ids, ids, scores):
+            rows, columns = np.nonzero(scores > 0)
+            for row, column in zip(rows.tolist(), columns.tolist()):
+                product_id = int(ids[column])
+                if product_id not in skip:
+                    candidates.setdefault(product_id, []).append((int(query_ids[row]), float(scores[row, column])))
+
+        similar = []
+        changed_vectors = {product_id: vector for product_id, vector in recompute.items() if product_id in changed}
+        for product_id, neighbours in _neighbours(_Vectors(changed_vectors, len(vocabulary)), everything,
+                                                  each_block=collect):
+            similar.extend(_similar_rows(product_id, neighbours))
+        stale_vectors = {product_id: vector for product_id, vector in recompute.items() if product_id not in changed}
+        for product_id, neighbours in _neighbours(_Vectors(stale_vectors, len(vocabulary)), everything):
+            similar.extend(_similar_rows(product_id, neighbours))
+
+        # everyone else can only gain a changed product, if it beats their current k-th best
+        similar.extend(_merge_changed(candidates))
+
+        SimilarProduct.objects.filter(product_id__in=skip).delete()
+        SimilarProduct.objects.bulk_create(similar)
+
+
+def _merge_changed(candidates):
+    """New rows for the lists a changed product now belongs in; candidates is {product id: [(changed id, score)]}"""
+    if not candidates:
+        return []
+
+    current = {}
+    for product_id, other, score in SimilarProduct.objects.filter(product_id__in=candidates).values_list(
+        "product_id", "similar_id", "score"
+    ):
+        current.setdefault(product_id, []).append((other, score))
+
+    similar, rewritten = [], []
+    for product_id, new in candidates.items():
+        existing = current.get(product_id, [])
+        if len(existing) >= TOP_K and max(score for _, score in new) <= min(score for _, score in existing):
+            continue
+        merged = sorted(existing + new, key=lambda pair: -pair[1])[:TOP_K]
+        rewritten.append(product_id)
+        similar.extend(_similar_rows(product_id, merged))
+    SimilarProduct.objects.filter(product_id__in=rewritten).delete()
+    return similar
+
+
+class RefreshQueue:
+    """
+    Runs refresh() and rebuild() on one background thread. Every submit()
+    drains everything queued so far, so a burst of edits is one refresh.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._product_ids = set()
+        self._rebuild = False
+        self._executor = None
+        self._futures = []
+
+    def add(self, product_ids=(), rebuild=False):
+        with self._lock:
+            self._product_ids.update(product_ids)
+            self._rebuild = self._rebuild or rebuild
+        self.submit()
+
+    def submit(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="similarity")
+            future = self._executor.submit(self._run)
+            self._futures = [f for f in self._futures if not f.done()] + [future]
+        return future
+
+    def wait(self, timeout=None):
+        """Block until every submitted refresh has finished (tests, management commands)"""
+        with self._lock:
+            futures = list(self._futures)
+        for future in futures:
+            future.result(timeout)
+
+    def run_pending(self):
+        """Refresh (or rebuild) for everything queued so far, in this thread"""
+        with self._lock:
+            product_ids, full = self._product_ids, self._rebuild
+            self._product_ids, self._rebuild = set(), False
+        try:
+            if full:
+                rebuild()
+            elif product_ids:
+                refresh(product_ids)
+        except Exception:
+            # keep them for the next change's refresh
+            with self._lock:
+                self._product_ids.update(product_ids)
+                self._rebuild = self._rebuild or full
+            raise
+
+    def _run(self):
+        try:
+            self.run_pending()
+        except Exception:
+            logger.exception("Similar products refresh failed")
+        finally:
+            # this thread's own DB connection
+            connections.close_all()
+
+
+refresh_queue = RefreshQueue()
@@ -0,0 +1,214 @@
+"""
+Slow-query log.
+
+SlowQueryMiddleware (core/middleware.py) passes every query that takes
+SLOW_QUERY_MS or longer to record(), with the view it ran for and the line of
+our code that ran it. Occurrences are totalled in-process by fingerprint and
+written to SlowQuery every SLOW_QUERY_FLUSH_INTERVAL seconds by a background
+thread, which first runs EXPLAIN (EXPLAIN QUERY PLAN on SQLite) for the
+fingerprints nobody has explained yet, so the request that was slow pays for
+neither. report() is the top of the table by total time, across workers.
+"""
+import atexit
+import hashlib
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.db import connection, connections, transaction
+from django.utils import timezone
+
+from core.middleware import fingerprint
+
+from .models import SlowQuery
+
+logger = logging.getLogger(__name__)
+
+FLUSH_INTERVAL = getattr(settings, "SLOW_QUERY_FLUSH_INTERVAL", 30)
+# statements whose plan says something; INSERT plans don't
+EXPLAINABLE = ("SELECT", "WITH", "UPDATE", "DELETE")
+KEEP_TOP = 20  # views and locations kept per fingerprint
+
+_lock = threading.Lock()
+_pending = {}  # fingerprint hash -> occurrences since the last flush
+# fingerprint hash -> (alias, sql, params) to explain unless the table has a plan
+_to_explain = {}
+_last_flush = time.monotonic()
+
+_BASE = str(settings.BASE_DIR) + os.sep
+# frames that are never "the code that ran the query"
+_SKIP = (os.path.join(_BASE, "core", ""), __file__)
+
+
+def code_location():
+    """The innermost frame of our own code on the stack, as "file:line in function" """
+    frame = sys._getframe(1)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename.startswith(_BASE) and "site-packages" not in filename and not filename.startswith(_SKIP):
+            return f"{filename[len(_BASE):]}:{frame.f_lineno} in {frame.f_code.co_name}"
+        frame = frame.f_back
+    return None
+
+
+def record(sql, params, seconds, alias="default", view=None, location=None, many=False):
+    global _last_flush
+    normalized = fingerprint(sql)
+    key = hashlib.sha1(normalized.encode()).hexdigest()
+    ms = seconds * 1000
+    with _lock:
+        entry = _pending.get(key)
+        if entry is None:
+            entry = _pending[key] = {
+                "fingerprint": normalized, "sql": sql, "params": params, "count": 0, "total_ms": 0.0,
+                "max_ms": 0.0, "views": Counter(), "locations": Counter(), "first_seen": timezone.now(),
+            }
+        entry["count"] += 1
+        entry["total_ms"] += ms
+        if ms >= entry["max_ms"]:
+            entry["max_ms"], entry["sql"], entry["params"] = ms, sql, params
+        entry["views"][view or "<none>"] += 1
+        entry["locations"][location or "<framework>"] += 1
+        entry["last_seen"] = timezone.now()
+
+        if key not in _to_explain and not many and sql.lstrip().upper().startswith(EXPLAINABLE):
+            _to_explain[key] = (alias, sql, params)
+        due = time.monotonic() - _last_flush >= FLUSH_INTERVAL
+        if due:
+            _last_flush = time.monotonic()
+    if due:
+        FlushThread().start()
+
+
+def explain(alias, sql, params):
+    db = connections[alias]
+    with db.cursor() as cursor:
+        cursor.execute(f"{db.ops.explain_query_prefix()} {sql}", params)
+        rows = cursor.fetchall()
+    if db.vendor == "sqlite":
+        # (id, parent, notused, detail): the detail is the plan
+        return "\n".join(str(row[-1]) for row in rows)
+    return "\n".join(" ".join(str(column) for column in row) for row in rows)
+
+
+def flush():
+    """Explain new fingerprints and add everything pending to SlowQuery"""
+    global _last_flush
+    with _lock:
+        pending, jobs = dict(_pending), dict(_to_explain)
+        _pending.clear()
+        _to_explain.clear()
+        _last_flush = time.monotonic()
+    if not pending:
+        return 0
+
+    if jobs:
+        # most will have been explained by an earlier flush or another worker
+        explained = set(
+            SlowQuery.objects.filter(fingerprint_hash__in=jobs, explained_at__isnull=False)
+            .values_list("fingerprint_hash", flat=True)
+        )
+        jobs = {key: job for key, job in jobs.items() if key not in explained}
+    plans = {}
+    for key, (alias, sql, params) in jobs.items():
+        try:
+            plans[key] = explain(alias, sql, params)
+        except Exception as e:
+            plans[key] = f"EXPLAIN failed: {e}"
+
+    now = timezone.now()
+    try:
+        with transaction.atomic():
+            rows = {
+                row.fingerprint_hash: row
+                for row in SlowQuery.objects.select_for_update().filter(fingerprint_hash__in=pending)
+            }
+            new = []
+            for key, entry in pending.items():
+                row = rows.get(key)
+                if row is None:
+                    row = SlowQuery(fingerprint_hash=key, fingerprint=entry["fingerprint"], first_seen=entry["first_seen"])
+                    new.append(row)
+                if entry["max_ms"] >= row.max_ms:
+                    row.sample_sql, row.sample_params = entry["sql"], repr(entry["params"])[:2000]
+                row.count += entry["count"]
+                row.total_ms += entry["total_ms"]
+                row.max_ms = max(row.max_ms, entry["max_ms"])
+                row.views = dict((Counter(row.views) + entry["views"]).most_common(KEEP_TOP))
+                row.locations = dict((Counter(row.locations) + entry["locations"]).most_common(KEEP_TOP))
+                row.last_seen = entry["last_seen"]
+                if key in plans:
+                    row.plan, row.explained_at = plans[key], now
+            SlowQuery.objects.bulk_create(new)
+            SlowQuery.objects.bulk_update(
+                list(rows.values()),
+                ["sample_sql", "sample_params", "count", "total_ms", "max_ms", "views", "locations", "last_seen",
+                 "plan", "explained_at"],
+            )
+    except Exception:
+        # put the batch back so it is retried next flush (e.g. another
+        # worker created the same fingerprint's row first)
+        with _lock:
+            for key, entry in pending.items():
+                current = _pending.setdefault(key, entry)
+                if current is not entry:
+                    current["count"] += entry["count"]
+                    current["total_ms"] += entry["total_ms"]
+                    current["max_ms"] = max(current["max_ms"], entry["max_ms"])
+                    current["views"].update(entry["views"])
+                    current["locations"].update(entry["locations"])
+            for key, job in jobs.items():
+                _to_explain.setdefault(key, job)
+        raise
+    return len(pending)
+
+
+ORDERS = ("total_ms", "max_ms", "count")
+
+
+def report(limit=20, order="total_ms"):
+    """The slowest fingerprints across workers, by total_ms, max_ms or count"""
+    return SlowQuery.objects.order_by(f"-{order}")[:limit]
+
+
+def as_dict(row):
+    return {
+        "fingerprint": row.fingerprint,
+        "count": row.count,
+        "total_ms": round(row.total_ms, 2),
+        "mean_ms": round(row.total_ms / row.count, 2) if row.count else 0,
+        "max_ms": round(row.max_ms, 2),
+        "views": row.views,
+        "locations": row.locations,
+        "plan": row.plan,
+        "sample_sql": row.sample_sql,
+        "sample_params": row.sample_params,
+        "first_seen": row.first_seen,
+        "last_seen": row.last_seen,
+    }
+
+
+class FlushThread(threading.Thread):
+    """Explain and write slow queries without holding up the request that triggered it."""
+
+    def run(self):
+        try:
+            flush()
+        except Exception:
+            logger.exception("Slow query flush failed")
+        finally:
+            connection.close()
+
+
+def _flush_on_exit():
+    try:
+        flush()
+    except Exception:
+        logger.exception("Slow query flush failed")
+
+
+atexit.register(_flush_on_exit)
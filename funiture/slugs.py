@@ -0,0 +1,132 @@
+"""
+Slug allocation for Product and Category.
+
+A name's slug is slugify(name), or slugify(name)-N once that is taken, where
+N is one past the largest suffix in use. Checking the bare slugs is one
+indexed IN query per batch of names; only names that collide then cost one
+more query each, for the longest numbered slug in the prefix range
+(slug LIKE 'base-%'), which holds the largest N. Nothing probes candidates
+one at a time, so the n-th product with a name costs one round trip rather
+than n. That query still reads and sorts every base-N row in the range, so
+its own cost grows with the number of products sharing the name.
+
+Two writers can still pick the same slug at the same moment; the unique
+index rejects the second and save_with_slug() / the bulk importer allocate
+again and retry, if the constraint that failed is on a slug column.
+"""
+import re
+
+from django.db import IntegrityError, connections, transaction
+from django.db.models.functions import Length
+from django.utils.text import slugify
+
+# keeps room for a "-N" suffix inside SlugField's max_length
+SUFFIX_ROOM = 8
+# names per IN query
+NAMES_PER_QUERY = 500
+# attempts before a concurrent slug collision is reported
+ATTEMPTS = 5
+
+
+def base_slug(model, name):
+    max_length = model._meta.get_field("slug").max_length
+    return slugify(name)[:max_length - SUFFIX_ROOM].strip("-") or model._meta.model_name
+
+
+def _max_suffix(model, base):
+    """Largest N for which base-N exists, 0 if none; one query, but it sorts every base-N row"""
+    # rows like base-table share the prefix but aren't numbered; of the
+    # numbered ones the longest holds the biggest number
+    slug = (
+        model._default_manager
+        .filter(slug__startswith=f"{base}-", slug__regex=rf"^{re.escape(base)}-[0-9]+$")
+        .order_by(Length("slug").desc(), "-slug")
+        .values_list("slug", flat=True)
+        .first()
+    )
+    return int(slug[len(base) + 1:]) if slug else 0
+
+
+def _taken(model, slugs):
+    slugs = sorted(slugs)
+    taken = set()
+    for start in range(0, len(slugs), NAMES_PER_QUERY):
+        taken.update(
+            model._default_manager.filter(slug__in=slugs[start:start + NAMES_PER_QUERY]).values_list("slug", flat=True)
+        )
+    return taken
+
+
+def allocate_slugs(model, names):
+    """Unique slugs for `names`, in order"""
+    bases = [base_slug(model, name) for name in names]
+    taken = _taken(model, set(bases))
+    next_suffix = {}
+
+    slugs, used = [], set()
+    for base in bases:
+        if base not in taken and base not in used:
+            slug = base
+        else:
+            if base not in next_suffix:
+                next_suffix[base] = _max_suffix(model, base) + 1
+            # another name in this batch may already have produced base-N
+            while (slug := f"{base}-{next_suffix[base]}") in used:
+                next_suffix[base] += 1
+            next_suffix[base] += 1
+        used.add(slug)
+        slugs.append(slug)
+    return slugs
+
+
+_slug_constraints = {}  # (alias, table) -> names of the unique constraints on its slug column
+
+
+def _constraint_names(model, using):
+    table, column = model._meta.db_table, model._meta.get_field("slug").column
+    key = (using, table)
+    if key not in _slug_constraints:
+        connection = connections[using]
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(cursor, table)
+        _slug_constraints[key] = {
+            name for name, info in constraints.items() if info["unique"] and info["columns"] == [column]
+        }
+    return _slug_constraints[key]
+
+
+def is_slug_conflict(error, *models, using="default"):
+    """Whether an IntegrityError came from the unique slug of one of `models`"""
+    message = str(error)
+    # SQLite: "UNIQUE constraint failed: funiture_product.slug"
+    if message.startswith("UNIQUE constraint failed: "):
+        failed = set(message[len("UNIQUE constraint failed: "):].split(", "))
+        return any(f"{model._meta.db_table}.{model._meta.get_field('slug').column}" in failed for model in models)
+    # PostgreSQL names the constraint in the error's diagnostics, others in the message
+    constraint = getattr(getattr(error.__cause__, "diag", None), "constraint_name", None)
+    for model in models:
+        names = _constraint_names(model, using)
+        if constraint in names or (constraint is None and any(name in message for name in names)):
+            return True
+    return False
+
+
+def save_with_slug(instance, save, **kwargs):
+    """
+    Call save(**kwargs) (the model's super().save) with a freshly allocated
+    slug if the instance has none, retrying when a concurrent insert wins it.
+    """
+    if instance.slug:
+        return save(**kwargs)
+    for attempt in range(ATTEMPTS):
+        instance.slug = allocate_slugs(type(instance), [instance.name])[0]
+        try:
+            with transaction.atomic(using=kwargs.get("using")):
+                return save(**kwargs)
+        except IntegrityError as e:
+            if not is_slug_conflict(e, type(instance), using=kwargs.get("using") or "default"):
+                raise
+            # a concurrent insert took the slug; allocate again
+            instance.slug = ""
+            if attempt == ATTEMPTS - 1:
+                raise
@@ -1,3 +1,1859 @@
-from django.test import TestCase
+import glob
+import hashlib
+import hmac
+import io
+import json
+import logging
+import math
+import os
+import pstats
+import random
+import re
+import shutil
+import tempfile
+import threading
+import tracemalloc
+import uuid
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.db.models import ProtectedError
+from django.http import HttpResponse
+from django.test import Client, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from django.contrib.auth import get_user_model
+
+from core import memory, metrics, profiling, tracing
+from core.middleware import QueryProfilingMiddleware
+from utils.email import EmailThread
+from utils.jwt_token import token_generator
+from utils.paginator import EstimatedCountPaginator
+from utils.query_budget import QueryBudgetMixin
+from .models import (Product, Category, Cart, CartItem, Order, OrderItem, WishList, Address, RecentlyViewed,
+                     ProductImage, ProductCooccurrence, ProductPopularity, RelatedProduct, SimilarProduct,
+                     DailySales, DailyProductSales, DailyCategorySales, PendingUpload, SlowQuery)
+from .serializers import ProductListSerializer, CartSerializer, OrderItemSerializer
+from .facets import catalog_index
+from . import (benchmark, fast_serializers, image_uploads, image_variants, popularity, recently_viewed, recommendations,
+               similarity, slow_queries, slugs)
+
+User = get_user_model()
+
+
+def render(data):
+    return JSONRenderer().render(data)
+
+
+class FastSerializerParityTests(TestCase):
+    """fast_serializers must render byte-for-byte what the DRF serializers render"""
+
+    @classmethod
+    def setUpTestData(cls):
+        categories = [Category.objects.create(name=f"Category {i}") for i in range(3)]
+        cls.products = []
+        for i in range(8):
+            product = Product.objects.create(
+                name=f"Chair {i}",
+                description="Solid oak " * i,
+                price=f"{i * 1000 + 99}.5",
+                image=f"v17000{i}/chairs/chair_{i}.jpg",
+                featured=i % 2 == 0,
+                is_popular=i % 3 == 0,
+                stock=i,
+                fabric="Linen" if i % 2 else None,
+            )
+            product.categories.set(categories[:i % 4])
+            cls.products.append(product)
+
+        cls.cart = Cart.objects.create()
+        for i, product in enumerate(cls.products[:5]):
+            CartItem.objects.create(cart=cls.cart, product=product, quantity=i + 1)
+        cls.empty_cart = Cart.objects.create()
+
+        cls.user = User.objects.create_user(email="buyer@example.com", password="x", is_active=True)
+        for n in range(2):
+            order = Order.objects.create(
+                paystack_checkout_id=f"ps_{n}", amount="15000.75", currency="NGN",
+                customer_email=cls.user.email, status="Paid",
+            )
+            for product in cls.products[n::2]:
+                OrderItem.objects.create(order=order, product=product, quantity=n + 2)
+
+    def test_product_list(self):
+        queryset = Product.objects.all()
+        self.assertEqual(
+            render(fast_serializers.product_list_serializer.serialize(queryset)),
+            render(ProductListSerializer(queryset, many=True).data),
+        )
+
+    def test_cart(self):
+        for cart in (self.cart, self.empty_cart):
+            fast = fast_serializers.cart_serializer.serialize(Cart.objects.filter(pk=cart.pk))[0]
+            self.assertEqual(render(fast), render(CartSerializer(cart).data))
+
+    def test_order_items(self):
+        queryset = OrderItem.objects.filter(order__customer_email=self.user.email)
+        self.assertEqual(
+            render(fast_serializers.order_item_serializer.serialize(queryset)),
+            render(OrderItemSerializer(queryset, many=True).data),
+        )
+
+    def test_views_serve_fast_output(self):
+        response = self.client.get("/api/product_list")
+        self.assertEqual(response.content, render(ProductListSerializer(Product.objects.all(), many=True).data))
+
+        self.client.cookies["cart_code"] = str(self.cart.cart_code)
+        response = self.client.get("/api/cart")
+        self.assertEqual(response.content, render(CartSerializer(self.cart).data))
+
+        self.client.cookies["access_token"] = token_generator(self.user)["access"]
+        response = self.client.get("/api/orderitem")
+        queryset = OrderItem.objects.filter(order__customer_email=self.user.email)
+        self.assertEqual(response.content, render(OrderItemSerializer(queryset, many=True).data))
+
+
+class EndpointBenchmarkTests(TransactionTestCase):
+    """The load benchmark covers every route and runs clean, offline, on a tiny dataset"""
+
+    def setUp(self):
+        logging.getLogger("rest_framework_simplejwt").setLevel(logging.ERROR)
+        # buffered views must reach the table while their rows still exist
+        self.addCleanup(recently_viewed.flush)
+
+    def test_every_route_runs_offline(self):
+        rng = random.Random(0)
+        with benchmark.offline() as services:
+            data = benchmark.seed(products=30, users=4, orders=20, carts=3, rng=rng)
+            factories = benchmark.scenarios(data, rng)
+            self.assertEqual(benchmark.uncovered(factories), [])
+
+            report = benchmark.run([factory(0) for factory in factories.values()], concurrency=2)
+
+        failed = {name: row["statuses"] for name, row in report["routes"].items() if row["errors"]}
+        self.assertEqual(failed, {})
+        self.assertEqual(report["total"]["requests"], len(factories))
+        self.assertTrue(all(count for count in services.calls.values()), services.calls)
+        self.assertEqual(benchmark.compare(report, report), [])
+
+        slower = {**report, "routes": {
+            name: {**row, "queries_per_request": row["queries_per_request"] + 2}
+            for name, row in report["routes"].items()
+        }}
+        self.assertEqual(len(benchmark.compare(slower, report)), len(report["routes"]))
+        within_slack = {**report, "routes": {
+            name: {**row, "queries_per_request": row["queries_per_request"] + 0.5}
+            for name, row in report["routes"].items()
+        }}
+        self.assertEqual(benchmark.compare(within_slack, report), [])
+        self.assertEqual(len(benchmark.compare(within_slack, report, query_slack=0)), len(report["routes"]))
+
+
+class MetricsTests(TestCase):
+    """/metrics: per-view series, and samples summed across worker files"""
+
+    def scrape(self, **headers):
+        response = self.client.get("/metrics", headers=headers)
+        return response, dict(
+            line.rsplit(" ", 1) for line in response.content.decode().splitlines() if not line.startswith("#")
+        )
+
+    def test_requests_are_labelled_by_url_name(self):
+        Category.objects.create(name="Chairs")
+        self.client.get("/api/category_list")
+        response, values = self.scrape()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response["Content-Type"].startswith("text/plain; version=0.0.4"))
+        labels = 'method="GET",status="200",view="category_list"'
+        count = float(values[f"http_request_duration_seconds_count{{{labels}}}"])
+        self.assertGreaterEqual(count, 1)
+        self.assertEqual(float(values[f'http_request_duration_seconds_bucket{{le="+Inf",{labels}}}']), count)
+        self.assertGreaterEqual(float(values['http_request_queries_count{view="category_list"}']), 1)
+        self.assertFalse(any("/api/" in sample for sample in values))
+
+    @override_settings(METRICS_TOKEN="scrape-me")
+    def test_token(self):
+        self.assertEqual(self.scrape()[0].status_code, 403)
+        self.assertEqual(self.scrape(Authorization="Bearer scrape-me")[0].status_code, 200)
+
+    def test_worker_files_are_summed(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        hit = metrics._key("cache_lookups_total", {"cache": "facets", "result": "hit"})
+        first = metrics.FileStore(os.path.join(directory, "metrics_1.db"))
+        second = metrics.FileStore(os.path.join(directory, "metrics_2.db"))
+        first.inc(hit, 2)
+        second.inc(hit, 3)
+        # enough keys to grow the file past its first mapping
+        for i in range(20000):
+            second.inc(metrics._key("cache_lookups_total", {"cache": f"c{i}", "result": "miss"}), 1)
+        # a restarted worker picks its file up where it left off
+        metrics.FileStore(first.path).inc(hit, 1)
+
+        rendered = metrics.render(directory)
+        self.assertIn('cache_lookups_total{cache="facets",result="hit"} 6\n', rendered)
+        self.assertIn('cache_lookups_total{cache="c19999",result="miss"} 1\n', rendered)
+
+
+class BackgroundErrorLoggingTests(TestCase):
+    """Background threads log their failures, with the traceback, instead of dying silently"""
+
+    def assertLogsFailure(self, logger, target):
+        with self.assertLogs(logger, logging.ERROR) as logs:
+            thread = threading.Thread(target=target)
+            thread.start()
+            thread.join()
+        [record] = logs.records
+        self.assertIsInstance(record.exc_info[1], RuntimeError)
+
+    def test_flush_threads(self):
+        failure = RuntimeError("database went away")
+        with mock.patch.object(slow_queries, "flush", side_effect=failure):
+            self.assertLogsFailure("funiture.slow_queries", slow_queries.FlushThread().run)
+        with mock.patch.object(recently_viewed, "flush", side_effect=failure):
+            self.assertLogsFailure("funiture.recently_viewed", recently_viewed.FlushThread().run)
+        with mock.patch.object(similarity.refresh_queue, "run_pending", side_effect=failure):
+            self.assertLogsFailure("funiture.similarity", similarity.refresh_queue._run)
+
+    def test_memory_sampler(self):
+        # one failed round, then stop the loop
+        with mock.patch.object(memory, "tick", side_effect=RuntimeError("no /proc")), \
+                mock.patch.object(memory.time, "sleep", side_effect=SystemExit):
+            self.assertLogsFailure("core.memory", memory.Sampler().run)
+
+
+class QueryProfilingTests(TestCase):
+    """Sampled requests get a Server-Timing header and a log line; templates repeated THRESHOLD times are N+1s"""
+
+    THRESHOLD = 3
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.categories = Category.objects.bulk_create(Category(name=f"Shelf {i}", slug=f"shelf-{i}") for i in range(5))
+
+    def profiled(self, lookups, sample_rate=1.0):
+        """Run a view doing one category lookup per entry of `lookups` through the middleware"""
+        wrappers = []
+
+        def view(request):
+            wrappers.append(list(connection.execute_wrappers))
+            for pk in lookups:
+                Category.objects.get(pk=pk)
+            return HttpResponse()
+
+        with override_settings(QUERY_PROFILING_SAMPLE_RATE=sample_rate, QUERY_PROFILING_N_PLUS_ONE=self.THRESHOLD):
+            middleware = QueryProfilingMiddleware(view)
+        return middleware(RequestFactory().get("/api/shelves")), wrappers[0]
+
+    def logged(self, lookups):
+        with self.assertLogs("core.sql", logging.INFO) as logs:
+            response, _ = self.profiled(lookups)
+        self.assertEqual(len(logs.records), 1)
+        return response, logs.records[0].levelno, json.loads(logs.records[0].getMessage())
+
+    def test_server_timing_header(self):
+        with self.assertLogs("core.sql", logging.INFO):
+            response, wrappers = self.profiled([category.pk for category in self.categories[:2]])
+        self.assertEqual(len(wrappers), 1)
+        match = re.fullmatch(r'db;dur=(\d+\.\d);desc="(\d+) queries", app;dur=(\d+\.\d)', response["Server-Timing"])
+        self.assertIsNotNone(match, response["Server-Timing"])
+        self.assertEqual(match[2], "2")
+        self.assertGreater(float(match[1]) + float(match[3]), 0)
+
+    def test_header_is_added_to_an_existing_one(self):
+        def view(request):
+            response = HttpResponse()
+            response["Server-Timing"] = "cache;dur=1.0"
+            return response
+
+        with override_settings(QUERY_PROFILING_SAMPLE_RATE=1.0), self.assertLogs("core.sql", logging.INFO):
+            response = QueryProfilingMiddleware(view)(RequestFactory().get("/"))
+        self.assertRegex(response["Server-Timing"], r'^cache;dur=1\.0, db;dur=[\d.]+;desc="0 queries", app;dur=')
+
+    def test_log_line(self):
+        response, level, line = self.logged([self.categories[0].pk])
+        self.assertEqual(level, logging.INFO)
+        self.assertEqual(line["event"], "sql_profile")
+        self.assertEqual((line["method"], line["path"], line["status"]), ("GET", "/api/shelves", 200))
+        self.assertEqual(line["queries"], 1)
+        self.assertEqual((line["duplicates"], line["n_plus_one"]), (0, []))
+        self.assertGreaterEqual(line["total_ms"], line["db_ms"])
+
+    def test_n_plus_one_at_the_threshold(self):
+        # the same statement with different ids is one template
+        _, level, line = self.logged([category.pk for category in self.categories[:self.THRESHOLD]])
+        self.assertEqual(level, logging.WARNING)
+        self.assertEqual(line["duplicates"], self.THRESHOLD - 1)
+        [suspect] = line["n_plus_one"]
+        self.assertEqual(suspect["count"], self.THRESHOLD)
+        self.assertIn('"funiture_category"', suspect["sql"])
+
+    def test_repeats_below_the_threshold_are_not_flagged(self):
+        _, level, line = self.logged([category.pk for category in self.categories[:self.THRESHOLD - 1]])
+        self.assertEqual(level, logging.INFO)
+        self.assertEqual(line["duplicates"], self.THRESHOLD - 2)
+        self.assertEqual(line["n_plus_one"], [])
+
+    def test_unsampled_requests_are_left_alone(self):
+        for sample_rate, roll in ((0.0, 0.0), (0.5, 0.5), (0.5, 0.9)):
+            with mock.patch("core.middleware.random.random", return_value=roll), \
+                    mock.patch.object(logging.getLogger("core.sql"), "log") as log:
+                response, wrappers = self.profiled([self.categories[0].pk], sample_rate=sample_rate)
+            self.assertFalse(response.has_header("Server-Timing"))
+            self.assertEqual(wrappers, [])
+            log.assert_not_called()
+
+    @override_settings(QUERY_PROFILING_SAMPLE_RATE=1.0)
+    def test_installed_middleware(self):
+        with self.assertLogs("core.sql", logging.INFO):
+            response = self.client.get("/api/category_list")
+        self.assertRegex(response["Server-Timing"], r'db;dur=[\d.]+;desc="[1-9]\d* queries"')
+
+
+class TracingTests(TestCase):
+    """Spans nest under the request, carry into email threads, and only kept traces are written"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.enterContext(override_settings(TRACING_DIR=self.directory))
+
+    def spans(self):
+        return {
+            span["span_id"]: span
+            for path in glob.glob(os.path.join(self.directory, "traces_*.jsonl"))
+            for span in map(json.loads, open(path))
+        }
+
+    @override_settings(TRACING_SAMPLE_RATE=1.0)
+    def test_request_spans(self):
+        Category.objects.create(name="Chairs")
+        response = self.client.get("/api/category_list")
+
+        spans = self.spans()
+        root = next(span for span in spans.values() if span["parent_id"] is None)
+        self.assertEqual(response["X-Trace-Id"], root["trace_id"])
+        self.assertEqual(root["attributes"]["view"], "category_list")
+        self.assertEqual(root["attributes"]["status"], 200)
+        children = [span["name"] for span in spans.values() if span["parent_id"] == root["span_id"]]
+        self.assertIn("db.query", children)
+        self.assertIn("render", children)
+        self.assertTrue(all(span["trace_id"] == root["trace_id"] for span in spans.values()))
+
+    def test_email_thread_continues_the_trace(self):
+        root = tracing.start_trace("request")
+        with benchmark.offline(), tracing.activate(root):
+            thread = EmailThread("someone@example.com", "Hello", "<p>hi</p>")
+            thread.start()
+            thread.join()
+        tracing.end_trace(root)
+
+        by_name = {span["name"]: span for span in self.spans().values()}
+        self.assertEqual(by_name["email.send"]["parent_id"], root.id)
+        self.assertEqual(by_name["external.resend"]["parent_id"], by_name["email.send"]["span_id"])
+
+    @override_settings(TRACING_SAMPLE_RATE=0.0, TRACING_SLOW_MS=60_000)
+    def test_fast_unsampled_requests_are_dropped(self):
+        response = self.client.get("/api/category_list")
+        self.assertFalse(response.has_header("X-Trace-Id"))
+        self.assertEqual(self.spans(), {})
+
+        with override_settings(TRACING_SLOW_MS=0.001):
+            response = Client().get("/api/category_list")
+        self.assertIn(response["X-Trace-Id"], {span["trace_id"] for span in self.spans().values()})
+
+
+class ProfilingTests(TestCase):
+    """Staff can profile a request on demand, then list, download and merge the profiles"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.enterContext(override_settings(PROFILING_DIR=self.directory))
+        Category.objects.create(name="Chairs")
+        self.staff = User.objects.create_user(email="staff@example.com", password=None, is_active=True, is_staff=True)
+        self.customer = User.objects.create_user(email="customer@example.com", password=None, is_active=True)
+
+    def login(self, user):
+        self.client.cookies["access_token"] = token_generator(user)["access"]
+
+    def test_staff_header_profiles_the_request(self):
+        self.login(self.customer)
+        self.assertFalse(self.client.get("/api/category_list", headers={"X-Profile": "1"}).has_header("X-Profile-Id"))
+        self.assertEqual(profiling.list_profiles(), [])
+        self.assertEqual(self.client.get("/api/profiles").status_code, 403)
+
+        self.login(self.staff)
+        ids = [self.client.get("/api/category_list", headers={"X-Profile": "1"})["X-Profile-Id"] for _ in range(2)]
+
+        listed = self.client.get("/api/profiles", {"view": "category_list"}).json()["results"]
+        self.assertEqual([meta["id"] for meta in listed], ids[::-1])
+        self.assertEqual(listed[0]["trigger"], "header")
+
+        response = self.client.get(f"/api/profiles/{ids[0]}")
+        self.assertEqual(response.status_code, 200)
+        downloaded = os.path.join(self.directory, "downloaded.prof")
+        with open(downloaded, "wb") as f:
+            f.write(b"".join(response.streaming_content))
+        self.assertTrue(pstats.Stats(downloaded).total_calls)
+        self.assertEqual(self.client.get("/api/profiles/..%2Fsecrets").status_code, 404)
+
+        merged = self.client.get("/api/profiles/aggregate", {"view": "category_list", "sort": "own"}).json()
+        self.assertEqual(merged["profiles"], 2)
+        functions = self.client.get("/api/profiles/aggregate", {"view": "category_list", "limit": 200}).json()["functions"]
+        self.assertTrue(any(row["function"].endswith("(list)") and row["calls"] == 2 for row in functions))
+        merged_file = self.client.get("/api/profiles/aggregate", {"view": "category_list", "download": 1})
+        self.assertEqual(merged_file["Content-Type"], "application/octet-stream")
+        self.assertEqual(self.client.get("/api/profiles/aggregate", {"view": "cart"}).status_code, 404)
+
+    @override_settings(PROFILING_SAMPLE_RATE=1.0)
+    def test_sampled_requests(self):
+        response = self.client.get("/api/category_list")
+        self.assertFalse(response.has_header("X-Profile-Id"))
+        [meta] = profiling.list_profiles()
+        self.assertEqual((meta["view"], meta["trigger"], meta["status"]), ("category_list", "sample", 200))
+
+
+class MemoryTests(TestCase):
+    """Per-worker RSS samples, tracemalloc snapshot diffs and the recycling ceiling"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.enterContext(override_settings(MEMORY_DIR=self.directory))
+        staff = User.objects.create_user(email="staff@example.com", password=None, is_active=True, is_staff=True)
+        self.client.cookies["access_token"] = token_generator(staff)["access"]
+
+    def test_workers(self):
+        # a worker that died without cleaning up after itself
+        dead = os.path.join(self.directory, f"worker_{2 ** 22 + 1}.json")
+        with open(dead, "w") as f:
+            json.dump({"pid": 2 ** 22 + 1, "rss_bytes": 1, "threads": 1, "samples": []}, f)
+
+        [worker] = self.client.get("/api/memory").json()["workers"]
+        self.assertEqual(worker["pid"], os.getpid())
+        self.assertGreater(worker["rss_bytes"], 0)
+        self.assertFalse(os.path.exists(dead))
+        self.assertIn(f'worker_resident_memory_bytes{{pid="{os.getpid()}"}}', self.client.get("/metrics").content.decode())
+
+        self.client.cookies.clear()
+        self.assertEqual(self.client.get("/api/memory").status_code, 401)
+
+    def test_snapshot_diff(self):
+        was_tracing = tracemalloc.is_tracing()
+        self.addCleanup(lambda: was_tracing or tracemalloc.stop())
+        # the first snapshot starts tracing, the next two bracket the growth
+        self.client.post("/api/memory/snapshots")
+        before = self.client.post("/api/memory/snapshots").json()["label"]
+        self.leak = [bytearray(1024) for _ in range(2000)]
+        after = self.client.post("/api/memory/snapshots").json()["label"]
+
+        listed = self.client.get("/api/memory/snapshots").json()["results"]
+        self.assertEqual([snapshot["label"] for snapshot in listed][-2:], [before, after])
+        response = self.client.get("/api/memory/snapshots/diff", {"pid": os.getpid(), "before": before, "after": after})
+        top = response.json()["results"][0]
+        self.assertTrue(top["site"].startswith("funiture/tests.py:"), top)
+        self.assertGreater(top["size_diff"], 2000 * 1024)
+
+        missing = {"pid": os.getpid(), "before": before, "after": "20000101T000000000-000000"}
+        self.assertEqual(self.client.get("/api/memory/snapshots/diff", missing).status_code, 404)
+
+    def test_ceiling(self):
+        with override_settings(MEMORY_CEILING_MB=0):
+            self.assertFalse(memory.over_ceiling())
+        with override_settings(MEMORY_CEILING_MB=1):
+            self.assertTrue(memory.over_ceiling())
+        with override_settings(MEMORY_CEILING_MB=1024 * 1024):
+            self.assertFalse(memory.over_ceiling())
+
+
+@override_settings(SLOW_QUERY_MS=0.000001)
+class SlowQueryLogTests(TestCase):
+    """With a threshold every query clears, the search's query lands in the log with its plan"""
+
+    def setUp(self):
+        # flushed by the test itself, not a background thread
+        self.enterContext(mock.patch.object(slow_queries, "FLUSH_INTERVAL", 10 ** 9))
+        self.addCleanup(slow_queries.flush)
+        slow_queries.flush()
+        product = Product.objects.create(name="Oak chair", description="Solid oak", price=100, stock=3)
+        product.categories.add(Category.objects.create(name="Chairs"))
+
+    def search_query(self):
+        return SlowQuery.objects.get(fingerprint__contains='"funiture_product"."description" LIKE')
+
+    def test_search_is_logged_and_explained(self):
+        self.client.get("/api/search", {"query": "oak"})
+        self.assertGreater(slow_queries.flush(), 0)
+
+        logged = self.search_query()
+        self.assertEqual(logged.count, 1)
+        self.assertEqual(logged.views, {"search": 1})
+        [location] = logged.locations
+        self.assertTrue(location.startswith("funiture/views.py:"), location)
+        self.assertIn("funiture_product", logged.plan)
+        self.assertIn("%oak%", logged.sample_params)
+
+        explained_at = logged.explained_at
+        self.client.get("/api/search", {"query": "walnut"})
+        slow_queries.flush()
+        logged.refresh_from_db()
+        self.assertEqual(logged.count, 2)
+        # one plan per fingerprint
+        self.assertEqual(logged.explained_at, explained_at)
+
+    def test_report(self):
+        self.client.get("/api/search", {"query": "oak"})
+        slow_queries.flush()
+        staff = User.objects.create_user(email="staff@example.com", password=None, is_active=True, is_staff=True)
+        self.client.cookies["access_token"] = token_generator(staff)["access"]
+
+        results = self.client.get("/api/slow_queries", {"order": "count", "limit": 200}).json()["results"]
+        self.assertIn(self.search_query().fingerprint, [row["fingerprint"] for row in results])
+        self.assertEqual(self.client.get("/api/slow_queries", {"order": "rows"}).status_code, 400)
+
+
+class CatalogTests(TestCase):
+    """Facet filters OR within a facet and AND across facets; counts ignore their own facet"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.sofas, cls.beds = Category.objects.bulk_create([
+            Category(name="Sofas", slug="sofas"), Category(name="Beds", slug="beds"),
+        ])
+        specs = [
+            # categories, featured, fabric, stock, price
+            ([cls.sofas], True, "Linen", 3, "40000.00"),
+            ([cls.sofas], False, "Velvet", 0, "90000.00"),
+            ([cls.beds], True, "Linen", 1, "150000.00"),
+            ([cls.sofas, cls.beds], False, None, 2, "600000.00"),
+            ([], True, "Velvet", 5, "20000.00"),
+        ]
+        cls.products = []
+        for i, (categories, featured, fabric, stock, price) in enumerate(specs):
+            product = Product.objects.create(
+                name=f"Piece {i}", price=price, image=f"v1/pieces/{i}.jpg", featured=featured, fabric=fabric,
+                stock=stock,
+            )
+            product.categories.set(categories)
+            cls.products.append(product)
+
+    def setUp(self):
+        cache.clear()
+        catalog_index.invalidate()
+
+    def catalog(self, **params):
+        response = self.client.get("/api/catalog", params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def ids(self, *indexes):
+        return [self.products[i].pk for i in indexes]
+
+    def test_counts(self):
+        data = self.catalog()
+        self.assertEqual(data["count"], 5)
+        self.assertEqual(data["facets"]["category"], {str(self.sofas.pk): 3, str(self.beds.pk): 2})
+        self.assertEqual(data["facets"]["featured"], {"true": 3, "false": 2})
+        self.assertEqual(data["facets"]["fabric"], {"Linen": 2, "Velvet": 2})
+        self.assertEqual(data["facets"]["in_stock"], {"true": 4, "false": 1})
+        self.assertEqual(
+            data["facets"]["price"], {"0-50000": 2, "50000-100000": 1, "100000-200000": 1, "500000+": 1},
+        )
+
+    def test_or_within_and_across_facets(self):
+        data = self.catalog(category=f"{self.sofas.pk},{self.beds.pk}")
+        self.assertEqual([product["id"] for product in data["results"]], self.ids(0, 1, 2, 3))
+
+        data = self.catalog(category=self.sofas.pk, featured="true")
+        self.assertEqual([product["id"] for product in data["results"]], self.ids(0))
+        # each facet's counts apply every other facet's filter, not its own
+        self.assertEqual(data["facets"]["category"], {str(self.sofas.pk): 1, str(self.beds.pk): 1})
+        self.assertEqual(data["facets"]["featured"], {"true": 1, "false": 2})
+
+        data = self.catalog(fabric="Linen,Velvet", in_stock="true", price_max="100000")
+        self.assertEqual([product["id"] for product in data["results"]], self.ids(0, 4))
+
+    def test_pages(self):
+        first = self.catalog(page_size=2)
+        second = self.catalog(page_size=2, page=2)
+        last = self.catalog(page_size=2, page=3)
+        self.assertEqual((first["count"], first["page"], first["page_size"]), (5, 1, 2))
+        self.assertEqual(
+            [product["id"] for page in (first, second, last) for product in page["results"]], self.ids(0, 1, 2, 3, 4),
+        )
+        self.assertEqual(self.catalog(page=9)["results"], [])
+        self.assertEqual(self.client.get("/api/catalog", {"page": "two"}).status_code, 400)
+
+    def test_change_during_build_is_picked_up(self):
+        values_list = Product.objects.values_list
+
+        def changed_meanwhile(*fields):
+            rows = list(values_list(*fields))
+            # another process saves a product once build() has read the rows
+            Product.objects.filter(pk=self.products[1].pk).update(featured=True)
+            catalog_index.invalidate()
+            return rows
+
+        with mock.patch.object(Product.objects, "values_list", changed_meanwhile):
+            catalog_index.build()
+        self.assertEqual(self.catalog(featured="true")["count"], 4)
+
+    def test_invalidate_from_another_thread_during_a_search(self):
+        self.catalog()
+        cache_lookup = metrics.cache_lookup
+        invalidated = []
+
+        def lookup(name, hit):
+            # an on_commit invalidate() in another thread lands between the
+            # version check and the read of the bitmaps
+            if not invalidated:
+                invalidated.append(threading.Thread(target=catalog_index.invalidate))
+                invalidated[0].start()
+                invalidated[0].join(0.2)
+            cache_lookup(name, hit)
+
+        with mock.patch.object(metrics, "cache_lookup", lookup):
+            self.assertEqual(self.catalog(featured="true")["count"], 3)
+        invalidated[0].join()
+        self.assertIsNone(catalog_index.version)
+        self.assertEqual(self.catalog(featured="true")["count"], 3)
+        self.assertIsNotNone(catalog_index.version)
+
+
+class SimilarProductsTests(TestCase):
+    """Edits to what a vector is made of refresh the neighbours, in the background; other edits don't"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.tables, cls.sofas = Category.objects.bulk_create([
+            Category(name="Tables", slug="tables"), Category(name="Sofas", slug="sofas"),
+        ])
+        specs = [
+            ("Oak dining table", "Solid oak dining table for six", cls.tables),
+            ("Oak coffee table", "Low solid oak coffee table", cls.tables),
+            ("Velvet sofa", "Plush velvet three seat sofa", cls.sofas),
+            ("Velvet armchair", "Plush velvet armchair", cls.sofas),
+            ("Leather sofa", "Plush leather two seat sofa", cls.sofas),
+        ]
+        cls.products = []
+        for i, (name, description, category) in enumerate(specs):
+            product = Product.objects.create(name=name, description=description, price="100.00", image=f"v1/s/{i}.jpg")
+            product.categories.set([category])
+            cls.products.append(product)
+        similarity.rebuild()
+
+    def setUp(self):
+        # run queued refreshes here, in the test's transaction, not on the queue's thread
+        self.submit = self.enterContext(mock.patch.object(similarity.refresh_queue, "submit"))
+        self.addCleanup(similarity.refresh_queue.run_pending)
+
+    def similar(self, product):
+        return list(SimilarProduct.objects.filter(product=product).order_by("-score").values_list("similar_id", flat=True))
+
+    def test_edit_updates_neighbours(self):
+        oak_table, oak_coffee, velvet_sofa, _, leather_sofa = self.products
+        self.assertIn(leather_sofa.pk, self.similar(velvet_sofa))
+        self.assertNotIn(leather_sofa.pk, self.similar(oak_table))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            leather_sofa.name = "Oak side table"
+            leather_sofa.description = "Solid oak side table"
+            leather_sofa.save()
+            leather_sofa.categories.set([self.tables])
+        self.submit.assert_called()
+        similarity.refresh_queue.run_pending()
+
+        self.assertEqual(set(self.similar(oak_table)[:2]), {oak_coffee.pk, leather_sofa.pk})
+        self.assertNotIn(leather_sofa.pk, self.similar(velvet_sofa))
+        self.assertEqual(set(self.similar(leather_sofa)[:2]), {oak_table.pk, oak_coffee.pk})
+
+    def test_only_text_and_category_changes_refresh(self):
+        product = self.products[0]
+        with mock.patch.object(similarity.refresh_queue, "add") as add:
+            with self.captureOnCommitCallbacks(execute=True):
+                product.stock, product.price = 7, "120.00"
+                product.save()
+                Product.objects.get(pk=product.pk).save(update_fields=["stock"])
+                self.tables.slug = "dining"
+                self.tables.save()
+            add.assert_not_called()
+
+            with self.captureOnCommitCallbacks(execute=True):
+                product.fabric = "Oak veneer"
+                product.save()
+            add.assert_called_once_with([product.pk])
+
+            add.reset_mock()
+            with self.captureOnCommitCallbacks(execute=True):
+                self.tables.name = "Dining tables"
+                self.tables.save()
+            add.assert_called_once()
+            self.assertEqual(set(add.call_args.args[0]), {self.products[0].pk, self.products[1].pk})
+
+    def test_queued_changes_are_one_refresh(self):
+        similarity.refresh_queue.add([self.products[0].pk])
+        similarity.refresh_queue.add([self.products[1].pk])
+        with mock.patch.object(similarity, "refresh") as refresh:
+            similarity.refresh_queue.run_pending()
+            similarity.refresh_queue.run_pending()
+        refresh.assert_called_once_with({self.products[0].pk, self.products[1].pk})
+
+
+# a 1x1 GIF, enough for ImageField's validation
+GIF = (
+    b"GIF89a\x01\x00\x01\x00\x80\x00\x00\x00\x00\x00\xff\xff\xff!\xf9\x04\x01\x00\x00\x00\x00"
+    b",\x00\x00\x00\x00\x01\x00\x01\x00\x00\x02\x02D\x01\x00;"
+)
+
+
+class ImageUploadTests(TestCase):
+    """Admin saves queue their images; each pending file is uploaded once, failures can be retried"""
+
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, True)
+        self.enterContext(override_settings(MEDIA_ROOT=media, IMAGE_UPLOADER="fake"))
+        self.enterContext(mock.patch.object(similarity.refresh_queue, "submit"))
+        self.submit = self.enterContext(mock.patch.object(image_uploads.upload_queue, "submit"))
+        admin = User.objects.create_superuser(email="admin@example.com", password="x")
+        self.client.force_login(admin)
+
+    def add_product(self):
+        data = {
+            "name": "Rattan chair", "description": "Woven rattan", "price": "25000.00", "stock": 3,
+            "image": SimpleUploadedFile("rattan.gif", GIF, "image/gif"),
+            "gallery_uploads": [SimpleUploadedFile(f"side_{i}.gif", GIF, "image/gif") for i in range(2)],
+            "_save": "Save",
+        }
+        for prefix in ("gallery", "pending_uploads"):
+            data.update({f"{prefix}-TOTAL_FORMS": 0, f"{prefix}-INITIAL_FORMS": 0})
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post("/admin/funiture/product/add/", data)
+        self.assertEqual(response.status_code, 302)
+        return Product.objects.get(name="Rattan chair")
+
+    def test_admin_save_enqueues_and_process_uploads(self):
+        product = self.add_product()
+        uploads = list(PendingUpload.objects.filter(product=product).order_by("id"))
+        self.assertEqual([(upload.main, upload.status) for upload in uploads], [
+            (True, PendingUpload.PENDING), (False, PendingUpload.PENDING), (False, PendingUpload.PENDING),
+        ])
+        self.assertFalse(product.image)
+        ids = [upload.pk for upload in uploads]
+        self.submit.assert_called_once_with(ids)
+
+        self.assertEqual(image_uploads.process(ids), (3, 0))
+        product.refresh_from_db()
+        self.assertEqual(product.image.public_id, f"products/{os.path.splitext(os.path.basename(uploads[0].path))[0]}")
+        self.assertTrue(product.image_variants)
+        self.assertEqual(product.gallery.count(), 3)
+        self.assertFalse(PendingUpload.objects.exists())
+        self.assertFalse(any(default_storage.exists(upload.path) for upload in uploads))
+
+    def test_rows_are_uploaded_once(self):
+        product = self.add_product()
+        ids = list(PendingUpload.objects.values_list("id", flat=True))
+        upload = image_uploads.FakeUploader.upload
+        overlapping = []
+
+        def upload_while_another_run_starts(uploader, source):
+            # a retry or process_pending_uploads picking up the same ids meanwhile
+            overlapping.append(image_uploads.process(ids))
+            return upload(uploader, source)
+
+        with mock.patch.object(image_uploads.FakeUploader, "upload", upload_while_another_run_starts):
+            self.assertEqual(image_uploads.process(ids), (3, 0))
+        self.assertEqual(overlapping, [(0, 0)] * 3)
+        self.assertEqual(product.gallery.count(), 3)
+
+    def test_failed_uploads_can_be_retried(self):
+        product = self.add_product()
+        ids = list(PendingUpload.objects.order_by("id").values_list("id", flat=True))
+        gallery = set(PendingUpload.objects.filter(main=False).values_list("path", flat=True))
+        upload = image_uploads.FakeUploader.upload
+
+        def fail_gallery(uploader, source):
+            if source.name.endswith(tuple(gallery)):
+                raise ConnectionError("Cloudinary is down")
+            return upload(uploader, source)
+
+        with mock.patch.object(image_uploads.FakeUploader, "upload", fail_gallery):
+            self.assertEqual(image_uploads.process(ids), (1, 2))
+        failed = PendingUpload.objects.filter(status=PendingUpload.FAILED)
+        self.assertEqual(failed.count(), 2)
+        self.assertEqual(failed.first().error, "Cloudinary is down")
+        self.assertEqual(product.gallery.count(), 1)
+
+        self.submit.reset_mock()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(image_uploads.retry(PendingUpload.objects.all()), 2)
+        self.submit.assert_called_once_with(ids[1:])
+        self.assertEqual(image_uploads.process(ids[1:]), (2, 0))
+        self.assertEqual(product.gallery.count(), 3)
+        self.assertFalse(PendingUpload.objects.exists())
+    def test_only_the_changelist_counts_uploads(self):
+        product = self.add_product()
+        PendingUpload.objects.filter(main=False).update(status=PendingUpload.FAILED)
+        self.assertContains(self.client.get("/admin/funiture/product/"), "2 failed")
+
+        for path, params in (
+            (f"/admin/funiture/product/{product.pk}/change/", {}),
+            (f"/admin/funiture/product/{product.pk}/delete/", {}),
+            ("/admin/autocomplete/", {"app_label": "funiture", "model_name": "orderitem", "field_name": "product",
+                                      "term": "Rattan"}),
+        ):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(path, params)
+            self.assertEqual(response.status_code, 200, path)
+            product_queries = [query["sql"] for query in queries if 'FROM "funiture_product"' in query["sql"]]
+            self.assertTrue(product_queries, path)
+            self.assertFalse(any("GROUP BY" in sql for sql in product_queries), path)
+
+
+class AdminChangelistTests(QueryBudgetMixin, TestCase):
+    """Big-table changelists count by estimate past EstimatedCountPaginator.exact_below; list pages don't N+1"""
+
+    sizes = (5, 60)
+
+    def setUp(self):
+        self.enterContext(mock.patch.object(similarity.refresh_queue, "submit"))
+        self.client.force_login(User.objects.create_superuser(email="admin@example.com", password="x"))
+        self.orders = Order.objects.bulk_create(
+            Order(paystack_checkout_id=f"ref-{i}", amount="10.00", currency="NGN", customer_email="a@example.com",
+                  status="Paid")
+            for i in range(3)
+        )
+
+    def order_changelist(self, estimate):
+        """The order changelist as PostgreSQL would serve it, with the planner guessing `estimate` rows"""
+        with mock.patch.object(connection, "vendor", "postgresql"), \
+                mock.patch.object(EstimatedCountPaginator, "_estimate", return_value=estimate) as estimated, \
+                CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/admin/funiture/order/")
+        self.assertEqual(response.status_code, 200)
+        estimated.assert_called_once()
+        counts = [query["sql"] for query in queries if query["sql"].startswith("SELECT COUNT(*)")]
+        return response, counts
+
+    def test_estimate_above_the_threshold(self):
+        response, counts = self.order_changelist(EstimatedCountPaginator.exact_below + 500)
+        self.assertContains(response, f"{EstimatedCountPaginator.exact_below + 500} orders")
+        self.assertEqual(counts, [])
+
+    def test_exact_count_below_the_threshold(self):
+        response, counts = self.order_changelist(EstimatedCountPaginator.exact_below - 1)
+        self.assertContains(response, "3 orders")
+        self.assertEqual(len(counts), 1)
+
+    def test_other_databases_count_exactly(self):
+        with mock.patch.object(EstimatedCountPaginator, "_estimate") as estimated:
+            response = self.client.get("/admin/funiture/order/")
+        self.assertContains(response, "3 orders")
+        estimated.assert_not_called()
+
+    def test_product_changelist(self):
+        def prepare(n):
+            Product.objects.bulk_create(
+                Product(name=f"Stool {i}", slug=f"stool-{uuid.uuid4().hex[:8]}", price="10.00", image="v1/p/x.jpg")
+                for i in range(n)
+            )
+            PendingUpload.objects.bulk_create(
+                PendingUpload(product=product, path=f"pending/{product.pk}.jpg", status=PendingUpload.FAILED)
+                for product in Product.objects.all()[:3]
+            )
+            return lambda: self.client.get("/admin/funiture/product/")
+        # session, user, filtered and full counts, the page with its upload counts
+        self.assertQueryBudget(5, prepare, "product changelist")
+
+    def test_order_item_changelist(self):
+        def prepare(n):
+            product = Product.objects.bulk_create([
+                Product(name="Stool", slug=f"stool-{uuid.uuid4().hex[:8]}", price="10.00", image="v1/p/x.jpg"),
+            ])[0]
+            OrderItem.objects.bulk_create(OrderItem(order=self.orders[i % 3], product=product) for i in range(n))
+            return lambda: self.client.get("/admin/funiture/orderitem/")
+        # session, user, one count, the page joined to its orders and products
+        self.assertQueryBudget(4, prepare, "order item changelist")
+
+
+class SlugTests(TestCase):
+    """Repeated names get the next free -N; only slug collisions are retried"""
+
+    def make(self, name, **fields):
+        return Product.objects.create(name=name, price="10.00", image="v1/p/x.jpg", **fields)
+
+    def test_repeated_names_get_the_next_number(self):
+        self.make("Teak bench table")  # shares the prefix, isn't numbered
+        self.assertEqual(
+            [self.make("Teak bench").slug for _ in range(3)], ["teak-bench", "teak-bench-1", "teak-bench-2"],
+        )
+        self.make("Teak bench", slug="teak-bench-9")
+        self.assertEqual(self.make("Teak bench").slug, "teak-bench-10")
+        self.assertEqual(Category.objects.create(name="Teak bench").slug, "teak-bench")
+
+    def test_only_slug_conflicts_count(self):
+        self.make("Oak stool")
+        with self.assertRaises(IntegrityError) as slug_clash, transaction.atomic():
+            self.make("Oak stool", slug="oak-stool")
+        cart = Cart.objects.create()
+        with self.assertRaises(IntegrityError) as other_clash, transaction.atomic():
+            Cart.objects.create(cart_code=cart.cart_code)
+
+        self.assertTrue(slugs.is_slug_conflict(slug_clash.exception, Product))
+        self.assertFalse(slugs.is_slug_conflict(slug_clash.exception, Category))
+        self.assertFalse(slugs.is_slug_conflict(other_clash.exception, Product, Category))
+
+    def test_save_retries_a_slug_taken_meanwhile(self):
+        self.make("Pine shelf")
+        # the first allocation loses the race to a concurrent save
+        fresh = slugs.allocate_slugs(Product, ["Pine shelf"])
+        with mock.patch.object(slugs, "allocate_slugs", side_effect=[["pine-shelf"], fresh]) as allocated:
+            self.assertEqual(self.make("Pine shelf").slug, "pine-shelf-1")
+        self.assertEqual(allocated.call_count, 2)
+
+    def test_save_does_not_retry_other_errors(self):
+        product = Product(name="Ash desk", price="10.00", image="v1/p/x.jpg", stock=-1)
+        with mock.patch.object(slugs, "allocate_slugs", wraps=slugs.allocate_slugs) as allocated:
+            with self.assertRaises(IntegrityError) as error, transaction.atomic():
+                product.save()
+        self.assertFalse(slugs.is_slug_conflict(error.exception, Product))
+        self.assertEqual(allocated.call_count, 1)
+        self.assertEqual(product.slug, "ash-desk")
+
+
+class ProductImportTests(TestCase):
+    """import_products keeps good rows, reports bad ones by line and can run twice"""
+
+    ROWS = [
+        # name, price, stock, categories, image, gallery
+        ("Walnut desk", "120000", "4", "Desks|Office", "https://img.example.com/walnut.jpg", "desk_side.jpg"),
+        ("", "5000", "1", "Desks", "stool.jpg", ""),                   # no name
+        ("Cane chair", "cheap", "2", "Chairs", "cane.jpg", ""),        # bad price
+        ("Elm shelf", "30000", "-3", "Office", "elm.jpg", ""),         # the stock column is unsigned
+        ("Ash chair", "45000", "6", "Chairs|Office", "ash.jpg", "ash_back.jpg|ash.jpg"),
+    ]
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, True)
+        self.path = os.path.join(directory, "products.csv")
+        with open(self.path, "w", newline="") as f:
+            f.write("name,price,stock,categories,image,gallery\n")
+            f.writelines(",".join(row) + "\n" for row in self.ROWS)
+
+    def run_import(self):
+        stdout, stderr = io.StringIO(), io.StringIO()
+        call_command("import_products", self.path, "--fake-uploads", "--batch-size", "3", stdout=stdout, stderr=stderr)
+        return stdout.getvalue(), stderr.getvalue()
+
+    def test_good_and_bad_rows(self):
+        stdout, stderr = self.run_import()
+        self.assertIn("Imported 2 products", stdout)
+        self.assertIn("3 rows skipped", stdout)
+        errors = stderr.splitlines()
+        self.assertEqual([error.split(":")[0] for error in errors], ["line 2", "line 3", "line 4"])
+        self.assertIn("name is required", errors[0])
+        self.assertIn("invalid price", errors[1])
+        self.assertIn("rejected by the database", errors[2])
+
+        desk = Product.objects.get(name="Walnut desk")
+        self.assertEqual((desk.slug, desk.stock, str(desk.price)), ("walnut-desk", 4, "120000.00"))
+        self.assertEqual(desk.image.public_id, "products/walnut")
+        self.assertTrue(desk.image_variants)
+        self.assertEqual(sorted(desk.categories.values_list("name", flat=True)), ["Desks", "Office"])
+        self.assertEqual(
+            sorted(image.image.public_id for image in desk.gallery.all()), ["products/desk_side", "products/walnut"],
+        )
+        # the main image repeated in the gallery is stored once
+        self.assertEqual(Product.objects.get(name="Ash chair").gallery.count(), 2)
+        self.assertFalse(Category.objects.filter(name="Chairs").exclude(products__name="Ash chair").exists())
+
+    def test_running_twice(self):
+        self.run_import()
+        stdout, _ = self.run_import()
+        self.assertIn("Imported 2 products", stdout)
+        self.assertEqual(
+            sorted(Product.objects.values_list("slug", flat=True)),
+            ["ash-chair", "ash-chair-1", "walnut-desk", "walnut-desk-1"],
+        )
+        self.assertEqual(sorted(Category.objects.values_list("name", flat=True)), ["Chairs", "Desks", "Office"])
+
+
+class ImageVariantTests(TestCase):
+    """Variant URLs are built from settings, and only when the image itself changes"""
+
+    def setUp(self):
+        self.build = self.enterContext(mock.patch.object(image_variants, "build", wraps=image_variants.build))
+
+    def test_built_on_create_and_image_change_only(self):
+        product = Product.objects.create(name="Bamboo lamp", price="10.00", image="image/upload/v1/lamps/bamboo.jpg")
+        self.assertIn("lamps/bamboo", product.image_variants["card"])
+        self.assertEqual(self.build.call_count, 1)
+
+        product.stock = 4
+        product.save()
+        product = Product.objects.get(pk=product.pk)
+        product.price = "12.00"
+        product.save()
+        Product.objects.only("stock").get(pk=product.pk).save(update_fields=["stock"])
+        self.assertEqual(self.build.call_count, 1)
+
+        product.image = "image/upload/v2/lamps/bamboo_night.jpg"
+        product.save()
+        self.assertEqual(self.build.call_count, 2)
+        product.refresh_from_db()
+        self.assertIn("lamps/bamboo_night", product.image_variants["card"])
+
+    @override_settings(IMAGE_VARIANTS={"tiny": {"width": 40, "crop": "fill"}}, IMAGE_SRCSET_WIDTHS=[100],
+                       IMAGE_SRCSET_FORMATS=["webp"])
+    def test_variants_come_from_settings(self):
+        variants = image_variants.build("image/upload/v1/lamps/bamboo.jpg")
+        self.assertEqual(set(variants), {"tiny", "srcset"})
+        self.assertIn("w_40", variants["tiny"])
+        self.assertEqual(list(variants["srcset"]), ["webp"])
+        self.assertTrue(variants["srcset"]["webp"].endswith(" 100w"))
+
+
+class CompactPayloadTests(TestCase):
+    """?compact=1 serializes each related object once, in a side table keyed by id"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email="compact@example.com", password=None, is_active=True)
+        cls.sofas, cls.beds = Category.objects.bulk_create([
+            Category(name="Sofas", slug="sofas"), Category(name="Beds", slug="beds"),
+        ])
+        cls.sofa, cls.bed = Product.objects.bulk_create([
+            Product(name="Sofa", slug="sofa", price="100.00", image="v1/sofa.jpg"),
+            Product(name="Bed", slug="bed", price="250.00", image="v1/bed.jpg"),
+        ])
+        cls.sofa.categories.set([cls.sofas, cls.beds])
+        cls.bed.categories.set([cls.beds])
+        cls.orders = Order.objects.bulk_create(
+            Order(paystack_checkout_id=f"ref-{i}", amount="350.00", currency="NGN", customer_email=cls.user.email,
+                  status="Paid")
+            for i in range(2)
+        )
+        OrderItem.objects.bulk_create([
+            OrderItem(order=cls.orders[0], product=cls.sofa, quantity=1),
+            OrderItem(order=cls.orders[0], product=cls.bed, quantity=1),
+            OrderItem(order=cls.orders[1], product=cls.sofa, quantity=3),
+        ])
+        WishList.objects.bulk_create([
+            WishList(user=cls.user, product=cls.sofa), WishList(user=cls.user, product=cls.bed),
+        ])
+
+    def setUp(self):
+        self.client.cookies["access_token"] = token_generator(self.user)["access"]
+
+    def get(self, path, **params):
+        response = self.client.get(path, params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_rows_reference_side_tables(self):
+        full = self.get("/api/orderitem")
+        compact = self.get("/api/orderitem", compact="1")
+
+        self.assertEqual(set(compact), {"results", "orders", "products", "categories"})
+        self.assertEqual(
+            [(row["order"], row["product"], row["quantity"]) for row in compact["results"]],
+            [(row["order"]["id"], row["product"]["id"], row["quantity"]) for row in full],
+        )
+        # the sofa is in both orders but serialized once
+        self.assertEqual(set(compact["products"]), {str(self.sofa.pk), str(self.bed.pk)})
+        self.assertEqual(set(compact["orders"]), {str(order.pk) for order in self.orders})
+        self.assertEqual(set(compact["categories"]), {str(self.sofas.pk), str(self.beds.pk)})
+
+        # same values as the nested shape, with nested objects replaced by ids
+        for row in full:
+            self.assertEqual(compact["orders"][str(row["order"]["id"])], row["order"])
+            product = row["product"]
+            self.assertEqual(
+                compact["products"][str(product["id"])],
+                dict(product, categories=[category["id"] for category in product["categories"]]),
+            )
+            for category in product["categories"]:
+                self.assertEqual(compact["categories"][str(category["id"])], category)
+
+    def test_side_tables_are_shared_across_fields(self):
+        compact = self.get("/api/getwishlist", compact="true")
+        self.assertEqual(set(compact), {"results", "users", "products", "categories"})
+        self.assertEqual([row["user"] for row in compact["results"]], [self.user.pk, self.user.pk])
+        self.assertEqual(list(compact["users"]), [str(self.user.pk)])
+        self.assertEqual(compact["users"][str(self.user.pk)]["email"], self.user.email)
+
+    def test_nested_shape_is_the_default(self):
+        for value in (None, "0", "no"):
+            params = {} if value is None else {"compact": value}
+            data = self.get("/api/getwishlist", **params)
+            self.assertIsInstance(data, list)
+            self.assertEqual(data[0]["user"]["email"], self.user.email)
+
+
+class SparseFieldsTests(TestCase):
+    """?fields= narrows the payload and the SELECT; names the serializer doesn't have are ignored"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.chairs = Category.objects.bulk_create([Category(name="Chairs", slug="chairs")])[0]
+        cls.products = Product.objects.bulk_create(
+            Product(name=f"Chair {i}", slug=f"chair-{i}", description="Oak", price="75.00", image=f"v1/chairs/{i}.jpg")
+            for i in range(3)
+        )
+        for product in cls.products:
+            product.categories.add(cls.chairs)
+
+    def get(self, path, **params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(path, params)
+        self.assertEqual(response.status_code, 200)
+        return response.json(), [query["sql"] for query in queries.captured_queries]
+
+    def test_only_requested_fields(self):
+        data, queries = self.get("/api/product_list", fields="id,name")
+        self.assertEqual(data, [{"id": p.pk, "name": p.name} for p in self.products])
+        self.assertEqual(len(queries), 1)  # categories aren't asked for, so not prefetched
+        self.assertNotIn('"description"', queries[0])
+        self.assertNotIn('"price"', queries[0])
+
+    def test_nested_fields_are_prefetched_when_asked_for(self):
+        data, queries = self.get("/api/product_list", fields="slug,categories")
+        self.assertEqual(
+            data, [{"slug": p.slug, "categories": [{"id": self.chairs.pk, "name": "Chairs"}]} for p in self.products],
+        )
+        self.assertEqual(len(queries), 2)
+
+    def test_unknown_names_are_ignored(self):
+        data, _ = self.get("/api/product_list", fields="id,password,name,id")
+        self.assertEqual(data, [{"id": p.pk, "name": p.name} for p in self.products])
+
+    def test_only_unknown_names_give_the_full_shape(self):
+        full, _ = self.get("/api/product_list")
+        data, _ = self.get("/api/product_list", fields="password,nonsense")
+        self.assertEqual(data, full)
+        self.assertEqual(set(data[0]), set(ProductListSerializer.Meta.fields))
+
+    def test_detail_and_search(self):
+        product = self.products[0]
+        data, _ = self.get(f"/api/products/{product.slug}", fields="name,price,bogus")
+        self.assertEqual(data, {"name": product.name, "price": "75.00"})
+
+        data, _ = self.get("/api/search", query="Chair 1", fields="slug")
+        self.assertEqual(data, [{"slug": "chair-1"}])
+
+
+class PopularityTests(TestCase):
+    """Demand decays by half every HALF_LIFE_DAYS, so recent demand outranks equal older demand"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.products = Product.objects.bulk_create(
+            Product(name=f"Rug {i}", slug=f"rug-{i}", price="30.00", image=f"v1/rugs/{i}.jpg") for i in range(4)
+        )
+
+    def setUp(self):
+        self.now = timezone.now()
+
+    def ago(self, half_lives):
+        return self.now - timedelta(days=popularity.HALF_LIFE_DAYS * half_lives)
+
+    def scores(self):
+        return {
+            row.product_id: popularity.current_score(row.score, self.now)
+            for row in ProductPopularity.objects.all()
+        }
+
+    def test_scores_halve_every_half_life(self):
+        old, recent = self.products[:2]
+        popularity.record("order", {old.pk: 4}, at=self.ago(2))
+        popularity.record("order", {recent.pk: 4}, at=self.now)
+        scores = self.scores()
+        self.assertAlmostEqual(scores[recent.pk], 4 * popularity.WEIGHTS["order"])
+        self.assertAlmostEqual(scores[old.pk], 4 * popularity.WEIGHTS["order"] / 4)
+
+    def test_decay_ordering(self):
+        old, recent, small, untouched = self.products
+        popularity.record("order", {old.pk: 10}, at=self.ago(2))  # worth 2.5 orders today
+        popularity.record("order", {recent.pk: 10}, at=self.ago(0.1))
+        popularity.record("order", {small.pk: 2}, at=self.now)
+        # the second record() adds to what is there
+        popularity.record("view", {small.pk: 1, old.pk: 1}, at=self.now)
+
+        self.assertEqual(list(popularity.top_products()), [recent, old, small])
+        self.assertEqual(list(popularity.top_products(limit=2)), [recent, old])
+
+        response = self.client.get("/api/popular", {"limit": 2})
+        self.assertEqual([item["id"] for item in response.json()], [recent.pk, old.pk])
+
+    def test_weights_by_kind(self):
+        wished, viewed = self.products[:2]
+        popularity.record("wishlist", {wished.pk: 1}, at=self.now)
+        popularity.record("view", {viewed.pk: 2}, at=self.now)
+        self.assertEqual(list(popularity.top_products()), [wished, viewed])
+
+    def test_popular_flags_follow_the_ranking(self):
+        Product.objects.filter(pk=self.products[3].pk).update(is_popular=True)
+        popularity.record("order", {self.products[0].pk: 1, self.products[1].pk: 3}, at=self.now)
+        with self.captureOnCommitCallbacks(execute=True):
+            top = popularity.refresh_popular_flags(1)
+        self.assertEqual(top, [self.products[1].pk])
+        self.assertEqual(list(Product.objects.filter(is_popular=True)), [self.products[1]])
+
+
+class RecommendationTests(TestCase):
+    """Co-occurrence counts and top-k neighbours match a brute-force count of the paid orders"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.products = Product.objects.bulk_create(
+            Product(name=f"Vase {i}", slug=f"vase-{i}", price="15.00", image=f"v1/vases/{i}.jpg") for i in range(30)
+        )
+        rng = random.Random(35)
+        cls.baskets = [rng.sample(cls.products, rng.randint(1, 5)) for _ in range(120)]
+        # the same product twice in one order counts once
+        cls.baskets[0].append(cls.baskets[0][0])
+        cls.paid = cls.create_orders(cls.baskets, "Paid")
+        cls.create_orders([cls.products[:3]] * 5, "Pending")
+
+    @classmethod
+    def create_orders(cls, baskets, status):
+        start = Order.objects.count()
+        orders = Order.objects.bulk_create(
+            Order(paystack_checkout_id=f"ref-{start + i}", amount="15.00", currency="NGN",
+                  customer_email="buyer@example.com", status=status)
+            for i in range(len(baskets))
+        )
+        OrderItem.objects.bulk_create(
+            OrderItem(order=order, product=product) for order, basket in zip(orders, baskets) for product in basket
+        )
+        return orders
+
+    def expected_counts(self):
+        counts = {}
+        for basket in self.baskets:
+            ids = {product.pk for product in basket}
+            for a in ids:
+                for b in ids:
+                    counts[a, b] = counts.get((a, b), 0) + 1
+        return counts
+
+    def expected_top_k(self, counts):
+        best = {}
+        for (a, b), count in counts.items():
+            if a != b:
+                score = count / math.sqrt(counts[a, a] * counts[b, b])
+                best.setdefault(a, []).append((-score, -count, b))
+        return {a: [b for _, _, b in sorted(pairs)[:recommendations.TOP_K]] for a, pairs in best.items()}
+
+    def stored_counts(self):
+        return {(a, b): count for a, b, count in ProductCooccurrence.objects.values_list("product_id", "other_id", "count")}
+
+    def stored_top_k(self, product_ids=None):
+        rows = RelatedProduct.objects.order_by("product_id", "-score", "id")
+        if product_ids is not None:
+            rows = rows.filter(product_id__in=product_ids)
+        stored = {}
+        for a, b in rows.values_list("product_id", "related_id"):
+            stored.setdefault(a, []).append(b)
+        return stored
+
+    def test_rebuild_counts_and_top_k(self):
+        recommendations.rebuild()
+        counts = self.expected_counts()
+        self.assertEqual(self.stored_counts(), counts)
+        self.assertEqual(self.stored_top_k(), self.expected_top_k(counts))
+        # the busiest products have more neighbours than are kept
+        self.assertEqual(max(map(len, self.stored_top_k().values())), recommendations.TOP_K)
+
+    def test_chunked_expansion_gives_the_same_counts(self):
+        with mock.patch.object(recommendations, "PAIRS_PER_CHUNK", 7):
+            recommendations.rebuild(batch_size=50)
+        self.assertEqual(self.stored_counts(), self.expected_counts())
+
+    def test_incremental_orders_match_a_rebuild(self):
+        for basket in self.baskets:
+            recommendations.record_order([product.pk for product in basket])
+        counts = self.expected_counts()
+        self.assertEqual(self.stored_counts(), counts)
+        # products of the last order were re-ranked from the final counts
+        last = {product.pk for product in self.baskets[-1]}
+        expected = {a: ids for a, ids in self.expected_top_k(counts).items() if a in last}
+        self.assertEqual(self.stored_top_k(last), expected)
+
+    def test_also_bought_endpoint(self):
+        recommendations.rebuild()
+        product = self.products[0]
+        response = self.client.get(f"/api/products/{product.slug}/also_bought")
+        self.assertEqual([item["id"] for item in response.json()], self.expected_top_k(self.expected_counts())[product.pk])
+
+
+class SalesRollupTests(TestCase):
+    """Rollups kept live by the webhook hold the same totals backfill_sales computes from the orders"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.sofas, cls.outdoor = Category.objects.bulk_create([
+            Category(name="Sofas", slug="sofas"), Category(name="Outdoor", slug="outdoor"),
+        ])
+        cls.products = Product.objects.bulk_create(
+            Product(name=f"Bench {i}", slug=f"bench-{i}", price=f"{100 + 25 * i}.50", image=f"v1/benches/{i}.jpg")
+            for i in range(5)
+        )
+        cls.products[0].categories.set([cls.sofas, cls.outdoor])
+        cls.products[1].categories.set([cls.sofas])
+        cls.products[2].categories.set([cls.outdoor])
+        cls.staff = User.objects.create_user(email="analyst@example.com", password=None, is_active=True, is_staff=True)
+
+    def pay(self, lines, at, reference=None):
+        cart = Cart.objects.create()
+        CartItem.objects.bulk_create(
+            CartItem(cart=cart, product=self.products[i], quantity=quantity) for i, quantity in lines
+        )
+        body = json.dumps({"event": "charge.success", "data": {
+            "id": reference or uuid.uuid4().hex, "amount": 100, "currency": "NGN",
+            "customer": {"email": "buyer@example.com"}, "metadata": {"cart_code": str(cart.cart_code)},
+        }})
+        signature = hmac.new(settings.PAYSTACK_SECRET_KEY.encode(), body.encode(), hashlib.sha512).hexdigest()
+        with mock.patch("django.utils.timezone.now", return_value=at):
+            response = self.client.post(
+                "/api/webhook/paystack/", body, content_type="application/json", HTTP_X_PAYSTACK_SIGNATURE=signature,
+            )
+        self.assertEqual(response.status_code, 200)
+
+    def rollups(self):
+        return [
+            sorted(model.objects.values_list(*key, "orders", "units", "revenue"))
+            for model, key in (
+                (DailySales, ("date",)),
+                (DailyProductSales, ("date", "product_id")),
+                (DailyCategorySales, ("date", "category_id")),
+            )
+        ]
+
+    def test_backfill_matches_live_rollups(self):
+        now = timezone.now()
+        self.pay([(0, 1), (1, 2)], now - timedelta(days=2))
+        self.pay([(0, 3), (2, 1), (3, 1)], now - timedelta(days=2))
+        self.pay([(1, 1), (2, 2), (4, 5)], now - timedelta(days=1))
+        self.pay([(0, 2)], now, reference="repeat")
+        self.pay([(0, 2)], now, reference="repeat")  # a redelivered webhook isn't counted twice
+        # unpaid orders are in neither
+        pending = Order.objects.create(
+            paystack_checkout_id="pending", amount="1.00", currency="NGN", customer_email="buyer@example.com",
+            status="Pending",
+        )
+        OrderItem.objects.create(order=pending, product=self.products[0], quantity=9)
+
+        live = self.rollups()
+        self.assertEqual(len(live[0]), 3)
+        day_totals = {day: (orders, units, revenue) for day, orders, units, revenue in live[0]}
+        self.assertEqual(day_totals[timezone.localdate(now)], (1, 2, Decimal("201.00")))
+
+        call_command("backfill_sales", batch_size=2, stdout=io.StringIO())
+        self.assertEqual(self.rollups(), live)
+
+    def test_sold_products_and_categories_are_kept(self):
+        self.enterContext(mock.patch.object(similarity.refresh_queue, "submit"))
+        self.pay([(0, 1)], timezone.now())
+        rollups = self.rollups()
+        for obj in (self.products[0], self.sofas, self.outdoor):
+            with self.assertRaises(ProtectedError), transaction.atomic():
+                obj.delete()
+        self.assertEqual(self.rollups(), rollups)
+        self.products[4].delete()  # never sold
+
+    def test_analytics_read_the_rollups(self):
+        now = timezone.now()
+        self.pay([(0, 1), (1, 2)], now - timedelta(days=1))
+        self.pay([(0, 1)], now)
+        self.client.cookies["access_token"] = token_generator(self.staff)["access"]
+
+        sales = self.client.get("/api/analytics/sales").json()
+        self.assertEqual(sales["totals"]["orders"], 2)
+        self.assertEqual(sales["totals"]["units"], 4)
+        self.assertEqual(Decimal(sales["totals"]["revenue"]), Decimal("100.50") * 2 + Decimal("125.50") * 2)
+
+        categories = {row["id"]: row for row in self.client.get("/api/analytics/categories").json()["results"]}
+        # the first bench is in both categories and counts towards each
+        self.assertEqual(categories[self.sofas.pk]["units"], 4)
+        self.assertEqual(categories[self.outdoor.pk]["units"], 2)
+
+
+class RecentlyViewedTests(TestCase):
+    """Buffered views reach the table newest first, capped, and one flush at a time"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email="viewer@example.com", password=None, is_active=True)
+        cls.products = Product.objects.bulk_create(
+            Product(name=f"Lamp {i}", slug=f"lamp-{i}", price="100.00", image=f"v1/lamps/{i}.jpg")
+            for i in range(15)
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(recently_viewed.flush)
+        self.now = timezone.now()
+
+    def view(self, products, minutes_ago):
+        for i, product in enumerate(products):
+            recently_viewed.record_view(self.user.pk, product.pk, self.now - timedelta(minutes=minutes_ago - i))
+
+    def stored(self):
+        return list(RecentlyViewed.objects.filter(user=self.user).order_by("-viewed_at").values_list("product_id", flat=True))
+
+    def test_flush_writes_the_newest_views(self):
+        self.view(self.products[:12], 30)
+        self.view(self.products[2:3], 0)  # seen again
+        newest = [self.products[2].pk] + [product.pk for product in reversed(self.products[3:12])]
+        self.assertEqual(recently_viewed.get_recent_ids(self.user.pk), newest)
+        self.assertEqual(self.stored(), [])
+
+        recently_viewed.flush()
+        self.assertEqual(self.stored(), newest)
+        cache.clear()
+        self.assertEqual(recently_viewed.get_recent_ids(self.user.pk), newest)
+
+    def test_flush_keeps_newer_rows_written_elsewhere(self):
+        self.view(self.products[:10], 60)
+        # another worker flushed newer views while this batch was pending
+        RecentlyViewed.objects.bulk_create(
+            RecentlyViewed(user=self.user, product=product, viewed_at=self.now - timedelta(minutes=i))
+            for i, product in enumerate(self.products[10:13])
+        )
+        recently_viewed.flush()
+        self.assertEqual(self.stored(), [product.pk for product in self.products[10:13]] + [
+            product.pk for product in reversed(self.products[3:10])
+        ])
+
+    def test_views_of_deleted_products_are_dropped(self):
+        self.enterContext(mock.patch.object(similarity.refresh_queue, "submit"))
+        self.view(self.products[:3], 10)
+        gone = self.products[1]
+        Product.objects.filter(pk=gone.pk).delete()
+
+        self.assertEqual(recently_viewed.flush(), 2)
+        self.assertEqual(self.stored(), [self.products[2].pk, self.products[0].pk])
+        self.assertEqual(
+            set(ProductPopularity.objects.values_list("product_id", flat=True)),
+            {self.products[0].pk, self.products[2].pk},
+        )
+
+    def test_rejected_batch_is_not_retried(self):
+        self.view(self.products[:2], 10)
+        with mock.patch.object(RecentlyViewed.objects, "bulk_create", side_effect=IntegrityError("FOREIGN KEY")):
+            with self.assertRaises(IntegrityError):
+                recently_viewed.flush()
+        self.assertEqual(recently_viewed.flush(), 0)
+        self.assertEqual(self.stored(), [])
+
+    def test_one_flush_at_a_time(self):
+        self.enterContext(mock.patch.object(recently_viewed, "FLUSH_INTERVAL", 0))
+        start = self.enterContext(mock.patch.object(recently_viewed.FlushThread, "start"))
+        with recently_viewed._flushing:
+            self.view(self.products[:1], 0)
+        start.assert_not_called()
+        self.view(self.products[1:2], 0)
+        start.assert_called_once()
+
+    def test_table_reads_expire_after_a_flush_interval(self):
+        RecentlyViewed.objects.create(user=self.user, product=self.products[0], viewed_at=self.now)
+        with mock.patch.object(recently_viewed.cache, "set") as cache_set:
+            self.assertEqual(recently_viewed.get_recent_ids(self.user.pk), [self.products[0].pk])
+        cache_set.assert_called_once_with(
+            f"recently_viewed:{self.user.pk}", [(self.products[0].pk, self.now)], recently_viewed.FLUSH_INTERVAL,
+        )
+
+    def test_flusher_starts_once_per_process(self):
+        self.enterContext(mock.patch.object(recently_viewed, "_flusher_pid", None))
+        with mock.patch.object(recently_viewed.Flusher, "start") as start:
+            recently_viewed.start_flusher()
+            recently_viewed.start_flusher()
+        start.assert_called_once()
+
+
+# Most queries each endpoint may run, whatever the size of the data behind it
+QUERY_BUDGETS = {
+    "POST /api/getemail": 2,
+    "GET /api/cart": 4,
+    "GET /api/recent": 4,
+    "POST /api/recent": 3,
+    "GET /api/profile": 1,
+    "GET /api/bootstrap": 7,
+    "GET /api/getwishlist": 3,
+    "GET /api/wishlistdetail": 3,
+    "GET /api/wishlist_membership": 2,
+    "GET /api/product_list": 2,
+    "POST /api/get_product_list": 2,
+    "GET /api/products/<slug>": 3,
+    "GET /api/products/<slug>/also_bought": 2,
+    "GET /api/products/<slug>/similar": 2,
+    "GET /api/catalog": 4,
+    "GET /api/popular": 2,
+    "GET /api/category_list": 1,
+    "POST /api/add_to_cart": 10,
+    "PUT /api/update_cartitem": 6,
+    "DELETE /api/update_cartitem": 3,
+    "POST /api/add_to_wishlist": 10,
+    "GET /api/address": 2,
+    "POST /api/address": 2,
+    "PUT /api/address": 4,
+    "DELETE /api/address": 3,
+    "GET /api/search": 2,
+    "POST /api/create_paystack_checkout_session": 4,
+    # co-occurrence pairs grow with the square of the basket and go out in
+    # batches, so this one is checked at 5 and 50 lines (27 and 35 queries)
+    "POST /api/webhook/paystack/": 35,
+    "GET /api/orderitem": 3,
+    "GET /api/analytics/sales": 3,
+    "GET /api/analytics/products": 2,
+    "GET /api/analytics/categories": 2,
+}
+
+
+class ViewQueryBudgetTests(QueryBudgetMixin, TestCase):
+    """Every funiture view against 5 and 500 related rows: no N+1, nothing over budget"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.categories = Category.objects.bulk_create(
+            Category(name=f"Room {i}", slug=f"room-{i}") for i in range(3)
+        )
+        cls.admin = User.objects.create_user(
+            email="admin@example.com", password=None, is_active=True, is_staff=True,
+        )
+
+    def setUp(self):
+        cache.clear()
+        catalog_index.invalidate()
+        self.addCleanup(recently_viewed.flush)
+
+    def assertBudget(self, endpoint, prepare, constant=True, sizes=None):
+        return self.assertQueryBudget(QUERY_BUDGETS[endpoint], prepare, endpoint, constant, sizes)
+
+    # fixtures
+
+    def make_products(self, n, name="Oak chair"):
+        tag = uuid.uuid4().hex[:8]
+        products = Product.objects.bulk_create(
+            Product(
+                name=f"{name} {i}", slug=f"{tag}-{i}", description="Solid oak", price="1500.00",
+                image=f"v1/products/{tag}_{i}.jpg", stock=i % 5,
+            )
+            for i in range(n)
+        )
+        Product.categories.through.objects.bulk_create(
+            Product.categories.through(product_id=product.pk, category_id=category.pk)
+            for product in products for category in self.categories[:2]
+        )
+        return products
+
+    def make_user(self):
+        return User.objects.create_user(email=f"{uuid.uuid4().hex[:12]}@example.com", password=None, is_active=True)
+
+    def login(self, user):
+        self.client.cookies["access_token"] = token_generator(user)["access"]
+        return user
+
+    def make_cart(self, n):
+        cart = Cart.objects.create()
+        CartItem.objects.bulk_create(CartItem(cart=cart, product=product, quantity=2) for product in self.make_products(n))
+        self.client.cookies["cart_code"] = str(cart.cart_code)
+        return cart
+
+    def wishlist(self, user, n):
+        products = self.make_products(n)
+        WishList.objects.bulk_create(WishList(user=user, product=product) for product in products)
+        return products
+
+    def addresses(self, user, n):
+        return Address.objects.bulk_create(
+            Address(user=user, first_name="Ada", last_name="Lovelace", phone_number="0800",
+                    delivery_address=f"{i} Marina", region="Lagos", city="Lagos")
+            for i in range(n)
+        )
+
+    def recently_viewed(self, user, n):
+        now = timezone.now()
+        RecentlyViewed.objects.bulk_create(
+            RecentlyViewed(user=user, product=product, viewed_at=now - timedelta(minutes=i))
+            for i, product in enumerate(self.make_products(n))
+        )
+
+    # funiture/urls.py
+
+    def test_getemail(self):
+        self.assertBudget("POST /api/getemail", lambda n: lambda: self.client.post(
+            "/api/getemail", {"email": f"{uuid.uuid4().hex[:10]}@example.com"}, content_type="application/json",
+        ))
+
+    def test_cart(self):
+        def prepare(n):
+            self.make_cart(n)
+            return lambda: self.client.get("/api/cart")
+        self.assertBudget("GET /api/cart", prepare)
+
+    def test_recent(self):
+        def prepare(n):
+            user = self.login(self.make_user())
+            self.recently_viewed(user, n)
+            return lambda: self.client.get("/api/recent")
+        self.assertBudget("GET /api/recent", prepare)
+
+    def test_record_recent(self):
+        def prepare(n):
+            user = self.login(self.make_user())
+            self.recently_viewed(user, n)
+            product = self.make_products(1)[0]
+            return lambda: self.client.post("/api/recent", {"product_id": product.pk}, content_type="application/json")
+        self.assertBudget("POST /api/recent", prepare)
+
+    def test_profile(self):
+        def prepare(n):
+            user = self.login(self.make_user())
+            self.addresses(user, n)
+            return lambda: self.client.get("/api/profile")
+        self.assertBudget("GET /api/profile", prepare)
+
+    def test_bootstrap(self):
+        def prepare(n):
+            user = self.login(self.make_user())
+            self.wishlist(user, n)
+            self.recently_viewed(user, n)
+            self.addresses(user, n)
+            self.make_cart(n)
+            return lambda: self.client.get("/api/bootstrap")
+        self.assertBudget("GET /api/bootstrap", prepare)
+
+    def test_wishlist(self):
+        def prepare(n):
+            self.wishlist(self.login(self.make_user()), n)
+            return lambda: self.client.get("/api/getwishlist")
+        self.assertBudget("GET /api/getwishlist", prepare)
+
+    def test_wishlist_detail(self):
+        def prepare(n):
+            products = self.wishlist(self.login(self.make_user()), n)
+            return lambda: self.client.get("/api/wishlistdetail", {"product_id": products[-1].pk})
+        self.assertBudget("GET /api/wishlistdetail", prepare)
+
+    def test_wishlist_membership(self):
+        def prepare(n):
+            products = self.wishlist(self.login(self.make_user()), n)
+            ids = ",".join(str(product.pk) for product in products)
+            return lambda: self.client.get("/api/wishlist_membership", {"product_ids": ids})
+        self.assertBudget("GET /api/wishlist_membership", prepare)
+
+    def test_product_list(self):
+        def prepare(n):
+            self.make_products(n)
+            return lambda: self.client.get("/api/product_list")
+        self.assertBudget("GET /api/product_list", prepare)
+
+    def test_get_product_list(self):
+        def prepare(n):
+            ids = [product.pk for product in self.make_products(n)]
+            return lambda: self.client.post("/api/get_product_list", {"ids": ids}, content_type="application/json")
+        self.assertBudget("POST /api/get_product_list", prepare)
+
+    def test_product_detail(self):
+        def prepare(n):
+            product = self.make_products(1)[0]
+            ProductImage.objects.bulk_create(
+                ProductImage(product=product, image=f"v1/gallery/{product.pk}_{i}.jpg") for i in range(n)
+            )
+            return lambda: self.client.get(f"/api/products/{product.slug}")
+        self.assertBudget("GET /api/products/<slug>", prepare)
+
+    def test_also_bought(self):
+        def prepare(n):
+            product, *others = self.make_products(n + 1)
+            RelatedProduct.objects.bulk_create(
+                RelatedProduct(product=product, related=other, score=1 / (i + 1)) for i, other in enumerate(others)
+            )
+            return lambda: self.client.get(f"/api/products/{product.slug}/also_bought")
+        self.assertBudget("GET /api/products/<slug>/also_bought", prepare)
+
+    def test_similar(self):
+        def prepare(n):
+            product, *others = self.make_products(n + 1)
+            SimilarProduct.objects.bulk_create(
+                SimilarProduct(product=product, similar=other, score=1 / (i + 1)) for i, other in enumerate(others)
+            )
+            return lambda: self.client.get(f"/api/products/{product.slug}/similar")
+        self.assertBudget("GET /api/products/<slug>/similar", prepare)
+
+    def test_catalog(self):
+        def prepare(n):
+            self.make_products(n)
+            catalog_index.invalidate()
+            return lambda: self.client.get("/api/catalog", {"category": self.categories[0].pk, "in_stock": "true"})
+        self.assertBudget("GET /api/catalog", prepare)
+
+    def test_popular(self):
+        def prepare(n):
+            ProductPopularity.objects.bulk_create(
+                ProductPopularity(product=product, score=i) for i, product in enumerate(self.make_products(n))
+            )
+            return lambda: self.client.get("/api/popular", {"limit": 50})
+        self.assertBudget("GET /api/popular", prepare)
+
+    def test_category_list(self):
+        def prepare(n):
+            tag = uuid.uuid4().hex[:8]
+            Category.objects.bulk_create(Category(name=f"Category {i}", slug=f"{tag}-{i}") for i in range(n))
+            return lambda: self.client.get("/api/category_list")
+        self.assertBudget("GET /api/category_list", prepare)
+
+    def test_add_to_cart(self):
+        def prepare(n):
+            self.make_cart(n)
+            product = self.make_products(1)[0]
+            return lambda: self.client.post("/api/add_to_cart", {"product_id": product.pk}, content_type="application/json")
+        self.assertBudget("POST /api/add_to_cart", prepare)
+
+    def test_update_cart_item(self):
+        def prepare(n):
+            cart = self.make_cart(n)
+            item = cart.cartitems.first()
+            return lambda: self.client.put(
+                "/api/update_cartitem", {"product_id": item.product_id, "quantity": 3}, content_type="application/json",
+            )
+        self.assertBudget("PUT /api/update_cartitem", prepare)
+
+    def test_delete_cart_item(self):
+        def prepare(n):
+            cart = self.make_cart(n)
+            item = cart.cartitems.first()
+            return lambda: self.client.delete(
+                "/api/update_cartitem", {"product_id": item.product_id}, content_type="application/json",
+            )
+        self.assertBudget("DELETE /api/update_cartitem", prepare)
+
+    def test_add_to_wishlist(self):
+        def prepare(n):
+            user = self.login(self.make_user())
+            wished = self.wishlist(user, n)
+            ids = [product.pk for product in wished[:n // 2] + self.make_products(n - n // 2)]
+            return lambda: self.client.post("/api/add_to_wishlist", {"product_id": ids}, content_type="application/json")
+        self.assertBudget("POST /api/add_to_wishlist", prepare)
+
+    def test_addresses(self):
+        def prepare(n):
+            self.addresses(self.login(self.make_user()), n)
+            return lambda: self.client.get("/api/address")
+        self.assertBudget("GET /api/address", prepare)
+
+    def test_create_address(self):
+        def prepare(n):
+            self.addresses(self.login(self.make_user()), n)
+            return lambda: self.client.post("/api/address", {
+                "first_name": "Ada", "last_name": "Lovelace", "phone_number": "0800", "delivery_address": "1 Marina",
+                "region": "Lagos", "city": "Lagos",
+            }, content_type="application/json")
+        self.assertBudget("POST /api/address", prepare)
+
+    def test_update_address(self):
+        def prepare(n):
+            address = self.addresses(self.login(self.make_user()), n)[-1]
+            return lambda: self.client.put("/api/address", {
+                "address_id": address.pk, "first_name": "Ada", "last_name": "Byron", "phone_number": "0801",
+                "delivery_address": "2 Marina",
+                "region": "Lagos", "city": "Lagos",
+            }, content_type="application/json")
+        self.assertBudget("PUT /api/address", prepare)
+
+    def test_delete_address(self):
+        def prepare(n):
+            address = self.addresses(self.login(self.make_user()), n)[-1]
+            return lambda: self.client.delete("/api/address", {"address_id": address.pk}, content_type="application/json")
+        self.assertBudget("DELETE /api/address", prepare)
+
+    def test_search(self):
+        def prepare(n):
+            name = f"Walnut {uuid.uuid4().hex[:6]}"
+            self.make_products(n, name=name)
+            return lambda: self.client.get("/api/search", {"query": name})
+        self.assertBudget("GET /api/search", prepare)
+
+    def test_checkout(self):
+        def prepare(n):
+            self.login(self.make_user())
+            self.make_cart(n)
+            return lambda: self.client.post(
+                "/api/create_paystack_checkout_session", {"shipping_method": "standard"}, content_type="application/json",
+            )
+        with benchmark.offline():
+            self.assertBudget("POST /api/create_paystack_checkout_session", prepare)
+
+    def test_paystack_webhook(self):
+        def prepare(n):
+            cart = self.make_cart(n)
+            body = json.dumps({"event": "charge.success", "data": {
+                "id": uuid.uuid4().hex, "amount": 150000 * n, "currency": "NGN",
+                "customer": {"email": "buyer@example.com"}, "metadata": {"cart_code": str(cart.cart_code)},
+            }})
+            signature = hmac.new(settings.PAYSTACK_SECRET_KEY.encode(), body.encode(), hashlib.sha512).hexdigest()
+            return lambda: self.client.post(
+                "/api/webhook/paystack/", body, content_type="application/json", HTTP_X_PAYSTACK_SIGNATURE=signature,
+            )
+        # a furniture order is a handful of lines; 50 is already a big one
+        self.assertBudget("POST /api/webhook/paystack/", prepare, constant=False, sizes=(5, 50))
+
+    def test_order_items(self):
+        def prepare(n):
+            user = self.login(self.make_user())
+            order = Order.objects.create(
+                paystack_checkout_id=uuid.uuid4().hex, amount="1.00", currency="NGN",
+                customer_email=user.email, status="Paid",
+            )
+            OrderItem.objects.bulk_create(OrderItem(order=order, product=product) for product in self.make_products(n))
+            return lambda: self.client.get("/api/orderitem")
+        self.assertBudget("GET /api/orderitem", prepare)
+
+    def sales_rollups(self, n):
+        today = timezone.localdate()
+        products = self.make_products(n)
+        for model in (DailySales, DailyProductSales, DailyCategorySales):
+            model.objects.all().delete()
+        DailySales.objects.bulk_create(
+            DailySales(date=today - timedelta(days=i), orders=1, units=2, revenue="3000.00") for i in range(n)
+        )
+        DailyProductSales.objects.bulk_create(
+            DailyProductSales(date=today, product=product, orders=1, units=2, revenue="3000.00") for product in products
+        )
+        DailyCategorySales.objects.bulk_create(
+            DailyCategorySales(date=today - timedelta(days=i), category=category, orders=1, units=2, revenue="3000.00")
+            for i in range(n) for category in self.categories
+        )
+        self.login(self.admin)
+
+    def test_sales_analytics(self):
+        def prepare(n):
+            self.sales_rollups(n)
+            start = (timezone.localdate() - timedelta(days=n)).isoformat()
+            return lambda: self.client.get("/api/analytics/sales", {"start": start})
+        self.assertBudget("GET /api/analytics/sales", prepare)
+
+    def test_product_sales_analytics(self):
+        def prepare(n):
+            self.sales_rollups(n)
+            return lambda: self.client.get("/api/analytics/products", {"limit": 100})
+        self.assertBudget("GET /api/analytics/products", prepare)
+
+    def test_category_sales_analytics(self):
+        def prepare(n):
+            self.sales_rollups(n)
+            return lambda: self.client.get("/api/analytics/categories")
+        self.assertBudget("GET /api/analytics/categories", prepare)
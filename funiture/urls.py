@@ -11,11 +11,18 @@ urlpatterns = [
     path("cart", views.CartView.as_view(), name="cart"),
     path("recent", views.RecentlyViewedApiView.as_view(), name="recent"),
     path("profile", views.Profileview.as_view(), name="profile"),
+    path("bootstrap", views.SessionBootstrapView.as_view(), name="bootstrap"),
     path("getwishlist", views.WishListView.as_view(), name="wishlist"),
     path("wishlistdetail", views.WishListDetailedView.as_view(), name="wishlistDetail"),
+    path("wishlist_membership", views.WishListMembershipView.as_view(), name="wishlist_membership"),
     path("product_list", views.ProductListAPIView.as_view(), name="product_list"),
-    path("get_product_list", views.GetProductListAPIView.as_view(), name="product_list"),
+    path("get_product_list", views.GetProductListAPIView.as_view(), name="get_product_list"),
     path("products/<slug:slug>", views.ProductDetailView.as_view(), name="product_detail"),
+    path("products/<slug:slug>/also_bought", views.AlsoBoughtView.as_view(), name="also_bought"),
+    path("products/<slug:slug>/similar", views.SimilarProductsView.as_view(), name="similar_products"),
+    
+    path("catalog", views.CatalogView.as_view(), name="catalog"),
+    path("popular", views.PopularProductsView.as_view(), name="popular"),
     
     path("category_list", views.CategoryListAPIView.as_view(), name="category_list"),
     
@@ -31,5 +38,9 @@ urlpatterns = [
     path("create_paystack_checkout_session", views.CreatePaystackCheckoutSession.as_view(), name="create_paystack_checkout_session"),
     path('webhook/paystack/', views.PaystackWebhookView.as_view(), name="paystack_webhook"),
     path("orderitem", views.OrderItemView.as_view(), name="orderitem"),
+
+    path("analytics/sales", views.SalesAnalyticsView.as_view(), name="analytics_sales"),
+    path("analytics/products", views.ProductSalesAnalyticsView.as_view(), name="analytics_products"),
+    path("analytics/categories", views.CategorySalesAnalyticsView.as_view(), name="analytics_categories"),
     
 ]
\ No newline at end of file
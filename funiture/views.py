@@ -1,11 +1,16 @@
-from .models import Order, OrderItem, Product, Category, Cart, CartItem, WishList, Address, RecentlyViewed
+from .models import (Order, OrderItem, Product, Category, Cart, CartItem, WishList, Address, RecentlyViewed,
+                     DailySales, DailyProductSales, DailyCategorySales)
 from .serializers import (ProductListSerializer, InputEmailSerializer, CategoryListSerializer, ProductDetailSerializer, 
                            CartItemSerializer, CartSerializer, RecentlyViewedSerializer,
-                          WishListSerializer, UserSerializer, AddressSerializer, OrderItemSerializer
+                          WishListSerializer, UserSerializer, AddressSerializer, OrderItemSerializer,
+                          compact_payload, parse_sparse_fields, sparse_queryset
 )
 import uuid
 from .paystack import checkout
-from decimal import Decimal
+from . import recently_viewed, popularity, recommendations, sales
+from . import fast_serializers
+from .facets import catalog_index, FACETS
+from decimal import Decimal, InvalidOperation
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
 from django.http import HttpResponse
@@ -22,12 +27,35 @@ from rest_framework.response import Response
 from django.shortcuts import get_object_or_404
 from django.contrib.auth import get_user_model
 from django.utils import timezone
-from django.db.models import Q
+from django.utils.dateparse import parse_date
+from datetime import timedelta
+from django.db.models import Q, F, Sum, DecimalField, Exists, OuterRef
+from django.db.models.functions import TruncMonth
 # Create your views here.
 
 User = get_user_model()
 
 
+def wants_compact(request):
+    """?compact=1 opts list endpoints into the normalized side-table shape"""
+    return request.query_params.get("compact", "").lower() in ("1", "true")
+
+
+class SparseFieldsViewMixin:
+    """?fields=id,name,price narrows both the serializer and the SQL projection"""
+
+    @property
+    def sparse_fields(self):
+        return parse_sparse_fields(self.request, self.get_serializer_class())
+
+    def get_queryset(self):
+        return sparse_queryset(super().get_queryset(), self.get_serializer_class(), self.sparse_fields)
+
+    def get_serializer(self, *args, **kwargs):
+        kwargs.setdefault("fields", self.sparse_fields)
+        return super().get_serializer(*args, **kwargs)
+
+
 class InputEmailCreateView(APIView):
     def post(self, request):
         serializer = InputEmailSerializer(data=request.data)
@@ -45,7 +73,17 @@ class RecentlyViewedApiView(APIView):
     permission_classes = [permissions.IsAuthenticated]
     def get(self, request):
         user = request.user
-        recent_items = RecentlyViewed.objects.filter(user=user).order_by('-viewed_at')[:10]
+        product_ids = recently_viewed.get_recent_ids(user.id)
+        products = Product.objects.prefetch_related("categories").in_bulk(product_ids)
+
+        # Views are flushed to the table in batches, so an entry may not have a
+        # row yet; the product id stands in for the row id (unique per user)
+        recent_items = [
+            RecentlyViewed(id=pid, user=user, product=products[pid])
+            for pid in product_ids if pid in products
+        ]
+        if wants_compact(request):
+            return Response(compact_payload(recent_items, RecentlyViewedSerializer), status=200)
         serializer = RecentlyViewedSerializer(recent_items, many=True)
         return Response(serializer.data, status=200)
     
@@ -53,42 +91,18 @@ class RecentlyViewedApiView(APIView):
         product_id = request.data.get("product_id")
         
         # 1. Get user
-        try:
-            user = request.user
-        except User.DoesNotExist:
-            return Response({"error": "User not found"}, status=404)
+        user = request.user
 
         # 2. Get product
         try:
-            product = Product.objects.get(id=product_id)
-        except Product.DoesNotExist:
+            product_id = int(product_id)
+        except (TypeError, ValueError):
+            return Response({"error": "Product not found"}, status=404)
+        if not Product.objects.filter(id=product_id).exists():
             return Response({"error": "Product not found"}, status=404)
 
-        try:
-            with transaction.atomic():
-
-                # 3. Create or update entry
-                RecentlyViewed.objects.update_or_create(
-                    user=user,
-                    product=product,
-                    defaults={"viewed_at": timezone.now()}
-                )
-
-                # 4. Enforce max 10 items
-                recent_items = (
-                    RecentlyViewed.objects
-                    .filter(user=user)
-                    .order_by('-viewed_at')
-                )
-
-                # get items AFTER the first 10
-                items_to_delete = recent_items[10:].values_list('id', flat=True)
-
-                if items_to_delete:
-                    RecentlyViewed.objects.filter(id__in=items_to_delete).delete()
-
-        except Exception as e:
-            raise e
+        # 3. Record the view; the tracker caps the list and writes it in batches
+        recently_viewed.record_view(user.id, product_id)
 
         return Response({"message": "Product added to recently viewed"}, status=201)
 
@@ -101,20 +115,73 @@ class Profileview(APIView):
         return Response(serializer.data)
 
 
-class ProductListAPIView(generics.ListAPIView):
+class SessionBootstrapView(APIView):
+    """
+    Everything the frontend needs after login in one response, instead of
+    separate calls to me, profile, getwishlist, recent and cart.
+    Runs a fixed number of queries whatever the size of the user's data.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        user = request.user
+
+        wishlist_ids = list(
+            WishList.objects.filter(user=user).values_list("product_id", flat=True)
+        )
+
+        recent_ids = recently_viewed.get_recent_ids(user.id)
+        products = Product.objects.prefetch_related("categories").in_bulk(recent_ids)
+        recent_products = [products[pid] for pid in recent_ids if pid in products]
+
+        return Response({
+            "user": UserSerializer(user).data,
+            "wishlist": wishlist_ids,
+            "recently_viewed": ProductListSerializer(recent_products, many=True).data,
+            "cart": self.get_cart_summary(request.COOKIES.get("cart_code")),
+            "address_count": Address.objects.filter(user=user).count(),
+        }, status=status.HTTP_200_OK)
+
+    def get_cart_summary(self, cart_code):
+        try:
+            cart_code = str(uuid.UUID(cart_code))
+        except (TypeError, ValueError):
+            return {"cart_code": None, "item_count": 0, "cart_total": 0}
+
+        summary = CartItem.objects.filter(cart__cart_code=cart_code).aggregate(
+            item_count=Sum("quantity"),
+            cart_total=Sum(
+                F("quantity") * F("product__price"),
+                output_field=DecimalField(max_digits=12, decimal_places=2),
+            ),
+        )
+        return {
+            "cart_code": cart_code,
+            "item_count": summary["item_count"] or 0,
+            "cart_total": summary["cart_total"] or 0,
+        }
+
+
+class ProductListAPIView(SparseFieldsViewMixin, generics.ListAPIView):
     authentication_classes = []
     permission_classes = [permissions.AllowAny]
     queryset = Product.objects.all()
     serializer_class = ProductListSerializer
+
+    def list(self, request, *args, **kwargs):
+        if self.sparse_fields:
+            return super().list(request, *args, **kwargs)
+        # full shape: built straight from values() rows, same output as ProductListSerializer
+        return Response(fast_serializers.product_list_serializer.serialize(self.queryset.all()))
     
 
-class ProductList(generics.ListAPIView):
+class ProductList(SparseFieldsViewMixin, generics.ListAPIView):
     authentication_classes = []
     permission_classes = [permissions.AllowAny]
     serializer_class = ProductListSerializer
     queryset = Product.objects.all()
 
-class GetProductListAPIView(generics.ListAPIView):
+class GetProductListAPIView(SparseFieldsViewMixin, generics.ListAPIView):
     authentication_classes = []
     permission_classes = [permissions.AllowAny]
     queryset = Product.objects.all()
@@ -128,12 +195,98 @@ class GetProductListAPIView(generics.ListAPIView):
             except Exception:
                 return Response({"detail": "ids must be a list of integers"}, status=400)
 
-            products = Product.objects.filter(id__in=ids)
-            serializer = ProductListSerializer(products, many=True)
+            products = self.get_queryset().filter(id__in=ids)
+            serializer = self.get_serializer(products, many=True)
             return Response(serializer.data)
         
         
 
+class CatalogView(APIView):
+    """
+    Faceted product filtering: ?category=1,2&price=0-50000&featured=true&fabric=Linen&in_stock=true
+    plus optional price_min/price_max. Values within a facet are OR-ed, facets are AND-ed.
+    Matching and facet counts come from the in-memory bitmap index, not GROUP BY queries.
+    Results are paged by id with ?page= and ?page_size=; only that page is fetched.
+    """
+    authentication_classes = []
+    permission_classes = [permissions.AllowAny]
+
+    def get(self, request):
+        selected = {
+            facet: [value for value in request.query_params.get(facet).split(",") if value]
+            for facet in FACETS if request.query_params.get(facet)
+        }
+        try:
+            price_min = request.query_params.get("price_min")
+            price_max = request.query_params.get("price_max")
+            price_min = Decimal(price_min) if price_min else None
+            price_max = Decimal(price_max) if price_max else None
+        except InvalidOperation:
+            return Response({"error": "price_min and price_max must be numbers"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            page = max(int(request.query_params.get("page", 1)), 1)
+            page_size = min(max(int(request.query_params.get("page_size", 24)), 1), 100)
+        except ValueError:
+            return Response({"error": "page and page_size must be numbers"}, status=status.HTTP_400_BAD_REQUEST)
+
+        ids, counts = catalog_index.search(selected, price_min, price_max)
+
+        # ids come back sorted, so the page is a slice of them
+        page_ids = ids[(page - 1) * page_size:page * page_size]
+        products = Product.objects.filter(id__in=page_ids).order_by("id")
+
+        fields = parse_sparse_fields(request, ProductListSerializer)
+        if fields:
+            results = ProductListSerializer(sparse_queryset(products, ProductListSerializer, fields), many=True, fields=fields).data
+        else:
+            results = fast_serializers.product_list_serializer.serialize(products)
+
+        return Response({"count": len(ids), "page": page, "page_size": page_size, "results": results, "facets": counts})
+
+
+class PopularProductsView(APIView):
+    """Top products by time-decayed demand (orders, wishlist adds, views)"""
+    authentication_classes = []
+    permission_classes = [permissions.AllowAny]
+
+    def get(self, request):
+        try:
+            limit = min(int(request.query_params.get("limit", 10)), 50)
+        except ValueError:
+            return Response({"error": "limit must be a number"}, status=status.HTTP_400_BAD_REQUEST)
+
+        products = popularity.top_products(limit)
+        return Response(fast_serializers.product_list_serializer.serialize(products))
+
+
+class AlsoBoughtView(APIView):
+    """"Customers also bought" for one product, precomputed by recommendations.py"""
+    authentication_classes = []
+    permission_classes = [permissions.AllowAny]
+
+    def get(self, request, slug):
+        products = (
+            Product.objects
+            .filter(recommended_for__product__slug=slug)
+            .order_by("-recommended_for__score")
+        )
+        return Response(fast_serializers.product_list_serializer.serialize(products))
+
+
+class SimilarProductsView(APIView):
+    """Products with similar names, descriptions and categories, precomputed by similarity.py"""
+    authentication_classes = []
+    permission_classes = [permissions.AllowAny]
+
+    def get(self, request, slug):
+        products = (
+            Product.objects
+            .filter(similar_to__product__slug=slug)
+            .order_by("-similar_to__score")
+        )
+        return Response(fast_serializers.product_list_serializer.serialize(products))
+
+
 class CategoryListAPIView(generics.ListAPIView):
     authentication_classes = []
     permission_classes = [permissions.AllowAny]
@@ -141,7 +294,7 @@ class CategoryListAPIView(generics.ListAPIView):
     serializer_class = CategoryListSerializer
     
     
-class ProductDetailView(generics.RetrieveAPIView):
+class ProductDetailView(SparseFieldsViewMixin, generics.RetrieveAPIView):
     authentication_classes = []
     permission_classes = [permissions.AllowAny]
     queryset = Product.objects.all()
@@ -164,9 +317,9 @@ class CartView(APIView):
             cart_code=cart_code
         )
 
-        serializer = CartSerializer(cart)
+        data = fast_serializers.cart_serializer.serialize(Cart.objects.filter(pk=cart.pk))[0]
 
-        response = Response(serializer.data, status=status.HTTP_200_OK)
+        response = Response(data, status=status.HTTP_200_OK)
 
         # Save cart_code in cookie (important)
         response.set_cookie(
@@ -202,8 +355,8 @@ class AddToCart(APIView):
         
         
         
-        serializer = CartSerializer(cart)
-        response =  Response(serializer.data)
+        data = fast_serializers.cart_serializer.serialize(Cart.objects.filter(pk=cart.pk))[0]
+        response =  Response(data)
     
         response.set_cookie(
             key="cart_code",
@@ -292,7 +445,14 @@ class WishListView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request):
-        wishlist = WishList.objects.filter(user=request.user)
+        wishlist = (
+            WishList.objects
+            .filter(user=request.user)
+            .select_related("user", "product")
+            .prefetch_related("product__categories")
+        )
+        if wants_compact(request):
+            return Response(compact_payload(wishlist, WishListSerializer), status=status.HTTP_200_OK)
         serializer = WishListSerializer(wishlist, many=True)
         return Response(serializer.data, status=status.HTTP_200_OK)
 
@@ -307,16 +467,39 @@ class WishListDetailedView(APIView):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        product = get_object_or_404(Product, id=product_id)
         wishlist = get_object_or_404(
-            WishList,
+            WishList.objects.select_related("user", "product"),
             user=request.user,
-            product=product
+            product_id=product_id
         )
 
         serializer = WishListSerializer(wishlist)
         return Response(serializer.data, status=status.HTTP_200_OK)
 
+
+class WishListMembershipView(APIView):
+    """Which of the given products are in the user's wishlist, in one query"""
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        product_ids = request.query_params.get("product_ids", "")
+
+        try:
+            product_ids = [int(pid) for pid in product_ids.split(",") if pid.strip()]
+        except ValueError:
+            return Response(
+                {"error": "product_ids must be a comma separated list of numbers"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        wishlisted = WishList.objects.filter(
+            user=request.user,
+            product_id__in=product_ids
+        ).values_list("product_id", flat=True)
+
+        return Response({"wishlisted": list(wishlisted)}, status=status.HTTP_200_OK)
+
+
 class AddToWishListView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
@@ -338,23 +521,38 @@ class AddToWishListView(APIView):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        added = []
-        removed = []
+        try:
+            # dedupe but keep the caller's order for the response
+            product_ids = list(dict.fromkeys(int(pid) for pid in product_ids))
+        except (TypeError, ValueError):
+            return Response(
+                {"error": "product_id must be a number or list of numbers"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
 
-        for pid in product_ids:
-            try:
-                product = Product.objects.get(id=pid)
-            except Product.DoesNotExist:
-                continue  # skip invalid IDs
+        # One read tells us which ids exist and which are already wishlisted;
+        # invalid ids simply don't come back
+        in_wishlist = dict(
+            Product.objects
+            .filter(id__in=product_ids)
+            .annotate(in_wishlist=Exists(
+                WishList.objects.filter(user=user, product=OuterRef("pk"))
+            ))
+            .values_list("id", "in_wishlist")
+        )
 
-            wishlist_entry = WishList.objects.filter(user=user, product=product)
+        added = [pid for pid in product_ids if pid in in_wishlist and not in_wishlist[pid]]
+        removed = [pid for pid in product_ids if in_wishlist.get(pid)]
 
-            if wishlist_entry.exists():
-                wishlist_entry.delete()
-                removed.append(pid)
-            else:
-                new_wishlist = WishList.objects.create(user=user, product=product)
-                added.append(pid)
+        with transaction.atomic():
+            if removed:
+                WishList.objects.filter(user=user, product_id__in=removed).delete()
+            if added:
+                WishList.objects.bulk_create(
+                    [WishList(user=user, product_id=pid) for pid in added],
+                    ignore_conflicts=True
+                )
+                popularity.record("wishlist", {pid: 1 for pid in added})
 
         return Response(
             {"added": added, "removed": removed},
@@ -369,18 +567,22 @@ class ProductSearchView(APIView):
         if not query:
             return Response("No query provided", status=400)
         
-        product = Product.objects.filter(Q(name__icontains=query ) | 
+        fields = parse_sparse_fields(request, ProductListSerializer)
+        product = sparse_queryset(Product.objects.all(), ProductListSerializer, fields)
+        product = product.filter(Q(name__icontains=query ) | 
                                         Q(description__icontains=query) |
                                         Q(categories__name__icontains=query))
         
-        serializer = ProductListSerializer(product, many=True)
+        serializer = ProductListSerializer(product, many=True, fields=fields)
         return Response(serializer.data)
 
 class AddressView(APIView):
     permission_classes = [permissions.IsAuthenticated]
     def get(self, request):
         user = request.user
-        addrss = Address.objects.filter(user= user)
+        addrss = Address.objects.filter(user= user).select_related("user")
+        if wants_compact(request):
+            return Response(compact_payload(addrss, AddressSerializer))
         serializer = AddressSerializer(addrss, many=True)
         return Response(serializer.data)
     
@@ -563,8 +765,10 @@ class PaystackWebhookView(APIView):
         return HttpResponse(status=200)
 
 
+@transaction.atomic
 def fulfill_checkout(session, cart_code):
-    
+    # one transaction, so the order and the sales rollups never disagree
+
     if Order.objects.filter(paystack_checkout_id=session["id"]).exists():
         return  # already processed
 
@@ -581,12 +785,17 @@ def fulfill_checkout(session, cart_code):
     
 
     cart = Cart.objects.get(cart_code=cart_code)
-    cartitems = cart.cartitems.all()
+    cartitems = cart.cartitems.select_related("product")
 
-    for item in cartitems:
-        orderitem = OrderItem.objects.create(order=order, product=item.product, 
-                                             quantity=item.quantity)
+    OrderItem.objects.bulk_create([
+        OrderItem(order=order, product=item.product, quantity=item.quantity) for item in cartitems
+    ])
+
+    sales.record_order(order, [(item.product_id, item.quantity, item.product.price) for item in cartitems])
     
+    popularity.record("order", {item.product_id: item.quantity for item in cartitems})
+    recommendations.record_order([item.product_id for item in cartitems])
+
     cart.cartitems.all().delete()
 
 
@@ -596,6 +805,111 @@ class OrderItemView(APIView):
         user = request.user
         
         email =user.email
-        order_items = OrderItem.objects.filter(order__customer_email=email).select_related('order')
-        serializer = OrderItemSerializer(order_items, many=True)
-        return Response(serializer.data)
\ No newline at end of file
+        order_items = (
+            OrderItem.objects
+            .filter(order__customer_email=email)
+            .select_related('order', 'product')
+            .prefetch_related('product__categories')
+        )
+        if wants_compact(request):
+            return Response(compact_payload(order_items, OrderItemSerializer))
+        return Response(fast_serializers.order_item_serializer.serialize(order_items))
+
+
+def sales_date_range(request):
+    """(start, end) from ?start=&end= (YYYY-MM-DD, inclusive); the last 30 days by default"""
+    end = parse_date(request.query_params.get("end", "")) if request.query_params.get("end") else timezone.localdate()
+    start = parse_date(request.query_params.get("start", "")) if request.query_params.get("start") else None
+    if end is None or (request.query_params.get("start") and start is None):
+        raise ValueError("Dates must look like YYYY-MM-DD")
+    start = start or end - timedelta(days=29)
+    if start > end:
+        raise ValueError("start must not be after end")
+    return start, end
+
+
+def money(value):
+    # SQLite hands back sums without their trailing zeros
+    return f"{value or Decimal('0'):.2f}"
+
+
+def sales_totals(queryset):
+    totals = queryset.aggregate(orders=Sum("orders"), units=Sum("units"), revenue=Sum("revenue"))
+    return {
+        "orders": totals["orders"] or 0,
+        "units": totals["units"] or 0,
+        "revenue": money(totals["revenue"]),
+    }
+
+
+class SalesAnalyticsView(APIView):
+    """Revenue over a date range, by day or month, read from the daily rollups"""
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        try:
+            start, end = sales_date_range(request)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        interval = request.query_params.get("interval", "day")
+        if interval not in ("day", "month"):
+            return Response({"error": "interval must be day or month"}, status=status.HTTP_400_BAD_REQUEST)
+
+        days = DailySales.objects.filter(date__range=(start, end))
+        series = (
+            days.annotate(period=TruncMonth("date") if interval == "month" else F("date"))
+            .values("period")
+            .annotate(orders=Sum("orders"), units=Sum("units"), revenue=Sum("revenue"))
+            .order_by("period")
+        )
+        return Response({
+            "start": start,
+            "end": end,
+            "totals": sales_totals(days),
+            "series": [
+                {"period": row["period"], "orders": row["orders"], "units": row["units"], "revenue": money(row["revenue"])}
+                for row in series
+            ],
+        })
+
+
+class ProductSalesAnalyticsView(APIView):
+    """Best selling products by revenue over a date range"""
+    permission_classes = [permissions.IsAdminUser]
+    group_model = DailyProductSales
+    group_field = "product"
+
+    def get(self, request):
+        try:
+            start, end = sales_date_range(request)
+            limit = min(int(request.query_params.get("limit", 20)), 100)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        rows = (
+            self.group_model.objects
+            .filter(date__range=(start, end))
+            .values(f"{self.group_field}_id", f"{self.group_field}__name")
+            .annotate(orders=Sum("orders"), units=Sum("units"), revenue=Sum("revenue"))
+            .order_by("-revenue")[:limit]
+        )
+        return Response({
+            "start": start,
+            "end": end,
+            "results": [
+                {
+                    "id": row[f"{self.group_field}_id"],
+                    "name": row[f"{self.group_field}__name"],
+                    "orders": row["orders"],
+                    "units": row["units"],
+                    "revenue": money(row["revenue"]),
+                }
+                for row in rows
+            ],
+        })
+
+
+class CategorySalesAnalyticsView(ProductSalesAnalyticsView):
+    """Revenue per category over a date range; products in several categories count in each"""
+    group_model = DailyCategorySales
+    group_field = "category"
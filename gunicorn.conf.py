@@ -0,0 +1,33 @@
+# gunicorn reads this from the working directory: `gunicorn core.wsgi`
+import glob
+import os
+
+# module-level names are read as gunicorn settings, and "config" is one
+import decouple
+
+
+def on_starting(server):
+    # per-worker metric files from the last run would otherwise be summed
+    # into this one's counters (core/metrics.py)
+    directory = decouple.config("METRICS_DIR", default="")
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+        for path in glob.glob(os.path.join(directory, "metrics_*.db")):
+            os.remove(path)
+
+
+def post_worker_init(worker):
+    from core import memory
+    from funiture import recently_viewed
+    memory.start_sampler()
+    recently_viewed.start_flusher()
+
+
+def post_request(worker, req, environ, resp):
+    # same as max_requests: the worker exits once this request is done and
+    # the master forks a fresh one (core/memory.py)
+    from core import memory
+    if memory.over_ceiling():
+        worker.log.warning("Worker %s is over MEMORY_CEILING_MB (%d MB RSS), recycling it",
+                           worker.pid, memory.rss_bytes() // memory.MB)
+        worker.alive = False
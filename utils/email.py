@@ -1,7 +1,10 @@
+import contextvars
 import threading
 from decouple import config
 import resend
 
+from core import metrics, tracing
+
 
 resend.api_key = config("RESEND_API_KEY")
 
@@ -14,15 +17,22 @@ class EmailThread(threading.Thread):
         self.to_email = to_email
         self.subject = subject
         self.html = html
+        # the request's trace, if any, continues in the thread
+        self.context = contextvars.copy_context()
 
     def run(self):
-        try:
-            resend.Emails.send({
-                "from": "onboarding@resend.dev",  # or your verified domain
-                "to": self.to_email,
-                "subject": self.subject,
-                "html": self.html,
-            })
-        except Exception as e:
-            print("Resend email error:", e)
+        self.context.run(self.send)
+
+    def send(self):
+        with tracing.span("email.send", subject=self.subject):
+            try:
+                with metrics.external_call("resend"):
+                    resend.Emails.send({
+                        "from": "onboarding@resend.dev",  # or your verified domain
+                        "to": self.to_email,
+                        "subject": self.subject,
+                        "html": self.html,
+                    })
+            except Exception as e:
+                print("Resend email error:", e)
 
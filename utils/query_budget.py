@@ -0,0 +1,48 @@
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from core.middleware import fingerprint
+
+
+class QueryBudgetMixin:
+    """
+    assertQueryBudget() runs an endpoint against a small and a large fixture
+    and fails if the large one needs more queries (an N+1) or if either goes
+    over the endpoint's declared budget. The failure lists the SQL, repeated
+    statements first.
+    """
+
+    sizes = (5, 500)
+
+    def assertQueryBudget(self, budget, prepare, name=None, constant=True, sizes=None):
+        """
+        prepare(size) seeds `size` related rows and returns a callable that
+        makes the request; only that call is counted. constant=False is for
+        endpoints whose bulk writes go out in batches, so only the budget
+        holds; give those realistic sizes, or the budget has to be huge.
+        """
+        runs = []
+        for size in sizes or self.sizes:
+            call = prepare(size)
+            with CaptureQueriesContext(connection) as captured:
+                response = call()
+            self.assertLess(response.status_code, 400, f"{name or ''} {getattr(response, 'data', response)}")
+            runs.append((size, [query["sql"] for query in captured.captured_queries]))
+
+        (small, small_sql), (large, large_sql) = runs[0], runs[-1]
+        if (constant and len(large_sql) > len(small_sql)) or max(len(small_sql), len(large_sql)) > budget:
+            self.fail(
+                f"{name or 'endpoint'}: {len(small_sql)} queries with {small} rows, {len(large_sql)} with "
+                f"{large} (budget {budget})\n{self.describe_queries(large_sql)}"
+            )
+        return response
+
+    @staticmethod
+    def describe_queries(sqls):
+        groups = {}
+        for sql in sqls:
+            groups.setdefault(fingerprint(sql), []).append(sql)
+        return "\n".join(
+            f"  {len(group)} x {group[0][:300]}"
+            for group in sorted(groups.values(), key=lambda group: -len(group))
+        )